@@ -0,0 +1 @@
+"""Local benchmarks for the bot. Run them as modules, e.g. ``python -m benchmarks.db_load``."""
@@ -0,0 +1,111 @@
+"""Fire simulated updates at the dispatcher and report handler latency.
+
+The Supabase client is replaced by an in-memory stand-in that blocks its calling
+thread for ``--db-latency`` seconds per query, the way a real network round trip
+does. The run is repeated with queries executed inline on the event loop
+("before") and through the DatabaseManager worker pool ("after").
+
+    python -m benchmarks.db_load --updates 400 --db-latency 0.03
+"""
+import argparse
+import asyncio
+import logging
+import random
+import statistics
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+from aiogram import Bot
+from aiogram.types import Update
+
+import bot as app
+from benchmarks.fakes import FakeSession, FakeSupabase, callback_update, message_update
+from database import db
+
+# Several admins: updates from one chat run in order, so a single admin would queue behind itself
+ADMIN_IDS = list(range(1, 11))
+
+
+async def _inline_execute(query):
+    # Old behaviour: the blocking call runs straight on the event loop thread
+    return query.execute()
+
+
+def build_workload(count: int, admin_share: float, medicine_ids: List[str]) -> List[tuple]:
+    rng = random.Random(42)
+    workload = []
+    for update_id in range(1, count + 1):
+        user_id = 1000 + rng.randrange(300)
+        roll = rng.random()
+        if roll < admin_share:
+            data = rng.choice(['admin_orders', 'admin_stats', 'admin_products'])
+            workload.append(('admin', callback_update(update_id, rng.choice(ADMIN_IDS), data)))
+        elif roll < 0.5:
+            workload.append(('browse', message_update(update_id, user_id, "🌿 O'simlik dorilar haqida")))
+        else:
+            data = f'med_{rng.choice(medicine_ids)}'
+            workload.append(('browse', callback_update(update_id, user_id, data)))
+    return workload
+
+
+async def run(workload: List[tuple], interval: float) -> Dict[str, List[float]]:
+    latencies: Dict[str, List[float]] = defaultdict(list)
+
+    async def feed(kind: str, raw: dict):
+        started = time.perf_counter()
+        await app.dp.feed_update(app.bot, Update.model_validate(raw, context={'bot': app.bot}))
+        latencies[kind].append(time.perf_counter() - started)
+
+    tasks = []
+    for kind, raw in workload:
+        tasks.append(asyncio.create_task(feed(kind, raw)))
+        await asyncio.sleep(interval)
+    await asyncio.gather(*tasks)
+    return latencies
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+def report(label: str, latencies: Dict[str, List[float]]) -> None:
+    print(f'\n{label}')
+    for kind in ('browse', 'admin'):
+        values = latencies.get(kind, [])
+        if not values:
+            continue
+        print(f'  {kind:<7} n={len(values):<4} p50={percentile(values, 0.50) * 1000:8.1f} ms  '
+              f'p99={percentile(values, 0.99) * 1000:8.1f} ms  mean={statistics.mean(values) * 1000:8.1f} ms')
+
+
+async def main(args) -> None:
+    logging.disable(logging.WARNING)
+    fake_db = FakeSupabase(latency=args.db_latency).seed(medicines=args.medicines, orders=args.orders)
+    db.supabase = fake_db
+    app.bot = Bot(token='123456:BENCHMARK', session=FakeSession(latency=args.api_latency))
+    app.ADMIN_IDS[:] = ADMIN_IDS
+    app.catalog.snapshot = None  # keep fake medicines out of the real snapshot
+    await app.catalog.reload()
+
+    workload = build_workload(args.updates, args.admin_share, list(app.catalog.keys()))
+
+    pooled_execute = db._execute
+    db._execute = _inline_execute
+    report('before: blocking queries on the event loop', await run(workload, args.interval))
+    db._execute = pooled_execute
+    report('after: queries offloaded to the worker pool', await run(workload, args.interval))
+    db.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--updates', type=int, default=400)
+    parser.add_argument('--interval', type=float, default=0.002, help='seconds between submitted updates')
+    parser.add_argument('--admin-share', type=float, default=0.1, help='fraction of DB-bound admin updates')
+    parser.add_argument('--db-latency', type=float, default=0.03)
+    parser.add_argument('--api-latency', type=float, default=0.005)
+    parser.add_argument('--medicines', type=int, default=50)
+    parser.add_argument('--orders', type=int, default=2000)
+    asyncio.run(main(parser.parse_args()))
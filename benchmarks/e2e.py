@@ -0,0 +1,305 @@
+"""Run scripted user journeys through the real dispatcher and report throughput, latency and memory.
+
+Every Bot API call goes over HTTP, through aiogram's aiohttp session, to a local
+fake Bot API server; Supabase is the in-memory stand-in seeded with each of
+``--sizes`` (medicines x orders). ``--users`` virtual users each run
+``--journeys`` journeys one after another:
+
+    browse  catalog menu -> a page -> three products (med_) -> back
+    order   order_ -> months_ -> receipt photo -> location_tashkent -> location -> phone -> confirm_order
+    admin   admin_stats -> stats_week -> admin_orders -> next page (every tenth user is an admin)
+
+The workload is seeded, so runs are comparable. Confirmed orders go through the
+real journal, order writer and outbox; the time to drain them is reported too.
+``--json`` writes the results, and ``--baseline`` exits with status 1 when a
+step's p95 or the throughput is more than ``--max-regression`` worse than in an
+earlier results file, so CI can catch regressions.
+
+    python -m benchmarks.e2e --sizes 100x1000,1000x20000,10000x100000
+    python -m benchmarks.e2e --json bench.json --baseline main.json
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.types import Update
+
+import bot as app
+from benchmarks.db_load import percentile
+from benchmarks.fakes import (
+    FakeBotApiServer, FakeSupabase, callback_update, location_update, message_update, photo_update
+)
+from database import db
+from journal import OrderJournal
+from local_store import LocalDatabase
+from outbox import Outbox
+
+Step = Tuple[str, Dict]
+
+# Steps faster than this are never reported as regressions: at that scale the difference is noise
+NOISE_FLOOR = 0.002
+
+
+def rss_mb() -> float:
+    """Current resident set size; falls back to the peak where /proc is unavailable"""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def browse_journey(ids, user_id: int, rng: random.Random, medicine_ids: List[str]) -> List[Step]:
+    steps = [
+        ('menu', message_update(next(ids), user_id, "💊 Dorilar")),
+        ('page', callback_update(next(ids), user_id, 'medpage_0')),
+    ]
+    for med_id in rng.sample(medicine_ids, min(3, len(medicine_ids))):
+        steps.append(('med', callback_update(next(ids), user_id, f'med_{med_id}')))
+    steps.append(('back', callback_update(next(ids), user_id, 'back_to_medicines')))
+    return steps
+
+
+def order_journey(ids, user_id: int, rng: random.Random, medicine_ids: List[str]) -> List[Step]:
+    update_id = next(ids)
+    return [
+        ('order', callback_update(update_id, user_id, f'order_{rng.choice(medicine_ids)}')),
+        ('months', callback_update(next(ids), user_id, f'months_{rng.randint(1, 3)}')),
+        ('receipt_button', callback_update(next(ids), user_id, 'upload_receipt')),
+        ('receipt', photo_update(next(ids), user_id, f'receipt{update_id}')),
+        ('location_button', callback_update(next(ids), user_id, 'location_tashkent')),
+        ('location', location_update(next(ids), user_id, 41.3 + rng.random() / 10, 69.2 + rng.random() / 10)),
+        ('phone', message_update(next(ids), user_id, '+998901234567')),
+        ('confirm', callback_update(next(ids), user_id, 'confirm_order')),
+    ]
+
+
+def admin_journey(ids, user_id: int, rng: random.Random, medicine_ids: List[str]) -> List[Step]:
+    return [
+        ('stats', callback_update(next(ids), user_id, 'admin_stats')),
+        ('stats_period', callback_update(next(ids), user_id, 'stats_week')),
+        ('orders', callback_update(next(ids), user_id, 'admin_orders')),
+        ('orders_next', callback_update(next(ids), user_id, 'orders_page_next')),
+    ]
+
+
+def build_scripts(users: int, journeys: int, order_share: float, medicine_ids: List[str],
+                  seed: int) -> Dict[int, List[Tuple[str, List[Step]]]]:
+    """Journeys per virtual user, in the order they will be run"""
+    rng = random.Random(seed)
+    ids = itertools.count(1)
+    scripts = {}
+    for index in range(users):
+        user_id = 10000 + index
+        script = []
+        for _ in range(journeys):
+            if index % 10 == 0:
+                kind, build = 'admin', admin_journey
+            elif rng.random() < order_share:
+                kind, build = 'order', order_journey
+            else:
+                kind, build = 'browse', browse_journey
+            script.append((kind, build(ids, user_id, rng, medicine_ids)))
+        scripts[user_id] = script
+    return scripts
+
+
+async def prepare(medicines: int, orders: int, args, workdir: str) -> FakeSupabase:
+    """Fresh data and bot-side state for one data size"""
+    fake = FakeSupabase(latency=args.db_latency).seed(medicines=medicines, orders=orders)
+    db.supabase = fake
+    app.dp.fsm.storage = MemoryStorage()
+    app.catalog.snapshot = None  # keep fake medicines out of the real snapshot
+    app.order_journal = OrderJournal(path=os.path.join(workdir, f'orders-{medicines}x{orders}.journal'))
+    app.outbox = Outbox(LocalDatabase(os.path.join(workdir, f'outbox-{medicines}x{orders}.sqlite3')))
+    app.outbox.register('order_channel', app.deliver_order_notification)
+    app.outbox.on_failure = app.report_outbox_failure
+    # Receipts are queued for storage in the same temporary database; the pipeline itself is not run
+    app.image_pipeline.queue = Outbox(app.outbox.database, table='image_jobs')
+    await app.order_journal.start(app.order_writer.submit)
+    await app.outbox.start()
+    return fake
+
+
+async def drain(timeout: float = 60) -> float:
+    """Seconds until every confirmed order is saved and announced in the channel"""
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        if not len(app.order_journal) and not await app.outbox.pending():
+            break
+        await asyncio.sleep(0.01)
+    return time.perf_counter() - started
+
+
+async def run_size(medicines: int, orders: int, args, workdir: str, api: FakeBotApiServer) -> Dict:
+    memory_before = rss_mb()
+    fake = await prepare(medicines, orders, args, workdir)
+    memory_seeded = rss_mb()
+    await app.catalog.reload()
+    memory_loaded = rss_mb()
+
+    scripts = build_scripts(args.users, args.journeys, args.order_share, list(app.catalog.keys()), args.seed)
+    app.ADMIN_IDS[:] = [user_id for user_id in scripts if (user_id - 10000) % 10 == 0]
+    orders_before = len(fake.tables['orders'])
+    api.calls.clear()
+
+    step_latency: Dict[str, List[float]] = defaultdict(list)
+    journey_latency: Dict[str, List[float]] = defaultdict(list)
+
+    async def user(script: List[Tuple[str, List[Step]]]) -> None:
+        for kind, steps in script:
+            journey_started = time.perf_counter()
+            for name, raw in steps:
+                started = time.perf_counter()
+                await app.dp.feed_update(app.bot, Update.model_validate(raw, context={'bot': app.bot}))
+                step_latency[name].append(time.perf_counter() - started)
+                if args.think:
+                    await asyncio.sleep(args.think)
+            journey_latency[kind].append(time.perf_counter() - journey_started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user(script) for script in scripts.values()))
+    elapsed = time.perf_counter() - started
+    drain_time = await drain()
+    memory_after = rss_mb()
+
+    await app.outbox.stop()
+    await app.order_journal.close()
+    await app.outbox.database.close()
+
+    updates = sum(len(values) for values in step_latency.values())
+    journeys = sum(len(values) for values in journey_latency.values())
+
+    def summarize(values: List[float]) -> Dict[str, float]:
+        return {
+            'n': len(values),
+            'p50_ms': round(percentile(values, 0.50) * 1000, 2),
+            'p95_ms': round(percentile(values, 0.95) * 1000, 2),
+            'p99_ms': round(percentile(values, 0.99) * 1000, 2),
+        }
+
+    return {
+        'size': f'{medicines}x{orders}',
+        'updates': updates,
+        'elapsed_s': round(elapsed, 3),
+        'updates_per_s': round(updates / elapsed, 1),
+        'journeys_per_s': round(journeys / elapsed, 1),
+        'api_calls': sum(api.calls.values()),
+        'db_queries': sum(fake.calls.values()),
+        'orders_saved': len(fake.tables['orders']) - orders_before,
+        'drain_s': round(drain_time, 3),
+        'steps': {name: summarize(values) for name, values in step_latency.items()},
+        'journeys': {kind: summarize(values) for kind, values in journey_latency.items()},
+        'memory_mb': {
+            'fake_data': round(memory_seeded - memory_before, 1),
+            'catalog': round(memory_loaded - memory_seeded, 1),
+            'run_growth': round(memory_after - memory_loaded, 1),
+            'rss': round(memory_after, 1),
+        },
+    }
+
+
+def report(result: Dict) -> None:
+    memory = result['memory_mb']
+    print(f"\n{result['size']} (medicines x orders)")
+    print(f"  {result['updates']} updates in {result['elapsed_s']:.2f} s: {result['updates_per_s']:.0f} updates/s, "
+          f"{result['journeys_per_s']:.1f} journeys/s")
+    print(f"  {result['api_calls']} Bot API calls, {result['db_queries']} DB queries, "
+          f"{result['orders_saved']} orders saved, drained in {result['drain_s']:.2f} s")
+    print(f"  memory: fake data {memory['fake_data']:.1f} MiB, catalog {memory['catalog']:.1f} MiB, "
+          f"run +{memory['run_growth']:.1f} MiB, RSS {memory['rss']:.1f} MiB")
+    for title, rows in (('step', result['steps']), ('journey', result['journeys'])):
+        for name, row in sorted(rows.items()):
+            print(f"  {title} {name:<16} n={row['n']:<5} p50={row['p50_ms']:8.1f} ms  "
+                  f"p95={row['p95_ms']:8.1f} ms  p99={row['p99_ms']:8.1f} ms")
+
+
+def regressions(results: List[Dict], baseline: List[Dict], tolerance: float) -> List[str]:
+    """Human-readable list of everything that got worse than ``tolerance`` allows"""
+    found = []
+    previous = {run['size']: run for run in baseline}
+    for run in results:
+        before = previous.get(run['size'])
+        if before is None:
+            continue
+        if run['updates_per_s'] < before['updates_per_s'] * (1 - tolerance):
+            found.append(f"{run['size']}: throughput {before['updates_per_s']} -> {run['updates_per_s']} updates/s")
+        for name, row in run['steps'].items():
+            old = before['steps'].get(name)
+            if old is None or row['p95_ms'] / 1000 < NOISE_FLOOR:
+                continue
+            if row['p95_ms'] > old['p95_ms'] * (1 + tolerance):
+                found.append(f"{run['size']}: {name} p95 {old['p95_ms']} -> {row['p95_ms']} ms")
+    return found
+
+
+def parse_sizes(spec: str) -> List[Tuple[int, int]]:
+    sizes = []
+    for entry in spec.split(','):
+        medicines, _, orders = entry.strip().partition('x')
+        sizes.append((int(medicines), int(orders or 0)))
+    return sizes
+
+
+async def main(args) -> int:
+    logging.disable(logging.WARNING)
+    api = FakeBotApiServer(latency=args.api_latency)
+    await api.start()
+    app.bot = Bot(token='123456:BENCHMARK', session=AiohttpSession(api=TelegramAPIServer.from_base(api.url)))
+    if args.rate_limit:
+        app.bot.session.middleware(app.rate_limiter)
+
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for medicines, orders in parse_sizes(args.sizes):
+            result = await run_size(medicines, orders, args, workdir, api)
+            report(result)
+            results.append(result)
+
+    await app.bot.session.close()
+    await api.stop()
+    db.close()
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as output:
+            json.dump({'args': vars(args), 'runs': results}, output, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as previous:
+            found = regressions(results, json.load(previous)['runs'], args.max_regression)
+        for line in found:
+            print(f'REGRESSION {line}')
+        if found:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='100x1000,1000x20000', help='comma-separated MEDICINESxORDERS')
+    parser.add_argument('--users', type=int, default=50, help='concurrent virtual users')
+    parser.add_argument('--journeys', type=int, default=10, help='journeys per user')
+    parser.add_argument('--order-share', type=float, default=0.3, help='fraction of customer journeys that order')
+    parser.add_argument('--think', type=float, default=0.0, help='seconds a user waits between steps')
+    parser.add_argument('--db-latency', type=float, default=0.01)
+    parser.add_argument('--api-latency', type=float, default=0.005)
+    parser.add_argument('--rate-limit', action='store_true', help="apply the bot's outgoing rate limiter")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--json', help='write results to this file')
+    parser.add_argument('--baseline', help='results file from an earlier run to compare against')
+    parser.add_argument('--max-regression', type=float, default=0.25,
+                        help='allowed slowdown before --baseline fails, as a fraction')
+    sys.exit(asyncio.run(main(parser.parse_args())))
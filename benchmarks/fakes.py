@@ -0,0 +1,480 @@
+"""In-process and localhost stand-ins for Supabase and the Telegram Bot API used by the benchmarks"""
+import asyncio
+import datetime
+import itertools
+import json
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiohttp import web
+
+
+class FakeResponse:
+    def __init__(self, data: List[Dict], count: Optional[int] = None):
+        self.data = data
+        self.count = count
+
+
+_OPERATORS = {
+    'eq': lambda a, b: a == b,
+    'neq': lambda a, b: a != b,
+    'gt': lambda a, b: a > b,
+    'gte': lambda a, b: a >= b,
+    'lt': lambda a, b: a < b,
+    'lte': lambda a, b: a <= b,
+}
+
+
+def _coerce(value: Any, like: Any) -> Any:
+    if isinstance(like, bool):
+        return str(value).lower() == 'true'
+    if isinstance(like, (int, float)):
+        return type(like)(value)
+    return str(value)
+
+
+def _predicate(column: str, op: str, value: Any) -> Callable[[Dict], bool]:
+    def check(row: Dict) -> bool:
+        current = row.get(column)
+        if current is None:
+            return False
+        return _OPERATORS[op](current, _coerce(value, current))
+    return check
+
+
+def _split_top_level(expression: str) -> List[str]:
+    parts, depth, quoted, current = [], 0, False, ''
+    for char in expression:
+        if char == '"':
+            quoted = not quoted
+        elif char == '(' and not quoted:
+            depth += 1
+        elif char == ')' and not quoted:
+            depth -= 1
+        elif char == ',' and depth == 0 and not quoted:
+            parts.append(current)
+            current = ''
+            continue
+        current += char
+    parts.append(current)
+    return parts
+
+
+def _parse_logic(kind: str, expression: str) -> Callable[[Dict], bool]:
+    """Parse a PostgREST logic tree such as ``a.lt.1,and(b.eq.2,c.lt.3)``"""
+    checks = []
+    for part in _split_top_level(expression):
+        if part.startswith(('and(', 'or(')):
+            inner_kind, inner = part.split('(', 1)
+            checks.append(_parse_logic(inner_kind, inner[:-1]))
+        else:
+            column, op, value = part.split('.', 2)
+            checks.append(_predicate(column, op, value.strip('"')))
+    combine = any if kind == 'or' else all
+    return lambda row: combine(check(row) for check in checks)
+
+
+class FakeQuery:
+    """Just enough of the postgrest query builder for DatabaseManager"""
+
+    def __init__(self, backend: 'FakeSupabase', table: str):
+        self.backend = backend
+        self.table_name = table
+        self.action = 'select'
+        self.payload: Any = None
+        self.filters: List[Callable[[Dict], bool]] = []
+        self.ordering: List[tuple] = []
+        self.row_limit: Optional[int] = None
+        self.row_offset = 0
+
+    # Actions
+    def select(self, *columns, count=None):
+        self.action = 'select'
+        return self
+
+    def insert(self, data, **kwargs):
+        self.action, self.payload = 'insert', data
+        return self
+
+    def upsert(self, data, on_conflict='id', ignore_duplicates=False, **kwargs):
+        self.action, self.payload = 'upsert', data
+        self.conflict_column, self.ignore_duplicates = on_conflict or 'id', ignore_duplicates
+        return self
+
+    def update(self, data):
+        self.action, self.payload = 'update', data
+        return self
+
+    def delete(self):
+        self.action = 'delete'
+        return self
+
+    # Filters
+    def eq(self, column, value):
+        return self._filter(column, 'eq', value)
+
+    def neq(self, column, value):
+        return self._filter(column, 'neq', value)
+
+    def gt(self, column, value):
+        return self._filter(column, 'gt', value)
+
+    def gte(self, column, value):
+        return self._filter(column, 'gte', value)
+
+    def lt(self, column, value):
+        return self._filter(column, 'lt', value)
+
+    def lte(self, column, value):
+        return self._filter(column, 'lte', value)
+
+    def in_(self, column, values):
+        values = {str(value) for value in values}
+        self.filters.append(lambda row: str(row.get(column)) in values)
+        return self
+
+    def or_(self, expression):
+        self.filters.append(_parse_logic('or', expression))
+        return self
+
+    def _filter(self, column, op, value):
+        self.filters.append(_predicate(column, op, value))
+        return self
+
+    def order(self, column, desc=False):
+        self.ordering.append((column, desc))
+        return self
+
+    def limit(self, size):
+        self.row_limit = size
+        return self
+
+    def range(self, start, end):
+        self.row_offset, self.row_limit = start, end - start + 1
+        return self
+
+    def execute(self) -> FakeResponse:
+        # The real client blocks the calling thread for a network round trip
+        if self.backend.latency:
+            time.sleep(self.backend.latency)
+        self.backend.calls[f'{self.table_name}.{self.action}'] += 1
+        return getattr(self, f'_run_{self.action}')()
+
+    def _matching(self) -> List[Dict]:
+        return [row for row in self.backend.tables[self.table_name] if all(f(row) for f in self.filters)]
+
+    def _run_select(self) -> FakeResponse:
+        rows = self._matching()
+        for column, desc in reversed(self.ordering):
+            rows.sort(key=lambda row: (row.get(column) is None, row.get(column)), reverse=desc)
+        rows = rows[self.row_offset:]
+        if self.row_limit is not None:
+            rows = rows[:self.row_limit]
+        return FakeResponse([dict(row) for row in rows], count=len(rows))
+
+    def _run_insert(self) -> FakeResponse:
+        rows = self.payload if isinstance(self.payload, list) else [self.payload]
+        table = self.backend.tables[self.table_name]
+        now = self.backend.now()
+        inserted = []
+        for row in rows:
+            if any(existing['id'] == row['id'] for existing in table):
+                raise RuntimeError(f'duplicate key value violates unique constraint "{self.table_name}_pkey"')
+            record = {'created_at': now, 'updated_at': now, **row}
+            table.append(record)
+            inserted.append(dict(record))
+            self.backend.log_change(self.table_name, record, 'insert')
+        return FakeResponse(inserted)
+
+    def _run_upsert(self) -> FakeResponse:
+        rows = self.payload if isinstance(self.payload, list) else [self.payload]
+        table = self.backend.tables[self.table_name]
+        columns = self.conflict_column.split(',')
+        existing = {tuple(row.get(column) for column in columns): row for row in table}
+        now = self.backend.now()
+        written = []
+        for row in rows:
+            key = tuple(row.get(column) for column in columns)
+            current = existing.get(key)
+            if current is not None:
+                if not self.ignore_duplicates:
+                    current.update(row, updated_at=now)
+                    written.append(dict(current))
+                    self.backend.log_change(self.table_name, current, 'update', row)
+                continue
+            record = existing[key] = {'created_at': now, 'updated_at': now, **row}
+            table.append(record)
+            written.append(dict(record))
+            self.backend.log_change(self.table_name, record, 'insert')
+        return FakeResponse(written)
+
+    def _run_update(self) -> FakeResponse:
+        rows = self._matching()
+        for row in rows:
+            row.update(self.payload)
+            row['updated_at'] = self.backend.now()
+            self.backend.log_change(self.table_name, row, 'update', self.payload)
+        return FakeResponse([dict(row) for row in rows])
+
+    def _run_delete(self) -> FakeResponse:
+        rows = self._matching()
+        table = self.backend.tables[self.table_name]
+        self.backend.tables[self.table_name] = [row for row in table if row not in rows]
+        for row in rows:
+            self.backend.log_change(self.table_name, row, 'delete')
+        return FakeResponse(rows)
+
+
+class FakeRpc:
+    def __init__(self, backend: 'FakeSupabase', name: str, params: Dict):
+        self.backend, self.name, self.params = backend, name, params
+
+    def execute(self) -> FakeResponse:
+        if self.backend.latency:
+            time.sleep(self.backend.latency)
+        self.backend.calls[f'rpc.{self.name}'] += 1
+        return FakeResponse(getattr(self.backend, f'_rpc_{self.name}')(**self.params))
+
+
+def _price_amount(price: Any) -> int:
+    digits = ''.join(c for c in str(price or '').split(' ')[0] if c.isdigit())
+    return int(digits) if digits else 0
+
+
+class FakeSupabase:
+    """Synchronous in-memory stand-in for supabase.Client with a fixed per-query latency"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.tables: Dict[str, List[Dict]] = {'medicines': [], 'orders': [], 'images': [], 'change_log': []}
+        self.calls: Counter = Counter()
+        self._clock = itertools.count()
+
+    def now(self) -> str:
+        # Strictly increasing timestamps keep keyset ordering deterministic
+        base = datetime.datetime(2025, 1, 1)
+        return (base + datetime.timedelta(seconds=next(self._clock))).isoformat()
+
+    def log_change(self, table: str, row: Dict, op: str, changes: Optional[Dict] = None) -> None:
+        # Mirrors the change_log triggers in create_tables.sql
+        if table == 'medicines' or (table == 'orders' and (op != 'update' or 'status' in (changes or {}))):
+            self.tables['change_log'].append({
+                'seq': len(self.tables['change_log']) + 1, 'table_name': table, 'row_id': row['id'], 'op': op,
+                'status': row.get('status') if op != 'delete' and table == 'orders' else None,
+                'changed_at': self.now(),
+            })
+
+    def table(self, name: str) -> FakeQuery:
+        self.tables.setdefault(name, [])
+        return FakeQuery(self, name)
+
+    def rpc(self, name: str, params: Optional[Dict] = None) -> FakeRpc:
+        return FakeRpc(self, name, params or {})
+
+    def _rpc_get_order_stats(self, since: Optional[str] = None) -> Dict:
+        # Mirrors get_order_stats() in create_tables.sql
+        orders = [o for o in self.tables['orders'] if since is None or o['created_at'][:10] >= since]
+        by_status, by_medicine, by_region, by_day = Counter(), {}, Counter(), Counter()
+        revenue = 0
+        for order in orders:
+            by_status[order.get('status') or 'new'] += 1
+            by_region[order.get('delivery_region') or ''] += 1
+            by_day[order['created_at'][:10]] += 1
+            if order.get('status') != 'cancelled':
+                amount = order['total_minor'] // 100 if order.get('total_minor') is not None \
+                    else _price_amount(order.get('price')) * (order.get('months') or 1)
+                revenue += amount
+                entry = by_medicine.setdefault(order['medicine'], {'medicine': order['medicine'], 'orders': 0, 'revenue': 0})
+                entry['orders'] += 1
+                entry['revenue'] += amount
+        return {
+            'total_medicines': sum(1 for med in self.tables['medicines'] if med.get('is_active', True)),
+            'total_orders': len(orders),
+            'total_revenue': revenue,
+            'by_status': dict(by_status),
+            'by_medicine': sorted(by_medicine.values(), key=lambda row: -row['revenue'])[:10],
+            'by_region': [{'region': r, 'orders': n} for r, n in by_region.most_common(10)],
+            'by_day': [{'day': d, 'orders': n} for d, n in sorted(by_day.items(), reverse=True)[:31]],
+        }
+
+    def _rpc_get_customer_ids(self, after_id: int = 0, batch_size: int = 500) -> List[Dict]:
+        ids = sorted({o['user_id'] for o in self.tables['orders'] if o['user_id'] > after_id})
+        return [{'user_id': user_id} for user_id in ids[:batch_size]]
+
+    def _rpc_count_customers(self) -> int:
+        return len({o['user_id'] for o in self.tables['orders']})
+
+    def seed(self, medicines: int = 20, orders: int = 0) -> 'FakeSupabase':
+        for i in range(medicines):
+            self.tables['medicines'].append({
+                'id': f'med{i}', 'name': f'💊 Dori {i}', 'benefits': 'Foydali', 'contraindications': "Ma'lum emas",
+                'description': 'Tavsif', 'price': f'{(i % 20 + 1) * 10000} UZS',
+                'price_minor': (i % 20 + 1) * 10000 * 100, 'photo': None, 'is_active': True,
+                'created_at': self.now(), 'updated_at': self.now(),
+            })
+        statuses = ('new', 'shipped', 'cancelled')
+        for i in range(orders):
+            self.tables['orders'].append({
+                'id': f'ORD{i:07d}', 'user_id': 1000 + i % 5000, 'username': f'user{i}', 'full_name': f'User {i}',
+                'medicine': f'💊 Dori {i % max(medicines, 1)}', 'months': 1 + i % 3, 'price': '100000 UZS',
+                'unit_price_minor': 10000000, 'total_minor': 10000000 * (1 + i % 3),
+                'status': statuses[i % 3], 'delivery_region': 'Toshkent', 'delivery_district': None,
+                'delivery_address': None, 'phone_number': '+998901234567', 'receipt_photo_id': None,
+                'created_at': self.now(), 'updated_at': self.now(),
+            })
+        return self
+
+
+class FakeSession(BaseSession):
+    """Bot API session that answers every method locally after an optional delay"""
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__()
+        self.latency = latency
+        self.calls: Counter = Counter()
+        self._message_ids = itertools.count(1)
+
+    async def close(self) -> None:
+        pass
+
+    async def make_request(self, bot: Bot, method, timeout: Optional[int] = None):
+        self.calls[type(method).__name__] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        result = self._result(bot, method)
+        return self.check_response(bot, method, 200, json.dumps({'ok': True, 'result': result})).result
+
+    def _result(self, bot: Bot, method) -> Any:
+        returning = str(method.__returning__)
+        if 'Message' in returning:
+            chat_id = getattr(method, 'chat_id', None) or 0
+            if not isinstance(chat_id, int):
+                chat_id = -abs(hash(chat_id)) % 10 ** 12
+            return {
+                'message_id': next(self._message_ids),
+                'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'private' if chat_id > 0 else 'channel'},
+                'text': getattr(method, 'text', None) or '',
+            }
+        if 'File' in returning:
+            return {'file_id': method.file_id, 'file_unique_id': method.file_id, 'file_size': 1024}
+        if 'User' in returning:
+            return {'id': bot.id, 'is_bot': True, 'first_name': 'Bench'}
+        return True
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        yield b''
+
+
+class FakeBotApiServer:
+    """Local HTTP server answering Bot API requests, so the real aiohttp session is exercised.
+
+    Point a bot at it with ``AiohttpSession(api=TelegramAPIServer.from_base(server.url))``.
+    """
+
+    def __init__(self, latency: float = 0.0, host: str = '127.0.0.1', port: int = 0):
+        self.latency = latency
+        self.host = host
+        self.port = port
+        self.url = ''
+        self.calls: Counter = Counter()
+        self._message_ids = itertools.count(1)
+        self._runner: Optional[web.AppRunner] = None
+
+    async def start(self) -> str:
+        app = web.Application()
+        app.router.add_post('/bot{token}/{method}', self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        host, port = self._runner.addresses[0][:2]
+        self.url = f'http://{host}:{port}'
+        return self.url
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info['method']
+        self.calls[method] += 1
+        params = dict(await request.post())
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return web.json_response({'ok': True, 'result': self._result(request.match_info['token'], method, params)})
+
+    def _message(self, params: Dict) -> Dict:
+        chat_id = str(params.get('chat_id') or 0)
+        chat_id = int(chat_id) if chat_id.lstrip('-').isdigit() else -abs(hash(chat_id)) % 10 ** 12
+        return {
+            'message_id': next(self._message_ids),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private' if chat_id > 0 else 'channel'},
+            'text': params.get('text') or '',
+        }
+
+    def _result(self, token: str, method: str, params: Dict) -> Any:
+        name = method.lower()
+        if name == 'getme':
+            return {'id': int(token.split(':')[0]), 'is_bot': True, 'first_name': 'Bench'}
+        if name == 'getfile':
+            return {'file_id': params.get('file_id'), 'file_unique_id': params.get('file_id'), 'file_size': 1024}
+        if name == 'copymessage':
+            return {'message_id': next(self._message_ids)}
+        if name == 'sendmediagroup':
+            return [self._message(params)]
+        if name.startswith(('send', 'editmessage')) or name == 'forwardmessage':
+            return self._message(params)
+        return True
+
+
+def message_update(update_id: int, user_id: int, text: str) -> Dict:
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': f'User{user_id}'},
+            'text': text,
+        },
+    }
+
+
+def callback_update(update_id: int, user_id: int, data: str) -> Dict:
+    return {
+        'update_id': update_id,
+        'callback_query': {
+            'id': str(update_id),
+            'chat_instance': str(user_id),
+            'from': {'id': user_id, 'is_bot': False, 'first_name': f'User{user_id}'},
+            'data': data,
+            'message': {
+                'message_id': update_id,
+                'date': int(time.time()),
+                'chat': {'id': user_id, 'type': 'private'},
+                'text': 'menu',
+            },
+        },
+    }
+
+
+def photo_update(update_id: int, user_id: int, file_id: str) -> Dict:
+    update = message_update(update_id, user_id, '')
+    del update['message']['text']
+    update['message']['photo'] = [
+        {'file_id': f'{file_id}_s', 'file_unique_id': f'{file_id}_s', 'width': 90, 'height': 90, 'file_size': 1500},
+        {'file_id': file_id, 'file_unique_id': file_id, 'width': 1280, 'height': 1280, 'file_size': 150000},
+    ]
+    return update
+
+
+def location_update(update_id: int, user_id: int, latitude: float, longitude: float) -> Dict:
+    update = message_update(update_id, user_id, '')
+    del update['message']['text']
+    update['message']['location'] = {'latitude': latitude, 'longitude': longitude}
+    return update
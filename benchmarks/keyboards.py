@@ -0,0 +1,59 @@
+"""Compare per-call CPU time and allocations of cached vs freshly built keyboards.
+
+    python -m benchmarks.keyboards --medicines 50 200 1000
+"""
+import argparse
+import logging
+import timeit
+import tracemalloc
+
+import bot as app
+from models import Medicine
+
+BUILDERS = [
+    'get_main_menu', 'get_admin_keyboard', 'get_months_keyboard',
+    'get_medicines_menu', 'get_store_menu', 'get_order_medicines_menu',
+]
+
+
+def allocated_per_call(func, calls: int = 200) -> float:
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    results = [func() for _ in range(calls)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    del results
+    grown = sum(stat.size_diff for stat in after.compare_to(before, 'filename') if stat.size_diff > 0)
+    return grown / calls
+
+
+def measure(label: str, func, number: int) -> tuple:
+    per_call = min(timeit.repeat(func, number=number, repeat=3)) / number
+    return label, per_call * 1e6, allocated_per_call(func)
+
+
+def main(args) -> None:
+    logging.disable(logging.WARNING)
+    for size in args.medicines:
+        app.catalog.replace({
+            f'med{i}': Medicine(id=f'med{i}', name=f'💊 Dori {i}', price_label=f'{i * 1000} UZS', price_minor=i * 100000,
+                                benefits='Foydali')
+            for i in range(size)
+        })
+        print(f'\n{size} medicines (catalog version {app.catalog.version})')
+        print(f"  {'keyboard':<26} {'built µs':>10} {'cached µs':>10} {'built B':>10} {'cached B':>10}")
+        for name in BUILDERS:
+            cached = getattr(app, name)
+            uncached = cached.__wrapped__
+            number = max(10, args.calls // size) if 'medicines' in name or 'store' in name else args.calls
+            _, built_us, built_bytes = measure('built', uncached, number)
+            cached()  # warm
+            _, cached_us, cached_bytes = measure('cached', cached, number)
+            print(f'  {name:<26} {built_us:>10.1f} {cached_us:>10.2f} {built_bytes:>10.0f} {cached_bytes:>10.0f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--medicines', type=int, nargs='+', default=[50, 200, 1000])
+    parser.add_argument('--calls', type=int, default=2000)
+    main(parser.parse_args())
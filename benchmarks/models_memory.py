@@ -0,0 +1,88 @@
+"""Compare the memory footprint of order and medicine records: plain dicts vs the models.
+
+Rows are generated by the fake Supabase client and decoded from JSON, as the
+real client does, then mapped both the old way (a dict per record, with a
+nested ``delivery_info`` dict for orders) and into the ``__slots__``
+dataclasses from models.py. The footprint is what stays allocated once the
+decoded rows are dropped: the records and the strings they keep alive.
+
+    python -m benchmarks.models_memory --orders 100000 --medicines 10000
+"""
+import argparse
+import gc
+import json
+import tracemalloc
+from typing import Callable, Dict, List
+
+from benchmarks.fakes import FakeSupabase
+from models import Medicine, Order
+
+
+def dict_order(order: Dict) -> Dict:
+    # The dict-of-dicts shape DatabaseManager returned before models.py
+    return {
+        'order_id': order['id'],
+        'user_id': order['user_id'],
+        'username': order.get('username'),
+        'full_name': order.get('full_name'),
+        'medicine': order['medicine'],
+        'months': order.get('months', 1),
+        'price': order.get('price'),
+        'status': order.get('status', 'new'),
+        'timestamp': order['created_at'],
+        'delivery_info': {
+            'region': order.get('delivery_region'),
+            'district': order.get('delivery_district'),
+            'address': order.get('delivery_address'),
+            'phone': order.get('phone_number')
+        },
+        'receipt_photo_id': order.get('receipt_photo_id')
+    }
+
+
+def dict_medicine(med: Dict) -> Dict:
+    return {
+        'name': med['name'],
+        'benefits': med.get('benefits'),
+        'contraindications': med.get('contraindications'),
+        'description': med.get('description'),
+        'price': med.get('price'),
+        'photo': med.get('photo'),
+        'category': med.get('category')
+    }
+
+
+def footprint(payload: str, mapper: Callable[[Dict], object]) -> float:
+    """Bytes per record still allocated after mapping the decoded rows and dropping them"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    rows = json.loads(payload)
+    records = [mapper(row) for row in rows]
+    del rows
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return retained / len(records)
+
+
+def compare(label: str, rows: List[Dict], old: Callable, new: Callable) -> None:
+    payload = json.dumps(rows)
+    before, after = footprint(payload, old), footprint(payload, new)
+    print(f'{label}: {len(rows)} records')
+    print(f'  dict        {before:8.0f} B/record  {before * len(rows) / 2 ** 20:7.1f} MiB')
+    print(f'  dataclass   {after:8.0f} B/record  {after * len(rows) / 2 ** 20:7.1f} MiB  '
+          f'({after / before:.0%} of dict)')
+
+
+def main(args) -> None:
+    fake = FakeSupabase().seed(medicines=args.medicines, orders=args.orders)
+    compare('orders', fake.tables['orders'], dict_order, Order.from_row)
+    compare('medicines', fake.tables['medicines'], dict_medicine, Medicine.from_row)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--orders', type=int, default=100000)
+    parser.add_argument('--medicines', type=int, default=10000)
+    main(parser.parse_args())
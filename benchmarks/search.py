@@ -0,0 +1,65 @@
+"""Measure SearchIndex build, incremental update and lookup latency on a synthetic catalog.
+
+    python -m benchmarks.search --products 10000
+"""
+import argparse
+import random
+import statistics
+import time
+
+from models import Medicine
+from search import SearchIndex
+
+LATIN = ['bio', 'tribesteron', "o'simlik", 'vitamin', 'immunitet', 'bo\'g\'imlar', 'teri', 'kapsula',
+         'energiya', 'yurak', 'jigar', 'tozalash', 'qon', 'bosim', 'ovqat', 'hazm', 'suyak', 'moy']
+CYRILLIC = ['био', 'трибестерон', 'ўсимлик', 'витамин', 'иммунитет', 'бўғимлар', 'тери', 'капсула',
+            'энергия', 'юрак', 'жигар', 'тозалаш', 'қон', 'босим', 'овқат', 'ҳазм', 'суяк', 'мой']
+SYLLABLES = ['ra', 'ko', 'mi', 'tel', 'san', 'vo', 'lin', 'do', 'be', 'qa', 'zu', 'ner', 'fo', 'xi', 'gul']
+QUERIES = ['tribesteron', 'трибестерон', 'bogimlar', 'vitamin 7', 'жигар тозалаш', 'kapsula 12', 'zzz', 'jigar']
+
+
+def synthetic_catalog(count: int, seed: int = 7):
+    rng = random.Random(seed)
+    pool = LATIN + CYRILLIC + [''.join(rng.choices(SYLLABLES, k=3)) for _ in range(2000)]
+    for i in range(count):
+        words = CYRILLIC if i % 2 else LATIN
+        brand = ''.join(rng.choices(SYLLABLES, k=rng.randint(2, 4)))
+        yield f'med{i}', Medicine.from_row({
+            'id': f'med{i}',
+            'name': f"💊 {brand.title()} {rng.choice(words).title()} {i}",
+            'benefits': ' '.join(rng.choices(pool, k=8)),
+            'description': ' '.join(rng.choices(pool, k=30)),
+            'price': f'{rng.randrange(10, 500) * 1000} UZS',
+        })
+
+
+def main(args) -> None:
+    items = list(synthetic_catalog(args.products))
+    index = SearchIndex()
+
+    started = time.perf_counter()
+    index.rebuild(items)
+    print(f'build: {len(index)} products in {(time.perf_counter() - started) * 1000:.0f} ms')
+
+    started = time.perf_counter()
+    for med_id, med in items[:100]:
+        index.add(med_id, med.with_changes({'name': med.name + ' yangi'}))
+    print(f'incremental update: {(time.perf_counter() - started) * 10:.3f} ms per product')
+
+    print(f"\n  {'query':<16} {'hits':>6} {'p50 ms':>8} {'p99 ms':>8}")
+    for query in QUERIES:
+        timings = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            hits = index.search(query, limit=20)
+            timings.append(time.perf_counter() - started)
+        timings.sort()
+        p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+        print(f'  {query:<16} {len(hits):>6} {statistics.median(timings) * 1000:>8.3f} {p99 * 1000:>8.3f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--products', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=200)
+    main(parser.parse_args())
@@ -0,0 +1,110 @@
+"""POST synthetic updates at the webhook server and report ingest and processing rates.
+
+The aiohttp application from webhook.py is served on localhost with the Bot API
+and Supabase replaced by in-process stand-ins, then ``--updates`` updates are
+posted by ``--connections`` concurrent clients, the way Telegram delivers them.
+
+    python -m benchmarks.webhook_load --updates 2000 --connections 40
+"""
+import argparse
+import asyncio
+import logging
+import time
+
+import aiohttp
+from aiogram import Bot
+from aiohttp import web
+
+import bot as app
+import webhook
+from benchmarks.db_load import ADMIN_IDS, build_workload, percentile
+from benchmarks.fakes import FakeSession, FakeSupabase
+from database import db
+from scheduler import UPDATE_CONCURRENCY
+
+
+async def main(args) -> None:
+    logging.disable(logging.WARNING)
+    db.supabase = FakeSupabase(latency=args.db_latency).seed(medicines=args.medicines, orders=args.orders)
+    app.bot = Bot(token='123456:BENCHMARK', session=FakeSession(latency=args.api_latency))
+    app.ADMIN_IDS[:] = ADMIN_IDS
+    app.catalog.snapshot = None  # keep fake medicines out of the real snapshot
+    await app.catalog.reload()
+
+    processed = 0
+    done = asyncio.Event()
+
+    def finished() -> None:
+        nonlocal processed
+        processed += 1
+        if processed == args.updates:
+            done.set()
+
+    async def count_processed(handler, event, data):
+        try:
+            return await handler(event, data)
+        finally:
+            finished()
+
+    # Updates dropped by the scheduler under overload never reach count_processed
+    async def count_shed(update):
+        try:
+            await notify_shed(update)
+        finally:
+            finished()
+
+    limiter = app.update_scheduler
+    limiter.limit = args.concurrency
+    notify_shed, limiter.on_shed = limiter.on_shed, count_shed
+    app.dp.update.outer_middleware(count_processed)
+    runner = web.AppRunner(webhook.build_app(app.dp, app.bot, limiter, register_webhook=False))
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', args.port)
+    await site.start()
+
+    workload = [raw for _, raw in build_workload(args.updates, args.admin_share, list(app.catalog.keys()))]
+    url = f'http://127.0.0.1:{args.port}{webhook.WEBHOOK_PATH}'
+    headers = {'X-Telegram-Bot-Api-Secret-Token': webhook.WEBHOOK_SECRET} if webhook.WEBHOOK_SECRET else {}
+    timings = []
+    queue = iter(workload)
+
+    async def client(session: aiohttp.ClientSession) -> None:
+        for raw in queue:
+            started = time.perf_counter()
+            async with session.post(url, json=raw, headers=headers) as response:
+                response.raise_for_status()
+            timings.append(time.perf_counter() - started)
+
+    connector = aiohttp.TCPConnector(limit=args.connections)
+    started = time.perf_counter()
+    async with aiohttp.ClientSession(connector=connector) as session:
+        await asyncio.gather(*(client(session) for _ in range(args.connections)))
+        accepted = time.perf_counter() - started
+        async with session.get(f'http://127.0.0.1:{args.port}/healthz') as response:
+            health = await response.json()
+    await done.wait()
+    elapsed = time.perf_counter() - started
+
+    print(f'accepted {args.updates} updates in {accepted:.2f} s ({args.updates / accepted:.0f} req/s)')
+    print(f'  POST p50={percentile(timings, 0.50) * 1000:.1f} ms  p99={percentile(timings, 0.99) * 1000:.1f} ms')
+    print(f'  backlog after ingest: in_flight={health["in_flight"]} waiting={health["waiting"]}')
+    print(f'processed all updates in {elapsed:.2f} s ({args.updates / elapsed:.0f} updates/s), '
+          f'{limiter.shed} low-priority updates shed')
+
+    await runner.cleanup()
+    db.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--updates', type=int, default=2000)
+    parser.add_argument('--connections', type=int, default=40, help='concurrent HTTP clients')
+    parser.add_argument('--concurrency', type=int, default=UPDATE_CONCURRENCY,
+                        help='updates processed at the same time')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--admin-share', type=float, default=0.1)
+    parser.add_argument('--db-latency', type=float, default=0.03)
+    parser.add_argument('--api-latency', type=float, default=0.005)
+    parser.add_argument('--medicines', type=int, default=50)
+    parser.add_argument('--orders', type=int, default=2000)
+    asyncio.run(main(parser.parse_args()))
@@ -1,10 +1,9 @@
 import asyncio
 import datetime
+import functools
 import json
 import logging
 import os
-import random
-import string
 from typing import Dict, List, Optional
 from typing import Dict, List, Optional
 
@@ -12,30 +11,82 @@ from aiogram import Bot, Dispatcher, types, F
 from aiogram.filters import Command, CommandStart, BaseFilter
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.types import (
-    CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup, 
+    CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup, InlineQuery,
+    InlineQueryResultArticle, InputMediaPhoto, InputTextMessageContent,
     KeyboardButton, Message, ReplyKeyboardMarkup, ReplyKeyboardRemove
 )
 from aiogram.enums import ParseMode
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
 from dotenv import load_dotenv
 from supabase import create_client, Client
 from database import db
+from catalog import CatalogCache, CatalogSnapshot
+from search import SearchIndex
+from fsm_storage import create_fsm_storage
+from webhook import run_webhook
+from scheduler import UPDATE_QUEUE_LIMIT, UpdateScheduler
+from outbox import Outbox
+from ratelimit import PRIORITY_LOW, RateLimitMiddleware, send_priority
+from broadcast import Broadcaster
+from order_writer import OrderWriter, checkout_order_id
+from journal import OrderJournal
+from changefeed import ChangeFeed
+from sync import DeltaSync
+from image_store import HAS_PILLOW, IMAGE_WORKERS, MAX_DOWNLOAD_SIZE, ImagePipeline, create_image_storage
+from media import MediaCache, is_broken_photo_error
+from models import Medicine, StoredImage, format_price, parse_price
+from logconfig import correlation_middleware, setup_logging
+from metrics import ApiMetricsMiddleware, HandlerMetricsMiddleware, metrics, serve_metrics
 
 # Atrof-muhit o'zgaruvchilarini yuklash
 load_dotenv()
 
-# Loglarni sozlash
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
-logger = logging.getLogger(__name__)
+# Loglarni sozlash (LOG_LEVEL, LOG_FORMAT, LOG_LEVELS, LOG_SAMPLE)
+setup_logging()
+logger = logging.getLogger('bot')
+# Har bir mahsulot ko'rilishi: ko'p bo'lgani uchun LOG_SAMPLE bo'yicha tanlab yoziladi
+view_logger = logging.getLogger('bot.views')
 
 # Bot va dispatcherni ishga tushirish
 bot = Bot(token=os.getenv('BOT_TOKEN'))
-dp = Dispatcher()
-storage = MemoryStorage()
+# Barcha chiquvchi xabarlar Telegram cheklovlari doirasida yuboriladi
+rate_limiter = RateLimitMiddleware()
+bot.session.middleware(rate_limiter)
+# Har bir Bot API so'rovining davomiyligi (navbatda kutish hisobga olinmaydi)
+bot.session.middleware(ApiMetricsMiddleware())
+# FSM holatlari FSM_STORAGE (sqlite/redis/memory) da saqlanadi, qayta ishga tushirishda yo'qolmaydi
+storage = create_fsm_storage()
+dp = Dispatcher(storage=storage)
+# Yangilanish davomida yozilgan barcha loglar uning ID si bilan belgilanadi
+dp.update.outer_middleware(correlation_middleware)
+
+# Og'ir admin ro'yxatlari: yuklama oshganda mijozlardan keyin bajariladi yoki tashlab yuboriladi
+LOW_PRIORITY_CALLBACKS = ('admin_orders', 'orders_', 'admin_stats', 'stats_', 'admin_products', 'meds_')
+
+def is_low_priority_update(update: types.Update) -> bool:
+    query = update.callback_query
+    return bool(query and query.data and query.data.startswith(LOW_PRIORITY_CALLBACKS))
+
+async def notify_update_shed(update: types.Update):
+    """Tashlab yuborilgan so'rov haqida foydalanuvchini ogohlantirish"""
+    if update.callback_query:
+        await bot.answer_callback_query(
+            update.callback_query.id,
+            text="⏳ Hozir yuklama yuqori, birozdan so'ng qayta urinib ko'ring",
+            show_alert=True
+        )
+
+# Turli chatlar parallel, bitta chatning yangilanishlari esa navbat bilan qayta ishlanadi
+update_scheduler = UpdateScheduler(is_low_priority=is_low_priority_update)
+update_scheduler.on_shed = notify_update_shed
+dp.update.outer_middleware(update_scheduler)
+metrics.register_gauges('bot_scheduler', update_scheduler.stats)
+metrics.register_gauges('bot_rate_limit', rate_limiter.gauges)
+# Har bir handler va callback prefiksi bo'yicha vaqt, xatolar va bajarilayotganlar soni
+handler_metrics = HandlerMetricsMiddleware()
+for observer in (dp.message, dp.callback_query, dp.inline_query):
+    observer.middleware(handler_metrics)
 
 # Bot konfiguratsiyasi
 STORE_PHONE = """
@@ -51,6 +102,8 @@ PAYMENT_CARD = """💳 Karta raqami: 5614 6814 2214 5270
 # Load admin IDs from environment variable
 ADMIN_IDS = [int(admin_id.strip()) for admin_id in os.getenv('ADMIN_ID', '').split(',') if admin_id.strip().isdigit()]
 ORDER_CHANNEL = os.getenv('ORDER_CHANNEL', "@zakazlarshifo17")  # Buyurtmalar kanali
+# Yangilanishlarni qabul qilish usuli: polling yoki webhook
+RUN_MODE = os.getenv('RUN_MODE', 'polling')
 
 # Supabase ulanishi
 supabase_url = os.getenv('SUPABASE_URL')
@@ -91,6 +144,9 @@ MEDICINES = {
     }
 }
 
+# Katalogda topilmagan dori uchun o'rinbosar (buyurtma jarayoni uzilmasligi uchun)
+UNKNOWN_MEDICINE = Medicine(id='', name='N/A')
+
 # Admin filtri
 class IsAdmin(BaseFilter):
     async def __call__(self, message: Message) -> bool:
@@ -127,19 +183,19 @@ class EditMedicine(StatesGroup):
     choosing_field = State()
     editing_field = State()
 
+class SearchStates(StatesGroup):
+    waiting_for_query = State()
+
+class BroadcastStates(StatesGroup):
+    waiting_for_message = State()
+    confirming = State()
+
 class Checkout(StatesGroup):
     waiting_for_address = State()
     waiting_for_payment = State()
     waiting_for_confirmation = State()
     waiting_for_receipt = State()
 
-# Foydalanuvchi buyurtmalari saqlash
-ORDERS_FILE = 'orders.json'
-
-async def load_orders() -> dict:
-    """Load orders from Supabase database"""
-    return await db.get_all_orders()
-
 async def save_orders(orders: dict) -> None:
     """Save orders to Supabase database (legacy function for compatibility)"""
     # This function is kept for compatibility but orders are now saved individually
@@ -150,19 +206,79 @@ async def save_medicines(medicines: Dict[str, Dict]) -> None:
     # This function is kept for compatibility but medicines are now saved individually
     pass
 
-async def load_medicines() -> Dict[str, Dict]:
+async def load_medicines() -> Dict[str, Medicine]:
     """Load medicines from Supabase database"""
     return await db.get_all_medicines()
 
-# Initialize empty containers - will be loaded in main()
-orders = {}
-# MEDICINES will be loaded from database in main()
+# Dorilar katalogi: MEDICINES boshlang'ich qiymat, main() da diskdagi nusxadan yoki bazadan yuklanadi
+catalog = CatalogCache(load_medicines, snapshot=CatalogSnapshot())
+# Qidiruv indeksi katalog o'zgarishlari bilan bosqichma-bosqich yangilanadi
+search_index = SearchIndex()
+catalog.subscribe(search_index.on_catalog_change)
+catalog.replace({med_id: Medicine.from_row({'id': med_id, **med}) for med_id, med in MEDICINES.items()})
+# Yuklangan rasmlarning siqilgan nusxalari ombori (IMAGE_STORAGE: lokal papka yoki Supabase Storage)
+image_storage = create_image_storage(supabase=db.supabase)
+# Dori rasmlarining tekshirilgan file_id lari va buzuq rasmlar (images jadvali)
+media = MediaCache(db.get_medicine_images, db.save_medicine_image, image_storage)
+
+# Kanalga yuboriladigan xabarlar navbati (qayta ishga tushganda ham saqlanadi)
+outbox = Outbox()
+
+async def download_telegram_file(file_id: str) -> bytes:
+    """Telegram serveridan faylni yuklab olish"""
+    buffer = await bot.download(file_id)
+    return buffer.getvalue()
+
+# Rasmlar fonda yuklab olinib, siqilib omborga saqlanadi (navbat outbox bazasida)
+image_pipeline = ImagePipeline(
+    image_storage, download_telegram_file, Outbox(outbox.database, workers=IMAGE_WORKERS, table='image_jobs')
+)
+
+# Barcha mijozlarga xabar yuborish (qayta ishga tushganda davom etadi)
+broadcaster = Broadcaster(db.get_customer_ids, db.count_customers)
+# Buyurtmalar bazaga to'plab, takrorlanmasdan yoziladi
+order_writer = OrderWriter(db)
+# Buyurtma avval mahalliy jurnalga yoziladi, bazaga esa fonda yetkaziladi
+order_journal = OrderJournal()
+
+async def apply_medicine_rows(rows: List[Dict], complete: bool):
+    """Bazada o'zgargan dorilarni katalogga qo'llash (to'liq qayta yuklashsiz)"""
+    changed, removed = db.split_medicine_changes(rows)
+    catalog.watermark = catalog_sync.watermark
+    if complete:
+        # Birinchi to'liq o'qish: baza bo'sh bo'lsa MEDICINES saqlanib qoladi
+        if changed:
+            catalog.replace(changed)
+    else:
+        catalog.apply_changes(changed, removed)
+    catalog.touch()
+
+# Katalog faqat oxirgi sinxronizatsiyadan keyin o'zgargan qatorlar bilan yangilanadi
+catalog_sync = DeltaSync('medicines', db.fetch_changes, apply_medicine_rows)
+
+# Boshqa jarayonlar yoki Supabase paneli orqali qilingan o'zgarishlar
+change_feed = ChangeFeed(db.get_changes, db.get_latest_change_seq, prune=db.prune_changes)
+
+async def on_medicine_changes(changes: List[Dict]):
+    """O'chirilgan dorilarni darhol olib tashlash, qolganlari uchun sinxronizatsiyani boshlash"""
+    # Bazadan butunlay o'chirilgan qator sinxronizatsiyada ko'rinmaydi
+    catalog.apply_changes({}, [change['row_id'] for change in changes if change['op'] == 'delete'])
+    if any(change['op'] != 'delete' for change in changes):
+        catalog_sync.trigger()
+
+change_feed.subscribe('medicines', on_medicine_changes)
+
+# Katalog sahifasidagi dorilar soni (Telegram klaviatura hajmi chegarasidan past)
+CATALOG_PAGE_SIZE = int(os.getenv('CATALOG_PAGE_SIZE', '8'))
 
 # Foydalanuvchi savatlari saqlash
 user_baskets = {}
 
 # --- Klaviaturalar --- #
+# O'zgarmas klaviaturalar bir marta yaratiladi (functools.cache), katalogga bog'liqlari
+# esa catalog.version o'zgarguncha keshlanadi (catalog.memoize).
 
+@functools.cache
 def get_main_menu() -> ReplyKeyboardMarkup:
     """Asosiy menyu klaviaturasini yaratish"""
     buttons = [
@@ -171,6 +287,7 @@ def get_main_menu() -> ReplyKeyboardMarkup:
     ]
     return ReplyKeyboardMarkup(keyboard=buttons, resize_keyboard=True)
 
+@functools.cache
 def get_main_menu_inline() -> InlineKeyboardMarkup:
     """Inline asosiy menyu klaviaturasini yaratish"""
     buttons = [
@@ -181,17 +298,72 @@ def get_main_menu_inline() -> InlineKeyboardMarkup:
     ]
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
-def get_medicines_menu() -> InlineKeyboardMarkup:
-    """Dorilar menyusi klaviaturasini yaratish"""
+@catalog.memoize
+def get_catalog_categories() -> List[str]:
+    """Katalogdagi kategoriyalar ro'yxati (tartiblangan)"""
+    return sorted({med.category for _, med in catalog.items() if med.category})
+
+@catalog.memoize
+def get_catalog_section(category_index: Optional[int] = None) -> List[tuple]:
+    """Kategoriya (yoki butun katalog) bo'yicha (med_id, med) juftliklari"""
+    if category_index is None:
+        return list(catalog.items())
+    categories = get_catalog_categories()
+    if not 0 <= category_index < len(categories):
+        return []
+    category = categories[category_index]
+    return [(med_id, med) for med_id, med in catalog.items() if med.category == category]
+
+def get_page_navigation(prefix: str, page: int, pages: int, suffix: str = '') -> List[InlineKeyboardButton]:
+    """Sahifalar orasida o'tish tugmalari"""
+    nav = []
+    if page > 0:
+        nav.append(InlineKeyboardButton(text='⬅️', callback_data=f'{prefix}{page - 1}{suffix}'))
+    nav.append(InlineKeyboardButton(text=f'{page + 1}/{pages}', callback_data='catalog_noop'))
+    if page + 1 < pages:
+        nav.append(InlineKeyboardButton(text='➡️', callback_data=f'{prefix}{page + 1}{suffix}'))
+    return nav
+
+def get_catalog_menu() -> InlineKeyboardMarkup:
+    """Katalogning boshlang'ich menyusi: kategoriyalar bo'lsa ular, aks holda birinchi sahifa"""
+    if get_catalog_categories():
+        return get_categories_menu()
+    return get_medicines_menu()
+
+@catalog.memoize
+def get_categories_menu() -> InlineKeyboardMarkup:
+    """Kategoriyalar menyusi"""
+    buttons = [
+        [InlineKeyboardButton(text=f'📂 {category}', callback_data=f'medpage_0_{index}')]
+        for index, category in enumerate(get_catalog_categories())
+    ]
+    buttons.append([InlineKeyboardButton(text='📋 Barcha dorilar', callback_data='medpage_0')])
+    buttons.append([InlineKeyboardButton(text='🔙 Asosiy menyuga qaytish', callback_data='main_menu')])
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+@catalog.memoize
+def get_medicines_menu(page: int = 0, category_index: Optional[int] = None) -> InlineKeyboardMarkup:
+    """Dorilar menyusi klaviaturasini yaratish (bitta sahifa)"""
+    section = get_catalog_section(category_index)
+    pages = max(1, -(-len(section) // CATALOG_PAGE_SIZE))
+    page = min(max(page, 0), pages - 1)
+    
     buttons = []
-    for med_id, med in MEDICINES.items():
+    for med_id, med in section[page * CATALOG_PAGE_SIZE:(page + 1) * CATALOG_PAGE_SIZE]:
         buttons.append([InlineKeyboardButton(
-            text=med['name'],
+            text=med.name,
             callback_data=f'med_{med_id}'
         )])
-    buttons.append([InlineKeyboardButton(text='🔙 Asosiy menyuga qaytish', callback_data='main_menu')])
+    if pages > 1:
+        suffix = f'_{category_index}' if category_index is not None else ''
+        buttons.append(get_page_navigation('medpage_', page, pages, suffix))
+    if get_catalog_categories():
+        buttons.append([InlineKeyboardButton(text='🔙 Kategoriyalarga qaytish', callback_data='medcats')])
+    else:
+        buttons.append([InlineKeyboardButton(text='🔙 Asosiy menyuga qaytish', callback_data='main_menu')])
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
+@functools.cache
 def get_months_keyboard() -> InlineKeyboardMarkup:
     """Oy tanlash klaviaturasini yaratish"""
     buttons = [
@@ -203,6 +375,7 @@ def get_months_keyboard() -> InlineKeyboardMarkup:
     ]
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
+@functools.cache
 def get_location_keyboard() -> ReplyKeyboardMarkup:
     """Joylashuv ulashish klaviaturasi"""
     buttons = [
@@ -211,6 +384,7 @@ def get_location_keyboard() -> ReplyKeyboardMarkup:
     ]
     return ReplyKeyboardMarkup(keyboard=buttons, resize_keyboard=True)
 
+@functools.cache
 def get_confirmation_keyboard() -> InlineKeyboardMarkup:
     """Buyurtma tasdiqlash klaviaturasi"""
     buttons = [
@@ -221,6 +395,7 @@ def get_confirmation_keyboard() -> InlineKeyboardMarkup:
     ]
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
+@functools.cache
 def get_admin_keyboard():
     """Admin klaviaturasini yaratish"""
     return InlineKeyboardMarkup(inline_keyboard=[
@@ -233,18 +408,26 @@ def get_admin_keyboard():
         [
             InlineKeyboardButton(text="🗑️ Dorini o'chirish", callback_data="delete_medicine"),
             InlineKeyboardButton(text="📊 Statistika", callback_data="admin_stats")
-        ]
+        ],
+        [InlineKeyboardButton(text="📢 Mijozlarga xabar yuborish", callback_data="admin_broadcast")]
     ])
 
-# Do'kon menyusi klaviaturasi
-def get_store_menu():
+# Do'kon menyusi klaviaturasi (bitta sahifa)
+@catalog.memoize
+def get_store_menu(page: int = 0):
+    section = get_catalog_section()
+    pages = max(1, -(-len(section) // CATALOG_PAGE_SIZE))
+    page = min(max(page, 0), pages - 1)
     buttons = []
-    for med_id, med in MEDICINES.items():
-        buttons.append([InlineKeyboardButton(text=med['name'], callback_data=f'med_{med_id}')])
+    for med_id, med in section[page * CATALOG_PAGE_SIZE:(page + 1) * CATALOG_PAGE_SIZE]:
+        buttons.append([InlineKeyboardButton(text=med.name, callback_data=f'med_{med_id}')])
+    if pages > 1:
+        buttons.append(get_page_navigation('storepage_', page, pages))
     keyboard = InlineKeyboardMarkup(inline_keyboard=buttons)
     return keyboard
 
 # Dori tafsilotlari klaviaturasi
+@catalog.memoize
 def get_medicine_detail_keyboard(med_id):
     buttons = [
         [InlineKeyboardButton(text='➕ Savatga qo\'shish', callback_data=f'add_{med_id}'),
@@ -263,6 +446,7 @@ def get_basket_keyboard(user_id):
     keyboard = InlineKeyboardMarkup(inline_keyboard=buttons)
     return keyboard
 
+@functools.cache
 def get_checkout_options_keyboard():
     buttons = [
         [InlineKeyboardButton(text="👨‍💼 Administrator bilan bog'lanish", callback_data='contact_admin')],
@@ -272,6 +456,66 @@ def get_checkout_options_keyboard():
     keyboard = InlineKeyboardMarkup(inline_keyboard=buttons)
     return keyboard
 
+@catalog.memoize
+def get_medicine_order_keyboard(med_id: str) -> InlineKeyboardMarkup:
+    """Dori kartochkasidagi buyurtma klaviaturasi"""
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text='🛒 Hozir buyurtma berish', callback_data=f'order_{med_id}')],
+        [InlineKeyboardButton(text='🔙 Ro\'yxatga qaytish', callback_data='back_to_medicines')]
+    ])
+
+@catalog.memoize
+def get_order_medicines_menu(page: int = 0) -> InlineKeyboardMarkup:
+    """Buyurtma uchun dorilar ro'yxati (narxi bilan, bitta sahifa)"""
+    section = get_catalog_section()
+    pages = max(1, -(-len(section) // CATALOG_PAGE_SIZE))
+    page = min(max(page, 0), pages - 1)
+    
+    buttons = []
+    for med_id, med in section[page * CATALOG_PAGE_SIZE:(page + 1) * CATALOG_PAGE_SIZE]:
+        buttons.append([
+            InlineKeyboardButton(
+                text=f"{med.name} - {med.price_text or 'Narx belgilanmagan'}",
+                callback_data=f"order_{med_id}"
+            )
+        ])
+    if pages > 1:
+        buttons.append(get_page_navigation('orderpage_', page, pages))
+    buttons.append([InlineKeyboardButton(text="🔙 Orqaga", callback_data="back_to_main")])
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+@functools.cache
+def get_payment_keyboard() -> InlineKeyboardMarkup:
+    """To'lov chekini yuklash klaviaturasi"""
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text='📤 Chek yuklash', callback_data='upload_receipt')],
+        [InlineKeyboardButton(text='🔙 Bekor qilish', callback_data='cancel_order')]
+    ])
+
+@functools.cache
+def get_delivery_region_keyboard() -> InlineKeyboardMarkup:
+    """Yetkazib berish hududini tanlash klaviaturasi"""
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [
+            InlineKeyboardButton(text='📍 Toshkent shahri', callback_data='location_tashkent'),
+            InlineKeyboardButton(text='📍 Boshqa viloyat', callback_data='location_other')
+        ],
+        [InlineKeyboardButton(text='🔙 Bekor qilish', callback_data='cancel_order')]
+    ])
+
+def get_medicine_text(med: Medicine) -> str:
+    """Dori kartochkasi matni (HTML)"""
+    benefits = med.benefits or med.description or "Ma'lumot mavjud emas"
+    contraindications = med.contraindications or "Ma'lumot mavjud emas"
+    price = med.price_text or "Narx ko'rsatilmagan"
+    
+    return (
+        f"{med.name}\n\n"
+        f"💊 <b>Foydali xususiyatlari:</b>\n{benefits}\n\n"
+        f"⚠️ <b>Qarshi ko'rsatmalar:</b>\n{contraindications}\n\n"
+        f"💰 <b>Narxi:</b> {price}"
+    )
+
 # --- Buyruq ishlovchilari --- #
 
 @dp.message(CommandStart())
@@ -282,6 +526,11 @@ async def cmd_start(message: Message):
         "Quyidagi menyudan kerakli bo'limni tanlang:"
     )
     await message.answer(welcome_text, reply_markup=get_main_menu())
+    # Botni qayta ishga tushirgan foydalanuvchi yana xabarlar oladi
+    try:
+        await broadcaster.forget_blocked(message.from_user.id)
+    except Exception as e:
+        logger.error("Error clearing blocked user: %s", e)
 
 @dp.message(F.text == '📍 Manzil')
 async def show_address(message: Message):
@@ -298,123 +547,220 @@ async def show_medicines(message: Message):
     """Mavjud dorilar ro'yxatini ko'rsatish"""
     await message.answer(
         "🌿 Mavjud o'simlik dorilar:",
-        reply_markup=get_medicines_menu()
+        reply_markup=get_catalog_menu()
     )
 
 @dp.callback_query(F.data.startswith('med_'))
 async def show_medicine_detail(callback: CallbackQuery):
     """Muayyan dori tafsilotlarini ko'rsatish"""
-    global MEDICINES
     med_id = callback.data[4:]  # 'med_' prefixini olib tashlash
     
-    logging.info(f"Looking for medicine ID: '{med_id}'")
-    logging.info(f"Current MEDICINES keys: {list(MEDICINES.keys())}")
+    view_logger.info("Medicine %s viewed", med_id, extra={'med_id': med_id})
     
-    # Reload medicines from database if not found
-    if med_id not in MEDICINES:
-        logging.warning(f"Medicine {med_id} not found in cache, reloading from database")
-        try:
-            MEDICINES = await load_medicines()
-            logging.info(f"Reloaded {len(MEDICINES)} medicines from database")
-            logging.info(f"New MEDICINES keys after reload: {list(MEDICINES.keys())}")
-        except Exception as e:
-            logging.error(f"Failed to reload medicines: {e}")
-    
-    if med_id not in MEDICINES:
-        logging.error(f"Medicine '{med_id}' still not found after reload.")
-        logging.error(f"Available medicines: {list(MEDICINES.keys())}")
-        # Try to find similar IDs
-        similar = [k for k in MEDICINES.keys() if med_id.lower() in k.lower() or k.lower() in med_id.lower()]
-        if similar:
-            logging.error(f"Similar medicine IDs found: {similar}")
+    # Keshda bo'lmasa katalog bir marta qayta yuklanadi (parallel so'rovlar bitta yuklashni baham ko'radi)
+    med = await catalog.lookup(med_id)
+    if med is None:
+        logger.warning("Medicine '%s' not found in catalog version %s", med_id, catalog.version)
         await callback.answer("Dori topilmadi. Iltimos, qaytadan urinib ko'ring.")
         return
     
-    med = MEDICINES[med_id]
-    benefits = med.get('benefits') or med.get('description', "Ma'lumot mavjud emas")
-    contraindications = med.get('contraindications', "Ma'lumot mavjud emas")
-    price = med.get('price', "Narx ko'rsatilmagan")
-    
-    text = (
-        f"{med['name']}\n\n"
-        f"💊 <b>Foydali xususiyatlari:</b>\n{benefits}\n\n"
-        f"⚠️ <b>Qarshi ko'rsatmalar:</b>\n{contraindications}\n\n"
-        f"💰 <b>Narxi:</b> {price}"
-    )
+    text = get_medicine_text(med)
     
     # Buyurtma tugmasini qo'shish
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text='🛒 Hozir buyurtma berish', callback_data=f'order_{med_id}')],
-        [InlineKeyboardButton(text='🔙 Ro\'yxatga qaytish', callback_data='back_to_medicines')]
-    ])
+    keyboard = get_medicine_order_keyboard(med_id)
     
-    # Check if medicine has a photo
-    photo_id = med.get('photo')
-    if photo_id:
-        # Send photo with caption
+    # Buzuq deb belgilangan rasm qayta yuborilmaydi
+    photo = media.photo(med)
+    if photo:
         try:
-            await callback.message.delete()  # Delete the previous message
-            await bot.send_photo(
-                chat_id=callback.message.chat.id,
-                photo=photo_id,
-                caption=text,
-                reply_markup=keyboard,
-                parse_mode='HTML'
-            )
+            if callback.message.photo:
+                # Rasmli xabar joyida almashtiriladi (bitta so'rov)
+                result = await callback.message.edit_media(
+                    InputMediaPhoto(media=photo, caption=text, parse_mode='HTML'),
+                    reply_markup=keyboard
+                )
+            else:
+                # Matnli xabarni rasmga aylantirib bo'lmaydi: yangisi yuboriladi
+                result = await bot.send_photo(
+                    chat_id=callback.message.chat.id,
+                    photo=photo,
+                    caption=text,
+                    reply_markup=keyboard,
+                    parse_mode='HTML'
+                )
         except Exception as e:
+            if isinstance(e, TelegramBadRequest) and 'message is not modified' in e.message:
+                return
             # If photo fails, send text message
-            logging.error(f"Error sending photo: {e}")
-            await callback.message.edit_text(text, reply_markup=keyboard, parse_mode='HTML')
+            if is_broken_photo_error(e):
+                media.mark_broken(med, e)
+            else:
+                logger.error("Error sending photo: %s", e)
+        else:
+            if isinstance(result, Message):
+                media.remember(med, result.photo)
+            if not callback.message.photo:
+                await callback.message.delete()
+            return
+    
+    if callback.message.photo:
+        # Rasm izohini oddiy matnga aylantirib bo'lmaydi
+        await bot.send_message(callback.message.chat.id, text, reply_markup=keyboard, parse_mode='HTML')
+        await callback.message.delete()
     else:
-        # Send text message if no photo
         await callback.message.edit_text(text, reply_markup=keyboard, parse_mode='HTML')
 
 @dp.callback_query(F.data == 'back_to_medicines')
 async def back_to_medicines(callback: CallbackQuery):
     """Dorilar ro'yxatiga qaytish"""
     try:
-        # Try to edit text first (for text messages)
-        await callback.message.edit_text(
-            "🌿 Mavjud o'simlik dorilar:",
-            reply_markup=get_medicines_menu()
-        )
-    except Exception:
-        # If editing fails (photo message), delete and send new message
-        try:
-            await callback.message.delete()
+        if callback.message.photo:
+            # Rasmli xabarni matnga tahrirlab bo'lmaydi: yangisi yuboriladi
             await bot.send_message(
                 chat_id=callback.message.chat.id,
                 text="🌿 Mavjud o'simlik dorilar:",
-                reply_markup=get_medicines_menu()
+                reply_markup=get_catalog_menu()
             )
-        except Exception as e:
-            logging.error(f"Error in back_to_medicines: {e}")
-            # Fallback: just send a new message
-            await bot.send_message(
-                chat_id=callback.message.chat.id,
-                text="🌿 Mavjud o'simlik dorilar:",
-                reply_markup=get_medicines_menu()
+            await callback.message.delete()
+        else:
+            await callback.message.edit_text(
+                "🌿 Mavjud o'simlik dorilar:",
+                reply_markup=get_catalog_menu()
             )
+    except Exception as e:
+        logger.error("Error in back_to_medicines: %s", e)
+        # Fallback: just send a new message
+        await bot.send_message(
+            chat_id=callback.message.chat.id,
+            text="🌿 Mavjud o'simlik dorilar:",
+            reply_markup=get_catalog_menu()
+        )
+    
+    await callback.answer()
+
+@dp.callback_query(F.data.startswith('medpage_') | (F.data == 'medcats'))
+async def show_medicines_page(callback: CallbackQuery):
+    """Katalog sahifasi yoki kategoriyalar menyusini ko'rsatish"""
+    if callback.data == 'medcats':
+        keyboard = get_catalog_menu()
+    else:
+        try:
+            parts = [int(part) for part in callback.data[len('medpage_'):].split('_')]
+        except ValueError:
+            await callback.answer()
+            return
+        keyboard = get_medicines_menu(parts[0], parts[1] if len(parts) > 1 else None)
     
+    try:
+        await callback.message.edit_text("🌿 Mavjud o'simlik dorilar:", reply_markup=keyboard)
+    except Exception as e:
+        logger.error("Error in show_medicines_page: %s", e)
     await callback.answer()
 
+@dp.callback_query(F.data.startswith('orderpage_'))
+async def show_order_medicines_page(callback: CallbackQuery):
+    """Buyurtma ro'yxatining boshqa sahifasini ko'rsatish"""
+    page = callback.data[len('orderpage_'):]
+    if not page.isdigit():
+        await callback.answer()
+        return
+    
+    try:
+        await callback.message.edit_reply_markup(reply_markup=get_order_medicines_menu(int(page)))
+    except Exception as e:
+        logger.error("Error in show_order_medicines_page: %s", e)
+    await callback.answer()
+
+@dp.callback_query(F.data.startswith('storepage_'))
+async def show_store_page(callback: CallbackQuery):
+    """Do'kon ro'yxatining boshqa sahifasini ko'rsatish"""
+    page = callback.data[len('storepage_'):]
+    if not page.isdigit():
+        await callback.answer()
+        return
+    
+    try:
+        await callback.message.edit_reply_markup(reply_markup=get_store_menu(int(page)))
+    except Exception as e:
+        logger.error("Error in show_store_page: %s", e)
+    await callback.answer()
+
+@dp.callback_query(F.data == 'catalog_noop')
+async def catalog_noop(callback: CallbackQuery):
+    """Sahifa raqami tugmasi hech narsa qilmaydi"""
+    await callback.answer()
+
+# --- Qidiruv --- #
+
+SEARCH_RESULTS_LIMIT = 10
+
+def get_search_results_keyboard(med_ids: List[str]) -> InlineKeyboardMarkup:
+    """Qidiruv natijalari klaviaturasi"""
+    buttons = [
+        [InlineKeyboardButton(text=catalog[med_id].name, callback_data=f'med_{med_id}')]
+        for med_id in med_ids if med_id in catalog
+    ]
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+async def answer_search(message: Message, query: str):
+    """Qidiruv natijalarini yuborish"""
+    med_ids = search_index.search(query, limit=SEARCH_RESULTS_LIMIT)
+    if not med_ids:
+        await message.answer("🔍 Hech narsa topilmadi. Boshqa so'z bilan urinib ko'ring.")
+        return
+    await message.answer(
+        f"🔍 «{query}» bo'yicha natijalar:",
+        reply_markup=get_search_results_keyboard(med_ids)
+    )
+
+@dp.message(Command("search"))
+async def cmd_search(message: Message, state: FSMContext):
+    """/search <so'z> - dorilarni nomi va tavsifi bo'yicha qidirish"""
+    query = (message.text or '').partition(' ')[2].strip()
+    if not query:
+        await message.answer("🔍 Qidirish uchun dori nomi yoki belgini yozing:")
+        await state.set_state(SearchStates.waiting_for_query)
+        return
+    await answer_search(message, query)
+
+@dp.message(SearchStates.waiting_for_query, F.text)
+async def process_search_query(message: Message, state: FSMContext):
+    """/search dan keyin yuborilgan so'rovni qayta ishlash"""
+    await state.clear()
+    await answer_search(message, message.text.strip())
+
+@dp.inline_query()
+async def inline_search(inline_query: InlineQuery):
+    """Inline rejimda qidirish: @bot <so'z>"""
+    query = inline_query.query.strip()
+    if query:
+        med_ids = search_index.search(query, limit=50)
+    else:
+        med_ids = [med_id for med_id, _ in get_catalog_section()[:50]]
+    
+    results = []
+    for med_id in med_ids:
+        med = catalog.get(med_id)
+        if med is None:
+            continue
+        results.append(InlineQueryResultArticle(
+            id=med_id[:64],
+            title=med.name,
+            description=med.price_text,
+            # Ro'yxatda omborda saqlangan kichik nusxa ko'rsatiladi
+            thumbnail_url=media.thumbnail(med),
+            input_message_content=InputTextMessageContent(message_text=get_medicine_text(med), parse_mode='HTML'),
+            reply_markup=get_medicine_order_keyboard(med_id)
+        ))
+    await inline_query.answer(results, cache_time=60, is_personal=False)
+
 @dp.callback_query(F.data.startswith('order_'))
 async def start_order(callback: CallbackQuery, state: FSMContext):
     """Buyurtma jarayonini boshlash"""
-    global MEDICINES
     med_id = callback.data[6:]  # 'order_' prefixini olib tashlash
     
-    # Reload medicines from database if not found
-    if med_id not in MEDICINES:
-        logging.warning(f"Medicine {med_id} not found in cache, reloading from database")
-        try:
-            MEDICINES = await load_medicines()
-            logging.info(f"Reloaded {len(MEDICINES)} medicines from database")
-        except Exception as e:
-            logging.error(f"Failed to reload medicines: {e}")
-    
-    if med_id not in MEDICINES:
-        logging.error(f"Medicine {med_id} still not found after reload. Available: {list(MEDICINES.keys())}")
+    if await catalog.lookup(med_id) is None:
+        logger.warning("Medicine %s not found in catalog version %s", med_id, catalog.version)
         await callback.answer("Dori topilmadi. Iltimos, qaytadan urinib ko'ring.")
         return
     
@@ -443,19 +789,14 @@ async def process_months_selection(callback: CallbackQuery, state: FSMContext):
     # To'lov ma'lumotlarini ko'rsatish
     med_data = await state.get_data()
     med_id = med_data.get('selected_medicine')
-    med = MEDICINES.get(med_id, {})
+    med = catalog.get(med_id, UNKNOWN_MEDICINE)
     
-    # Umumiy narxni hisoblash (soddalashtirilgan)
-    price_str = med.get('price', '0').replace(',', '').split()[0]
-    try:
-        price = int(price_str) * months
-        total_price = f"{price:,} UZS"
-    except ValueError:
-        total_price = f"{months} x {med.get('price', 'N/A')}"
+    # Umumiy narx
+    total_price = med.total_text(months)
     
     payment_text = (
         f"💳 <b>To'lov ma'lumotlari</b>\n\n"
-        f"🔹 Dori: {med.get('name', 'N/A')}\n"
+        f"🔹 Dori: {med.name}\n"
         f"🔹 Muddat: {months} oy\n"
         f"🔹 Umumiy summa: {total_price}\n\n"
         f"Iltimos, summani bizning kartaga o'tkazing:\n"
@@ -465,10 +806,7 @@ async def process_months_selection(callback: CallbackQuery, state: FSMContext):
     
     await callback.message.answer(
         payment_text,
-        reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text='📤 Chek yuklash', callback_data='upload_receipt')],
-            [InlineKeyboardButton(text='🔙 Bekor qilish', callback_data='cancel_order')]
-        ]),
+        reply_markup=get_payment_keyboard(),
         parse_mode='HTML'
     )
     
@@ -489,19 +827,14 @@ async def process_custom_months(message: Message, state: FSMContext):
         # To'lov ma'lumotlarini ko'rsatish
         med_data = await state.get_data()
         med_id = med_data.get('selected_medicine')
-        med = MEDICINES.get(med_id, {})
+        med = catalog.get(med_id, UNKNOWN_MEDICINE)
         
-        # Umumiy narxni hisoblash (soddalashtirilgan)
-        price_str = med.get('price', '0').replace(',', '').split()[0]
-        try:
-            price = int(price_str) * months
-            total_price = f"{price:,} UZS"
-        except ValueError:
-            total_price = f"{months} x {med.get('price', 'N/A')}"
+        # Umumiy narx
+        total_price = med.total_text(months)
         
         payment_text = (
             f"💳 <b>To'lov ma'lumotlari</b>\n\n"
-            f"🔹 Dori: {med.get('name', 'N/A')}\n"
+            f"🔹 Dori: {med.name}\n"
             f"🔹 Muddat: {months} oy\n"
             f"🔹 Umumiy summa: {total_price}\n\n"
             f"Iltimos, summani bizning kartaga o'tkazing:\n"
@@ -511,10 +844,7 @@ async def process_custom_months(message: Message, state: FSMContext):
         
         await message.answer(
             payment_text,
-            reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text='📤 Chek yuklash', callback_data='upload_receipt')],
-                [InlineKeyboardButton(text='🔙 Bekor qilish', callback_data='cancel_order')]
-            ]),
+            reply_markup=get_payment_keyboard(),
             parse_mode='HTML'
         )
         
@@ -538,19 +868,11 @@ async def process_receipt_photo(message: Message, state: FSMContext):
     await state.update_data(receipt_photo_id=photo.file_id)
     
     # Yetkazib berish joylashuvini so'rash
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [
-            InlineKeyboardButton(text='📍 Toshkent shahri', callback_data='location_tashkent'),
-            InlineKeyboardButton(text='📍 Boshqa viloyat', callback_data='location_other')
-        ],
-        [InlineKeyboardButton(text='🔙 Bekor qilish', callback_data='cancel_order')]
-    ])
-    
     await message.answer(
         "📍 Buyurtmangizni qayerga yetkazib beramiz?\n\n"
         "📝 <b>Eslatma:</b> Toshkent shahridagi buyurtmalarni o'zimiz yetkazib beramiz. "
         "Viloyatlarga esa BTS pochta xizmati orqali yuboramiz. Xaridingiz uchun rahmat!",
-        reply_markup=keyboard,
+        reply_markup=get_delivery_region_keyboard(),
         parse_mode='HTML'
     )
     await state.set_state(OrderStates.waiting_for_location)
@@ -607,7 +929,7 @@ async def show_order_summary(message: Message, state: FSMContext):
     """Tasdiqlash uchun buyurtma xulosasini ko'rsatish"""
     data = await state.get_data()
     med_id = data.get('selected_medicine')
-    med = MEDICINES.get(med_id, {})
+    med = catalog.get(med_id, UNKNOWN_MEDICINE)
     months = data.get('months', 1)
     
     # Yetkazib berish ma'lumotlarini olish
@@ -618,17 +940,12 @@ async def show_order_summary(message: Message, state: FSMContext):
     else:
         delivery_info = "📍 <b>Yetkazib berish:</b> Belgilanmagan"
     
-    # Umumiy narxni hisoblash (soddalashtirilgan)
-    price_str = med.get('price', '0').replace(',', '').split()[0]
-    try:
-        price = int(price_str) * months
-        total_price = f"{price:,} UZS"
-    except ValueError:
-        total_price = f"{months} x {med.get('price', 'N/A')}"
+    # Umumiy narx
+    total_price = med.total_text(months)
     
     summary_text = (
         "📋 <b>Buyurtma xulosasi</b>\n\n"
-        f"💊 <b>Dori:</b> {med.get('name', 'N/A')}\n"
+        f"💊 <b>Dori:</b> {med.name}\n"
         f"⏳ <b>Muddat:</b> {months} oy\n"
         f"💰 <b>Umumiy summa:</b> {total_price}\n\n"
         f"{delivery_info}\n"
@@ -645,88 +962,153 @@ async def show_order_summary(message: Message, state: FSMContext):
 # Removed order keyboard function - no buttons needed
 
 async def send_order_to_channel(order_data: dict, bot: Bot):
-    """Buyurtma tafsilotlarini sozlangan kanalga yuborish"""
-    try:
-        logging.info(f"Attempting to send order {order_data['order_id']} to channel {ORDER_CHANNEL}")
-        
-        # Buyurtma tafsilotlarini formatlash
-        delivery_info = order_data.get('delivery_info', {})
-        region = delivery_info.get('region', 'N/A')
-        district = delivery_info.get('district', 'N/A')
-        phone = delivery_info.get('phone', 'N/A')
-        
-        # Build address string
-        if region == 'Toshkent':
-            address = "Toshkent shahri (GPS joylashuv ulashilgan)"
-        elif region != 'N/A' and district != 'N/A':
-            address = f"{region}, {district}"
-        else:
-            address = "Manzil kiritilmagan"
-        
-        order_text = (
-            "🆕 <b>YANGI BUYURTMA QABUL QILINDI</b>\n\n"
-            f"🆔 <b>Buyurtma ID:</b> <code>{order_data['order_id']}</code>\n"
-            f"👤 <b>Mijoz:</b> {order_data.get('full_name', 'N/A')} (@{order_data.get('username', 'N/A')})\n"
-            f"📞 <b>Telefon:</b> {phone}\n\n"
-            f"💊 <b>Dori:</b> {order_data.get('medicine', 'N/A')}\n"
-            f"⏳ <b>Muddat:</b> {order_data.get('months', 1)} oy\n"
-            f"💰 <b>Summa:</b> {order_data.get('price', 'N/A')}\n\n"
-            f"📍 <b>Yetkazib berish:</b> {address}\n\n"
-            f"📅 <b>Sana:</b> {order_data.get('timestamp', 'Nomalum')}"
+    """Buyurtma tafsilotlarini sozlangan kanalga yuborish (xatolik chaqiruvchiga qaytariladi)"""
+    order_id = order_data['order_id']
+    logger.debug("Sending order %s to channel %s", order_id, ORDER_CHANNEL)
+    
+    # Buyurtma tafsilotlarini formatlash
+    delivery_info = order_data.get('delivery_info', {})
+    region = delivery_info.get('region', 'N/A')
+    district = delivery_info.get('district', 'N/A')
+    phone = delivery_info.get('phone', 'N/A')
+    
+    total = order_data.get('total_minor')
+    total_text = format_price(total) if total is not None else order_data.get('price', 'N/A')
+    
+    # Build address string
+    if region == 'Toshkent':
+        address = "Toshkent shahri (GPS joylashuv ulashilgan)"
+    elif region != 'N/A' and district != 'N/A':
+        address = f"{region}, {district}"
+    else:
+        address = "Manzil kiritilmagan"
+    
+    order_text = (
+        "🆕 <b>YANGI BUYURTMA QABUL QILINDI</b>\n\n"
+        f"🆔 <b>Buyurtma ID:</b> <code>{order_data['order_id']}</code>\n"
+        f"👤 <b>Mijoz:</b> {order_data.get('full_name', 'N/A')} (@{order_data.get('username', 'N/A')})\n"
+        f"📞 <b>Telefon:</b> {phone}\n\n"
+        f"💊 <b>Dori:</b> {order_data.get('medicine', 'N/A')}\n"
+        f"⏳ <b>Muddat:</b> {order_data.get('months', 1)} oy\n"
+        f"💰 <b>Summa:</b> {total_text}\n\n"
+        f"📍 <b>Yetkazib berish:</b> {address}\n\n"
+        f"📅 <b>Sana:</b> {order_data.get('timestamp', 'Nomalum')}"
+    )
+    
+    # Check if GPS location exists for Tashkent orders
+    if region == 'Toshkent' and delivery_info.get('lat') and delivery_info.get('lon') \
+            and not order_data.get('location_sent'):
+        # Send location first
+        await bot.send_location(
+            chat_id=ORDER_CHANNEL,
+            latitude=delivery_info['lat'],
+            longitude=delivery_info['lon']
         )
-        
-        # Kanalga yuborish
-        try:
-            # Check if GPS location exists for Tashkent orders
-            if region == 'Toshkent' and delivery_info.get('lat') and delivery_info.get('lon'):
-                # Send location first
-                await bot.send_location(
-                    chat_id=ORDER_CHANNEL,
-                    latitude=delivery_info['lat'],
-                    longitude=delivery_info['lon']
-                )
-                logging.info("GPS location sent to channel")
-            
-            # Then send order details
-            if order_data.get('receipt_photo_id'):
-                logging.info("Sending order with photo to channel")
-                message = await bot.send_photo(
-                    chat_id=ORDER_CHANNEL,
-                    photo=order_data['receipt_photo_id'],
-                    caption=order_text,
-                    parse_mode='HTML'
-                )
-                logging.info(f"Order sent successfully with photo. Message ID: {message.message_id}")
-            else:
-                logging.info("Sending order without photo to channel")
-                message = await bot.send_message(
-                    chat_id=ORDER_CHANNEL,
-                    text=order_text,
-                    parse_mode='HTML'
-                )
-                logging.info(f"Order sent successfully without photo. Message ID: {message.message_id}")
-                
-        except Exception as e:
-            logging.error(f"Kanalga xabar yuborishda xatolik: {e}")
-            # Try to send error message to admin
-            try:
-                await bot.send_message(
-                    chat_id=ADMIN_IDS[0],
-                    text=f"❌ Kanalga xabar yuborishda xatolik: {e}\n\nKanal: {ORDER_CHANNEL}\nBuyurtma ID: {order_data['order_id']}"
-                )
-            except Exception as admin_error:
-                logging.error(f"Admin ga xabar yuborishda ham xatolik: {admin_error}")
-        
-    except Exception as e:
-        logging.error(f"Buyurtma kanalga yuborishda umumiy xatolik: {e}")
-        # Send error to admin
+        # Qayta urinishda joylashuv ikkinchi marta yuborilmasin
+        order_data['location_sent'] = True
+        logger.debug("GPS location for order %s sent to channel", order_id)
+    
+    # Then send order details
+    if order_data.get('receipt_photo_id'):
         try:
-            await bot.send_message(
-                chat_id=ADMIN_IDS[0],
-                text=f"❌ Buyurtma yuborishda umumiy xatolik: {e}"
+            message = await bot.send_photo(
+                chat_id=ORDER_CHANNEL,
+                photo=order_data['receipt_photo_id'],
+                caption=order_text,
+                parse_mode='HTML'
             )
-        except:
-            pass
+        except TelegramBadRequest as e:
+            # file_id ishlamay qolsa (masalan, bot tokeni almashgan) chekning saqlangan nusxasi yuboriladi
+            stored = await db.get_receipt_image(order_id) if is_broken_photo_error(e) else None
+            if stored is None:
+                raise
+            message = await bot.send_photo(
+                chat_id=ORDER_CHANNEL,
+                photo=image_storage.input_file(stored),
+                caption=order_text,
+                parse_mode='HTML'
+            )
+    else:
+        message = await bot.send_message(
+            chat_id=ORDER_CHANNEL,
+            text=order_text,
+            parse_mode='HTML'
+        )
+    logger.info("Order %s sent to channel, message %s", order_id, message.message_id,
+                extra={'order_id': order_id})
+
+async def deliver_order_notification(order_data: dict):
+    """Outbox ishchisi: buyurtmani kanalga yuborish"""
+    # Kanal xabarlari mijozlarga javoblardan keyin navbatda turadi
+    with send_priority(PRIORITY_LOW):
+        await send_order_to_channel(order_data, bot)
+
+async def report_outbox_failure(kind: str, payload: dict, error: BaseException):
+    """Yuborib bo'lmagan xabar haqida adminni ogohlantirish"""
+    await bot.send_message(
+        chat_id=ADMIN_IDS[0],
+        text=f"❌ Kanalga xabar yuborishda xatolik: {error}\n\nKanal: {ORDER_CHANNEL}\nBuyurtma ID: {payload.get('order_id')}"
+    )
+
+async def deliver_order_reassigned(payload: dict):
+    """Outbox ishchisi: buyurtma boshqa raqam bilan saqlangani haqida mijoz va kanalga xabar berish"""
+    text = (
+        f"ℹ️ Buyurtma <code>{payload['order_id']}</code> raqami band bo'lgani uchun "
+        f"<code>{payload['new_id']}</code> raqami bilan saqlandi."
+    )
+    # Mijozga yuborilgani qayd etiladi, qayta urinishda takrorlanmaydi
+    if not payload.get('customer_notified'):
+        try:
+            await bot.send_message(payload['user_id'], text + "\nIltimos, shu raqamdan foydalaning.",
+                                   parse_mode='HTML')
+        except TelegramForbiddenError:
+            logger.warning("Customer %s blocked the bot; new ID of order %s not sent",
+                           payload['user_id'], payload['order_id'])
+        payload['customer_notified'] = True
+    with send_priority(PRIORITY_LOW):
+        await bot.send_message(ORDER_CHANNEL, text, parse_mode='HTML')
+
+async def report_order_reassigned(order: dict, new_id: str):
+    """Jurnal: buyurtma bazada yangi raqam bilan saqlandi"""
+    await outbox.enqueue('order_reassigned', {
+        'order_id': order['order_id'], 'new_id': new_id, 'user_id': order['user_id'],
+    })
+
+outbox.register('order_channel', deliver_order_notification)
+outbox.register('order_reassigned', deliver_order_reassigned)
+order_journal.on_reassigned = report_order_reassigned
+outbox.on_failure = report_outbox_failure
+
+async def store_medicine_photo(job: dict, stored: StoredImage):
+    """Saqlangan dori rasmini images jadvaliga yozish"""
+    med = catalog.get(job['owner_id'])
+    # Shu orada rasm almashtirilgan yoki dori o'chirilgan bo'lsa, eski nusxa yozilmaydi
+    if med is None or med.photo != job['file_id']:
+        return
+    await media.attach(med, stored)
+
+async def store_receipt_photo(job: dict, stored: StoredImage):
+    """Saqlangan chek rasmini images jadvaliga yozish"""
+    await db.save_receipt_image(job['owner_id'], job['file_id'], job.get('uploaded_by'), stored)
+
+image_pipeline.register('medicine_photo', store_medicine_photo)
+image_pipeline.register('receipt_photo', store_receipt_photo)
+
+async def queue_medicine_photo(med_id: str, file_id: str, admin_id: int):
+    """Admin yuklagan rasmni fonda omborga saqlashga navbatga qo'yish"""
+    # Pillow bo'lmasa nusxa siqilmaydi: asl rasmni ikkinchi marta yuklashdan foyda yo'q
+    if not HAS_PILLOW:
+        return
+    try:
+        await image_pipeline.submit('medicine_photo', file_id, med_id, admin_id)
+    except Exception as e:
+        logger.error("Error queueing photo of medicine %s for storage: %s", med_id, e)
+
+# Baza vaqtida javob bermaganda yozuv saqlangan-saqlanmagani noma'lum bo'ladi
+WRITE_UNKNOWN_TEXT = (
+    "⏳ Baza vaqtida javob bermadi, o'zgarish saqlangan-saqlanmagani noma'lum.\n"
+    "Dorilar ro'yxatini tekshiring va kerak bo'lsa qaytadan urinib ko'ring."
+)
 
 async def update_order_status(order_id: str, status: str, message: Message):
     """Update order status in database"""
@@ -735,10 +1117,7 @@ async def update_order_status(order_id: str, status: str, message: Message):
         success = await db.update_order_status(order_id, status)
         
         if success:
-            # Update local orders dict
-            if order_id in orders:
-                orders[order_id]['status'] = status
-                logging.info(f"Updated order {order_id} status to {status}")
+            logger.info("Updated order %s status to %s", order_id, status)
             
             # Remove buttons from channel message
             try:
@@ -746,43 +1125,28 @@ async def update_order_status(order_id: str, status: str, message: Message):
                 status_text = "✅ Yetkazib berildi" if status == "shipped" else "❌ Bekor qilindi"
                 await message.edit_text(message.text + f"\n\n{status_text}")
             except Exception as e:
-                logging.error(f"Failed to update channel message: {e}")
+                logger.error("Failed to update channel message: %s", e)
                 
+        elif success is None:
+            # Holat yozilgan bo'lishi ham mumkin: tugmalar qoldiriladi, qayta bosish xavfsiz
+            logger.warning("Status of order %s is unknown after a database timeout", order_id)
         else:
-            logging.error(f"Failed to update order {order_id} in database")
+            logger.error("Failed to update order %s in database", order_id)
             
     except Exception as e:
-        logging.error(f"Error updating order status: {e}")
+        logger.error("Error updating order status: %s", e)
 
 # Removed order action handlers - no buttons needed
 
 async def show_medicines_for_order(message: Message):
     """Show list of medicines for ordering"""
-    if not MEDICINES:
+    if not catalog:
         await message.answer("❌ Hozirda mavjud dori-darmonlar ro'yxati topilmadi.")
         return
     
-    # Create a list of medicine buttons
-    buttons = []
-    for med_id, med in MEDICINES.items():
-        buttons.append([
-            InlineKeyboardButton(
-                text=f"{med.get('name')} - {med.get('price', 'Narx belgilanmagan')}",
-                callback_data=f"order_{med_id}"
-            )
-        ])
-    
-    # Add back button
-    buttons.append([
-        InlineKeyboardButton(
-            text="🔙 Orqaga",
-            callback_data="back_to_main"
-        )
-    ])
-    
     await message.answer(
         "🛒 <b>Buyurtma berish:</b>\n\nQaysi dorini buyurtma qilmoqchisiz?",
-        reply_markup=InlineKeyboardMarkup(inline_keyboard=buttons),
+        reply_markup=get_order_medicines_menu(),
         parse_mode='HTML'
     )
 
@@ -824,12 +1188,60 @@ async def test_channel_command(message: Message):
     }
     
     await message.answer("🧪 Test buyurtma kanalga yuborilmoqda...")
-    await send_order_to_channel(test_order, bot)
+    try:
+        await send_order_to_channel(test_order, bot)
+        await message.answer("✅ Test buyurtma kanalga yuborildi")
+    except Exception as e:
+        logger.error("Kanalga xabar yuborishda xatolik: %s", e)
+        await message.answer(f"❌ Kanalga xabar yuborishda xatolik: {e}\n\nKanal: {ORDER_CHANNEL}")
+
+def format_perf_section(title: str, rows: List[Dict], label: str) -> str:
+    """Bitta bo'lim: eng ko'p vaqt olganlar, ms da"""
+    if not rows:
+        return f"{title}\n  • ma'lumot yo'q\n"
+    text = f"{title}\n"
+    for row in rows:
+        text += (
+            f"  • {row['labels'].get(label, '-')}: {row['count']} ta, "
+            f"p50 {row['p50'] * 1000:.0f} ms, p95 {row['p95'] * 1000:.0f} ms, "
+            f"max {row['max'] * 1000:.0f} ms"
+        )
+        if row['errors']:
+            text += f", xato {row['errors']}"
+        if row['in_flight']:
+            text += f", hozir {row['in_flight']}"
+        text += "\n"
+    return text
+
+# Ishlash ko'rsatkichlari (faqat adminlar uchun)
+async def cmd_perf(message: Message):
+    """Handle /perf command - slowest handlers, DB calls and Bot API methods"""
+    if message.from_user.id not in ADMIN_IDS:
+        await message.answer("❌ Sizda admin huquqlari yo'q!")
+        return
+    
+    response = "⏱ Ishlash ko'rsatkichlari (jami vaqt bo'yicha)\n\n"
+    response += format_perf_section("🧩 Handlerlar:", metrics.summary('bot_handler'), 'handler') + "\n"
+    response += format_perf_section("🔘 Tugmalar:", metrics.summary('bot_callback'), 'prefix') + "\n"
+    response += format_perf_section("🗄 Baza:", metrics.summary('bot_db'), 'method') + "\n"
+    response += format_perf_section("📡 Bot API:", metrics.summary('bot_api'), 'method') + "\n"
+    queue = update_scheduler.stats()
+    response += (
+        f"📥 Navbat: {queue['in_flight']} bajarilmoqda, {queue['waiting']} kutmoqda, "
+        f"{queue['shed']} ta so'rov tashlab yuborilgan\n"
+    )
+    outgoing = rate_limiter.stats()
+    response += f"📤 Chiquvchi xabarlar navbati: {outgoing['queue_depth']}"
+    for lane, values in outgoing['lanes'].items():
+        response += f"\n  {lane}: {values['queued']} kutmoqda, p99 {values['wait_p99_ms']} ms"
+    response += "\n"
+    await message.answer(response)
 
 # Command handlers
 dp.message.register(cmd_start, CommandStart())
 dp.message.register(cmd_admin, Command("admin"))
 dp.message.register(test_channel_command, Command("test_channel"))
+dp.message.register(cmd_perf, Command("perf"))
 dp.message.register(show_address, F.text == "📍 Manzil")
 dp.message.register(show_phone, F.text == "📞 Bog'lanish")
 dp.message.register(show_medicines, F.text == "💊 Dorilar")
@@ -857,15 +1269,24 @@ async def process_medicine_contraindications(message: Message, state: FSMContext
     await message.answer("✅ Qo'llanilish cheklovlari saqlandi.\n\nDori narxini kiriting (masalan, 15000 so'm):")
     await state.set_state(MedicineStates.waiting_for_medicine_price)
 
+PRICE_INPUT_ERROR = "❌ Iltimos, faqat raqamlarda kiriting (masalan, 15000 yoki 15000 so'm)"
+
+def normalize_price_input(text: Optional[str]) -> Optional[str]:
+    """Admin kiritgan narxni "15000 so'm" ko'rinishiga keltirish; faqat raqam bo'lmasa None"""
+    compact = (text or '').lower().replace(' ', '').replace('so\'m', '').replace('sum', '')
+    if not (compact.isascii() and compact.isdigit()):
+        return None
+    return f"{int(compact)} so'm"
+
 @dp.message(MedicineStates.waiting_for_medicine_price)
 async def process_medicine_price(message: Message, state: FSMContext):
     """Process medicine price and ask for photo"""
-    if not message.text.replace(' ', '').replace('so\'m', '').replace('sum', '').isdigit():
-        await message.answer("❌ Iltimos, faqat raqamlarda kiriting (masalan, 15000 yoki 15000 so'm)")
+    price = normalize_price_input(message.text)
+    if price is None:
+        await message.answer(PRICE_INPUT_ERROR)
         return
     
-    price = ''.join(c for c in message.text if c.isdigit())
-    await state.update_data(price=f"{price} so'm")
+    await state.update_data(price=price)
     await message.answer("✅ Narx saqlandi.\n\nDori rasmini yuboring (ixtiyoriy):")
     await state.set_state(MedicineStates.waiting_for_medicine_photo)
 
@@ -881,19 +1302,10 @@ async def process_medicine_photo(message: Message, state: FSMContext):
         photo = message.photo[-1]  # Get highest resolution
         photo_id = photo.file_id
         
-        # Optional: Get file info for validation
-        try:
-            file_info = await bot.get_file(photo_id)
-            file_size = file_info.file_size
-            
-            # Check if file size is reasonable (max 20MB for Telegram)
-            if file_size and file_size > 20 * 1024 * 1024:
-                await message.answer("❌ Rasm hajmi juda katta. Iltimos, kichikroq rasm yuklang.")
-                return
-                
-        except Exception as e:
-            logging.warning(f"Could not get file info: {e}")
-            # Continue anyway, as this is not critical
+        # Hajm PhotoSize da keladi, alohida getFile so'rovi kerak emas (botlar 20MB gacha yuklab oladi)
+        if photo.file_size and photo.file_size > MAX_DOWNLOAD_SIZE:
+            await message.answer("❌ Rasm hajmi juda katta. Iltimos, kichikroq rasm yuklang.")
+            return
     elif message.text and message.text.lower() in ['yo\'q', 'yoq', 'skip', 'o\'tkazib yuborish']:
         # Allow skipping photo upload
         photo_id = None
@@ -912,6 +1324,7 @@ async def process_medicine_photo(message: Message, state: FSMContext):
         'benefits': data.get('benefits', ''),
         'contraindications': data.get('contraindications', ''),
         'price': data.get('price', 'Narx kiritilmagan'),
+        'price_minor': parse_price(data.get('price')),
         'photo': photo_id if photo_id else None,
         'description': data.get('benefits', '')  # Using benefits as description for now
     }
@@ -922,7 +1335,10 @@ async def process_medicine_photo(message: Message, state: FSMContext):
         
         if success:
             # Update in-memory cache
-            MEDICINES[med_id] = medicine_data
+            catalog.put(med_id, Medicine.from_row(medicine_data))
+            media.remember(catalog[med_id], message.photo)
+            if photo_id:
+                await queue_medicine_photo(med_id, photo_id, message.from_user.id)
             
             # Send confirmation message with medicine details
             photo_status = "📷 Rasm bilan" if photo_id else "📝 Rasmsiz"
@@ -946,13 +1362,15 @@ async def process_medicine_photo(message: Message, state: FSMContext):
                     response,
                     reply_markup=get_admin_keyboard()
                 )
+        elif success is None:
+            await message.answer(WRITE_UNKNOWN_TEXT, reply_markup=get_admin_keyboard())
         else:
             await message.answer(
                 "❌ Xatolik yuz berdi. Dori qo'shishda xatolik yuz berdi.",
                 reply_markup=get_admin_keyboard()
             )
     except Exception as e:
-        logging.error(f"Error adding medicine: {e}")
+        logger.error("Error adding medicine: %s", e)
         await message.answer(
             "❌ Xatolik yuz berdi. Iltimos, qaytadan urinib ko'ring.",
             reply_markup=get_admin_keyboard()
@@ -972,10 +1390,14 @@ async def confirm_order(callback: CallbackQuery, state: FSMContext):
     """Handle order confirmation"""
     data = await state.get_data()
     med_id = data.get('selected_medicine')
-    med = MEDICINES.get(med_id, {})
+    if not med_id:
+        # Holat tozalangan: buyurtma avvalgi bosishda qabul qilingan
+        await callback.answer("✅ Buyurtmangiz allaqachon qabul qilingan")
+        return
+    med = catalog.get(med_id, UNKNOWN_MEDICINE)
     
-    # Generate order ID
-    order_id = ''.join(random.choices(string.ascii_uppercase + string.digits, k=8))
+    # Bir xil xulosa xabaridagi har bir bosish bir xil buyurtma ID sini beradi
+    order_id = checkout_order_id(callback.message.chat.id, callback.message.message_id)
     
     # Prepare order data
     order_data = {
@@ -983,9 +1405,12 @@ async def confirm_order(callback: CallbackQuery, state: FSMContext):
         'user_id': callback.from_user.id,
         'username': callback.from_user.username,
         'full_name': callback.from_user.full_name,
-        'medicine': med.get('name', 'N/A'),
+        'medicine': med.name,
         'months': data.get('months', 1),
-        'price': med.get('price', 'N/A'),
+        'price': med.price_label or 'N/A',
+        # Narx buyurtma paytida qayd etiladi: keyinchalik katalogdagi narx o'zgarsa ham summa o'zgarmaydi
+        'unit_price_minor': med.price_minor,
+        'total_minor': med.total_minor(data.get('months', 1)),
         'status': 'new',
         'timestamp': datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
         'delivery_info': {
@@ -999,8 +1424,33 @@ async def confirm_order(callback: CallbackQuery, state: FSMContext):
         'receipt_photo_id': data.get('receipt_photo_id')
     }
     
-    # Save order to database
-    await db.add_order(order_data)
+    # Buyurtma jurnalga yoziladi; bazaga yozishni fon jarayoni bajaradi
+    try:
+        created = await order_journal.append(order_data)
+    except Exception as e:
+        logger.error("Error saving order %s: %s", order_id, e)
+        await callback.answer(
+            "❌ Buyurtmani saqlashda xatolik yuz berdi. Iltimos, qaytadan urinib ko'ring.", show_alert=True
+        )
+        return
+    if not created:
+        await callback.answer("✅ Buyurtmangiz allaqachon qabul qilingan")
+        return
+    
+    # Kanalga yuborish Telegram chaqiruvlaridan oldin navbatga qo'yiladi:
+    # ular xato bersa ham xabarnoma yo'qolmaydi, mijoz esa kutib qolmaydi
+    try:
+        await outbox.enqueue('order_channel', order_data)
+    except Exception as e:
+        logger.error("Buyurtmani navbatga qo'yishda xatolik: %s", e)
+    
+    # Chek rasmi fonda siqilib omborga saqlanadi
+    if order_data['receipt_photo_id']:
+        try:
+            await image_pipeline.submit('receipt_photo', order_data['receipt_photo_id'], order_id,
+                                        callback.from_user.id)
+        except Exception as e:
+            logger.error("Error queueing receipt of order %s for storage: %s", order_id, e)
     
     # Send confirmation to user
     await callback.message.edit_text(
@@ -1017,9 +1467,6 @@ async def confirm_order(callback: CallbackQuery, state: FSMContext):
         reply_markup=get_main_menu()
     )
     
-    # Send order to channel
-    await send_order_to_channel(order_data, bot)
-    
     # Clear state
     await state.clear()
     await callback.answer()
@@ -1042,75 +1489,202 @@ async def cancel_order(callback: CallbackQuery, state: FSMContext):
     await callback.answer()
 
 # Admin callback handlers
+ADMIN_ORDERS_PAGE_SIZE = 5
+
+def get_admin_orders_keyboard(has_prev: bool, has_next: bool, status: Optional[str]) -> InlineKeyboardMarkup:
+    """Buyurtmalar sahifasi uchun navigatsiya klaviaturasi"""
+    nav = []
+    if has_prev:
+        nav.append(InlineKeyboardButton(text='⬅️ Oldingi', callback_data='orders_page_prev'))
+    if has_next:
+        nav.append(InlineKeyboardButton(text='Keyingi ➡️', callback_data='orders_page_next'))
+    status_filter = (
+        InlineKeyboardButton(text='📋 Hammasi', callback_data='orders_status_all') if status
+        else InlineKeyboardButton(text='🆕 Faqat yangilari', callback_data='orders_status_new')
+    )
+    buttons = [nav] if nav else []
+    buttons.append([status_filter])
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+async def render_admin_orders_page(callback: CallbackQuery, state: FSMContext, edit: bool):
+    """Buyurtmalarning joriy sahifasini ko'rsatish.
+
+    Sahifa kursorlari admin FSM ma'lumotlarida saqlanadi: ``orders_cursors[i]``
+    i-sahifaning boshlanish kursori (birinchi sahifa uchun None).
+    """
+    data = await state.get_data()
+    cursors = data.get('orders_cursors', [None])
+    page = data.get('orders_page', 0)
+    status = data.get('orders_status')
+    
+    page_orders, next_cursor = await db.list_orders(
+        limit=ADMIN_ORDERS_PAGE_SIZE, cursor=cursors[page], status=status
+    )
+    if not page_orders and page == 0:
+        if status is None:
+            await callback.message.answer("📭 Hozircha buyurtmalar mavjud emas!")
+            return
+        # Filtr natijasi bo'sh: filtrni bekor qilish tugmasi baribir ko'rsatiladi
+        text = "📭 Bu holatdagi buyurtmalar yo'q."
+        keyboard = get_admin_orders_keyboard(False, False, status)
+        if edit:
+            await callback.message.edit_text(text, reply_markup=keyboard)
+        else:
+            await callback.message.answer(text, reply_markup=keyboard)
+        return
+    
+    if next_cursor and len(cursors) == page + 1:
+        cursors.append(next_cursor)
+    await state.update_data(orders_cursors=cursors)
+    
+    unknown = "Noma'lum"
+    response = f"📋 So'ngi buyurtmalar ({page + 1}-sahifa):\n\n"
+    for order in page_orders:
+        response += (
+            f"🆔 Buyurtma: {order.order_id}\n"
+            f"👤 Mijoz: {order.full_name or unknown}\n"
+            f"💊 Dori: {order.medicine or unknown}\n"
+            f"📞 Tel: {order.phone or unknown}\n"
+            f"📅 Sana: {order.created_at or unknown}\n"
+            f"💰 Summa: {order.total_text}\n"
+            f"📦 Holati: {order.status}\n\n"
+        )
+    
+    keyboard = get_admin_orders_keyboard(page > 0, next_cursor is not None, status)
+    if edit:
+        await callback.message.edit_text(response, reply_markup=keyboard)
+    else:
+        await callback.message.answer(response, reply_markup=keyboard)
+
 @dp.callback_query(F.data == 'admin_orders')
-async def admin_orders(callback: CallbackQuery):
+async def admin_orders(callback: CallbackQuery, state: FSMContext):
     """Show admin orders"""
     if callback.from_user.id not in ADMIN_IDS:
         await callback.answer("❌ Sizda admin huquqlari yo'q!")
         return
     
     try:
-        # Get all orders from the database
-        orders = await db.get_all_orders()
-        if not orders:
-            await callback.message.answer("📭 Hozircha buyurtmalar mavjud emas!")
-            return
-            
-        # Show orders with proper data structure
-        response = "📋 So'ngi buyurtmalar:\n\n"
-        order_count = 0
-        for order_id, order in orders.items():
-            if order_count >= 5:  # Limit to 5 orders
-                break
-            
-            customer_name = order.get('full_name', "Noma'lum")
-            phone = order.get('delivery_info', {}).get('phone', "Noma'lum")
-            date = order.get('timestamp', "Noma'lum")
-            status = order.get('status', 'new')
-            medicine = order.get('medicine', 'Noma\'lum')
-            
-            response += (
-                f"🆔 Buyurtma: {order_id}\n"
-                f"👤 Mijoz: {customer_name}\n"
-                f"💊 Dori: {medicine}\n"
-                f"📞 Tel: {phone}\n"
-                f"📅 Sana: {date}\n"
-                f"📦 Holati: {status}\n\n"
-            )
-            order_count += 1
-        
-        await callback.message.answer(response)
+        await state.update_data(orders_cursors=[None], orders_page=0, orders_status=None)
+        await render_admin_orders_page(callback, state, edit=False)
         await callback.answer()
     except Exception as e:
-        logging.error(f"Xatolik yuz berdi: {e}")
+        logger.error("Xatolik yuz berdi: %s", e)
         await callback.message.answer("❌ Xatolik yuz berdi. Iltimos, qaytadan urinib ko'ring.")
         await callback.answer()
 
+@dp.callback_query(F.data.startswith('orders_page_') | F.data.startswith('orders_status_'))
+async def admin_orders_navigate(callback: CallbackQuery, state: FSMContext):
+    """Buyurtmalar sahifalari bo'ylab harakatlanish va holat bo'yicha filtrlash"""
+    if callback.from_user.id not in ADMIN_IDS:
+        await callback.answer("❌ Sizda admin huquqlari yo'q!")
+        return
+    
+    data = await state.get_data()
+    page = data.get('orders_page', 0)
+    cursors = data.get('orders_cursors', [None])
+    
+    if callback.data == 'orders_page_next' and page + 1 < len(cursors):
+        await state.update_data(orders_page=page + 1)
+    elif callback.data == 'orders_page_prev' and page > 0:
+        await state.update_data(orders_page=page - 1)
+    elif callback.data.startswith('orders_status_'):
+        status = callback.data[len('orders_status_'):]
+        await state.update_data(
+            orders_cursors=[None], orders_page=0, orders_status=None if status == 'all' else status
+        )
+    
+    try:
+        await render_admin_orders_page(callback, state, edit=True)
+    except Exception as e:
+        logger.error("Xatolik yuz berdi: %s", e)
+    await callback.answer()
+
+# Admin dorilar ro'yxatlari: sahifalab, bazadan faqat ko'rsatiladigan qatorlar olinadi
+ADMIN_MEDICINES_PAGE_SIZE = 20
+ADMIN_MEDICINE_LISTS = {
+    'products': "💊 Mavjud dorilar ro'yxati",
+    'edit': "✏️ Tahrirlash uchun dori ID sini yuboring",
+    'delete': "🗑️ O'chirish uchun dori ID sini yuboring",
+}
+
+def format_admin_medicine(mode: str, med: Medicine) -> str:
+    """Admin ro'yxatidagi bitta dori qatori"""
+    if mode == 'products':
+        photo_icon = ("⚠️" if media.is_broken(med) else "📷") if med.photo else "📝"
+        return (f"{photo_icon} {med.name} - {med.price_text or 'Narx kiritilmagan'}\n"
+                f"   ID: <code>{med.id}</code>\n\n")
+    return f"ID: <code>{med.id}</code> - {med.name}\n"
+
+async def render_admin_medicines_page(callback: CallbackQuery, state: FSMContext, mode: str, edit: bool) -> bool:
+    """Admin dorilar ro'yxatining joriy sahifasi; dorilar bo'lmasa False.
+
+    Sahifa kursorlari buyurtmalar ro'yxatidagi kabi FSM ma'lumotlarida saqlanadi.
+    """
+    data = await state.get_data()
+    cursors = data.get('meds_cursors', [None])
+    page = data.get('meds_page', 0)
+    
+    medicines, next_cursor = await db.list_medicines(limit=ADMIN_MEDICINES_PAGE_SIZE, cursor=cursors[page])
+    if not medicines and page == 0:
+        await callback.message.answer("❌ Hozircha dorilar mavjud emas!")
+        return False
+    
+    if next_cursor and len(cursors) == page + 1:
+        cursors.append(next_cursor)
+    await state.update_data(meds_cursors=cursors)
+    
+    response = f"{ADMIN_MEDICINE_LISTS[mode]} ({page + 1}-sahifa):\n\n"
+    response += ''.join(format_admin_medicine(mode, med) for med in medicines)
+    nav = []
+    if page > 0:
+        nav.append(InlineKeyboardButton(text='⬅️ Oldingi', callback_data=f'meds_prev_{mode}'))
+    if next_cursor:
+        nav.append(InlineKeyboardButton(text='Keyingi ➡️', callback_data=f'meds_next_{mode}'))
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[nav]) if nav else None
+    if edit:
+        await callback.message.edit_text(response, reply_markup=keyboard, parse_mode='HTML')
+    else:
+        await callback.message.answer(response, reply_markup=keyboard, parse_mode='HTML')
+    return True
+
+@dp.callback_query(F.data.startswith('meds_prev_') | F.data.startswith('meds_next_'))
+async def admin_medicines_navigate(callback: CallbackQuery, state: FSMContext):
+    """Admin dorilar ro'yxati sahifalari bo'ylab harakatlanish"""
+    if callback.from_user.id not in ADMIN_IDS:
+        await callback.answer("❌ Sizda admin huquqlari yo'q!")
+        return
+    
+    direction, mode = callback.data[len('meds_'):].split('_', 1)
+    if mode not in ADMIN_MEDICINE_LISTS:
+        await callback.answer()
+        return
+    data = await state.get_data()
+    page = data.get('meds_page', 0)
+    cursors = data.get('meds_cursors', [None])
+    if direction == 'next' and page + 1 < len(cursors):
+        await state.update_data(meds_page=page + 1)
+    elif direction == 'prev' and page > 0:
+        await state.update_data(meds_page=page - 1)
+    
+    try:
+        await render_admin_medicines_page(callback, state, mode, edit=True)
+    except Exception as e:
+        logger.error("Xatolik yuz berdi: %s", e)
+    await callback.answer()
+
 @dp.callback_query(F.data == 'admin_products')
-async def admin_products(callback: CallbackQuery):
+async def admin_products(callback: CallbackQuery, state: FSMContext):
     """Show admin products"""
     if callback.from_user.id not in ADMIN_IDS:
         await callback.answer("❌ Sizda admin huquqlari yo'q!")
         return
     
     try:
-        # Get all medicines from the database
-        medicines = await db.get_all_medicines()
-        if not medicines:
-            await callback.message.answer("ℹ️ Hozircha dorilar mavjud emas!")
-            return
-            
-        # Show all medicines with photo status
-        response = "💊 Mavjud dorilar ro'yxati:\n\n"
-        for med_id, med in medicines.items():
-            photo_icon = "📷" if med.get('photo') else "📝"
-            response += f"{photo_icon} {med['name']} - {med.get('price', 'Narx kiritilmagan')}\n"
-            response += f"   ID: <code>{med_id}</code>\n\n"
-        
-        await callback.message.answer(response, parse_mode='HTML')
+        await state.update_data(meds_cursors=[None], meds_page=0)
+        await render_admin_medicines_page(callback, state, 'products', edit=False)
         await callback.answer()
     except Exception as e:
-        logging.error(f"Xatolik yuz berdi: {e}")
+        logger.error("Xatolik yuz berdi: %s", e)
         await callback.message.answer("❌ Xatolik yuz berdi. Iltimos, qaytadan urinib ko'ring.")
         await callback.answer()
 
@@ -1132,17 +1706,11 @@ async def edit_medicine_start(callback: CallbackQuery, state: FSMContext):
         await callback.answer("❌ Sizda admin huquqlari yo'q!")
         return
     
-    # Show available medicines with IDs
-    medicines = await db.get_all_medicines()
-    if not medicines:
-        await callback.message.answer("❌ Hozircha dorilar mavjud emas!")
+    # Show available medicines with IDs, one page at a time
+    await state.update_data(meds_cursors=[None], meds_page=0)
+    if not await render_admin_medicines_page(callback, state, 'edit', edit=False):
+        await callback.answer()
         return
-    
-    response = "✏️ Tahrirlash uchun dori ID sini yuboring:\n\n"
-    for med_id, med in medicines.items():
-        response += f"ID: <code>{med_id}</code> - {med['name']}\n"
-    
-    await callback.message.answer(response, parse_mode='HTML')
     await state.set_state(MedicineStates.waiting_for_medicine_id)
     await callback.answer()
 
@@ -1151,7 +1719,7 @@ async def process_medicine_id_for_edit(message: Message, state: FSMContext):
     """Process medicine ID for editing"""
     med_id = message.text.strip()
     
-    if med_id not in MEDICINES:
+    if med_id not in catalog:
         await message.answer("❌ Bunday ID li dori topilmadi. Iltimos, to'g'ri ID kiriting.")
         return
     
@@ -1159,20 +1727,22 @@ async def process_medicine_id_for_edit(message: Message, state: FSMContext):
     await state.update_data(editing_medicine_id=med_id)
     
     # Show current medicine details and editing options
-    med = MEDICINES[med_id]
+    med = catalog[med_id]
     current_info = (
         f"📋 Hozirgi ma'lumotlar:\n\n"
-        f"🏷️ Nomi: {med.get('name', 'N/A')}\n"
-        f"💊 Foydali xususiyatlari: {med.get('benefits', 'N/A')}\n"
-        f"⚠️ Qarshi ko'rsatmalar: {med.get('contraindications', 'N/A')}\n"
-        f"💰 Narxi: {med.get('price', 'N/A')}\n"
-        f"📷 Rasm: {'Mavjud' if med.get('photo') else 'Yoq'}\n\n"
+        f"🏷️ Nomi: {med.name}\n"
+        f"💊 Foydali xususiyatlari: {med.benefits or 'N/A'}\n"
+        f"⚠️ Qarshi ko'rsatmalar: {med.contraindications or 'N/A'}\n"
+        f"💰 Narxi: {med.price_text or 'N/A'}\n"
+        f"📷 Rasm: {'Mavjud' if med.photo else 'Yoq'}\n"
+        f"📂 Kategoriya: {med.category or 'Yoq'}\n\n"
         "Qaysi maydonni tahrirlashni xohlaysiz?\n"
         "1 - Nomi\n"
         "2 - Foydali xususiyatlari\n"
         "3 - Qarshi ko'rsatmalar\n"
         "4 - Narxi\n"
-        "5 - Rasm\n\n"
+        "5 - Rasm\n"
+        "6 - Kategoriya\n\n"
         "Raqamni yuboring:"
     )
     
@@ -1189,11 +1759,12 @@ async def process_field_choice(message: Message, state: FSMContext):
         '2': ('benefits', 'Yangi foydali xususiyatlari'),
         '3': ('contraindications', 'Yangi qarshi ko\'rsatmalar'),
         '4': ('price', 'Yangi narxi'),
-        '5': ('photo', 'Yangi rasm')
+        '5': ('photo', 'Yangi rasm'),
+        '6': ('category', 'Yangi kategoriya')
     }
     
     if choice not in field_map:
-        await message.answer("❌ Iltimos, 1-5 orasidagi raqamni tanlang.")
+        await message.answer("❌ Iltimos, 1-6 orasidagi raqamni tanlang.")
         return
     
     field, prompt = field_map[choice]
@@ -1213,7 +1784,7 @@ async def process_field_edit(message: Message, state: FSMContext):
     med_id = data.get('editing_medicine_id')
     field = data.get('editing_field')
     
-    if not med_id or med_id not in MEDICINES:
+    if not med_id or med_id not in catalog:
         await message.answer("❌ Xatolik yuz berdi. Qaytadan urinib ko'ring.")
         await state.clear()
         return
@@ -1233,6 +1804,14 @@ async def process_field_edit(message: Message, state: FSMContext):
             else:
                 await message.answer("❌ Iltimos, rasm yuboring yoki 'yo'q' deb yozing.")
                 return
+        elif field == 'price':
+            # Narx yangi dori qo'shishdagidek tekshiriladi, noto'g'ri bo'lsa qayta so'raladi
+            new_value = normalize_price_input(message.text)
+            if new_value is None:
+                await message.answer(PRICE_INPUT_ERROR)
+                return
+            update_data['price'] = new_value
+            update_data['price_minor'] = parse_price(new_value)
         else:
             new_value = message.text.strip()
             update_data[field] = new_value
@@ -1242,7 +1821,11 @@ async def process_field_edit(message: Message, state: FSMContext):
         
         if success:
             # Update in-memory cache
-            MEDICINES[med_id].update(update_data)
+            catalog.update(med_id, update_data)
+            if field == 'photo':
+                media.remember(catalog[med_id], message.photo)
+                if update_data['photo']:
+                    await queue_medicine_photo(med_id, update_data['photo'], message.from_user.id)
             
             await message.answer(
                 f"✅ Dori muvaffaqiyatli yangilandi!\n\n"
@@ -1251,13 +1834,15 @@ async def process_field_edit(message: Message, state: FSMContext):
                 f"🔄 Yangi qiymat: {new_value}",
                 reply_markup=get_admin_keyboard()
             )
+        elif success is None:
+            await message.answer(WRITE_UNKNOWN_TEXT, reply_markup=get_admin_keyboard())
         else:
             await message.answer(
                 "❌ Xatolik yuz berdi. Dorini yangilashda muammo bo'ldi.",
                 reply_markup=get_admin_keyboard()
             )
     except Exception as e:
-        logging.error(f"Error updating medicine: {e}")
+        logger.error("Error updating medicine: %s", e)
         await message.answer(
             "❌ Xatolik yuz berdi. Iltimos, qaytadan urinib ko'ring.",
             reply_markup=get_admin_keyboard()
@@ -1272,17 +1857,11 @@ async def delete_medicine_start(callback: CallbackQuery, state: FSMContext):
         await callback.answer("❌ Sizda admin huquqlari yo'q!")
         return
     
-    # Show available medicines with IDs
-    medicines = await db.get_all_medicines()
-    if not medicines:
-        await callback.message.answer("❌ Hozircha dorilar mavjud emas!")
+    # Show available medicines with IDs, one page at a time
+    await state.update_data(meds_cursors=[None], meds_page=0)
+    if not await render_admin_medicines_page(callback, state, 'delete', edit=False):
+        await callback.answer()
         return
-    
-    response = "🗑️ O'chirish uchun dori ID sini yuboring:\n\n"
-    for med_id, med in medicines.items():
-        response += f"ID: <code>{med_id}</code> - {med['name']}\n"
-    
-    await callback.message.answer(response, parse_mode='HTML')
     await state.set_state(MedicineStates.confirming_medicine_deletion)
     await callback.answer()
 
@@ -1291,7 +1870,7 @@ async def process_medicine_deletion(message: Message, state: FSMContext):
     """Process medicine deletion"""
     med_id = message.text.strip()
     
-    if med_id not in MEDICINES:
+    if med_id not in catalog:
         await message.answer("❌ Bunday ID li dori topilmadi. Iltimos, to'g'ri ID kiriting.")
         return
     
@@ -1301,8 +1880,8 @@ async def process_medicine_deletion(message: Message, state: FSMContext):
         
         if success:
             # Remove from in-memory cache
-            medicine_name = MEDICINES[med_id].get('name', 'Noma\'lum')
-            del MEDICINES[med_id]
+            removed = catalog.remove(med_id) or {}
+            medicine_name = removed.name if removed else "Noma'lum"
             
             await message.answer(
                 f"✅ Dori muvaffaqiyatli o'chirildi!\n\n"
@@ -1310,13 +1889,15 @@ async def process_medicine_deletion(message: Message, state: FSMContext):
                 f"🆔 ID: {med_id}",
                 reply_markup=get_admin_keyboard()
             )
+        elif success is None:
+            await message.answer(WRITE_UNKNOWN_TEXT, reply_markup=get_admin_keyboard())
         else:
             await message.answer(
                 "❌ Xatolik yuz berdi. Dorini o'chirishda muammo bo'ldi.",
                 reply_markup=get_admin_keyboard()
             )
     except Exception as e:
-        logging.error(f"Error deleting medicine: {e}")
+        logger.error("Error deleting medicine: %s", e)
         await message.answer(
             "❌ Xatolik yuz berdi. Iltimos, qaytadan urinib ko'ring.",
             reply_markup=get_admin_keyboard()
@@ -1324,6 +1905,45 @@ async def process_medicine_deletion(message: Message, state: FSMContext):
     
     await state.clear()
 
+STATS_PERIOD_LABELS = {'day': 'Bugun', 'week': '7 kun', 'month': '30 kun', 'all': 'Hammasi'}
+
+def get_stats_keyboard(current: str) -> InlineKeyboardMarkup:
+    """Statistika davrini tanlash klaviaturasi"""
+    return InlineKeyboardMarkup(inline_keyboard=[[
+        InlineKeyboardButton(
+            text=f"• {label}" if period == current else label,
+            callback_data=f'stats_{period}'
+        )
+        for period, label in STATS_PERIOD_LABELS.items()
+    ]])
+
+def format_order_stats(stats: Dict, period: str) -> str:
+    """Statistika matnini tayyorlash"""
+    by_status = stats.get('by_status') or {}
+    response = f"📊 Statistika ({STATS_PERIOD_LABELS[period]}):\n\n"
+    response += f"💊 Jami dorilar: {stats.get('total_medicines', 0)}\n"
+    response += f"📦 Jami buyurtmalar: {stats.get('total_orders', 0)}\n"
+    response += f"⏳ Kutilayotgan buyurtmalar: {by_status.get('new', 0)}\n"
+    response += f"💰 Tushum: {stats.get('total_revenue', 0):,} UZS\n"
+    
+    if by_status:
+        response += "\n📦 Holatlar bo'yicha:\n"
+        for status, count in by_status.items():
+            response += f"  • {status}: {count}\n"
+    if stats.get('by_medicine'):
+        response += "\n💊 Dorilar bo'yicha tushum:\n"
+        for row in stats['by_medicine'][:5]:
+            response += f"  • {row['medicine']}: {row['orders']} ta, {row['revenue']:,} UZS\n"
+    if stats.get('by_region'):
+        response += "\n📍 Hududlar bo'yicha:\n"
+        for row in stats['by_region'][:5]:
+            response += f"  • {row['region'] or 'Belgilanmagan'}: {row['orders']} ta\n"
+    if stats.get('by_day'):
+        response += "\n📅 Kunlar bo'yicha:\n"
+        for row in stats['by_day'][:7]:
+            response += f"  • {row['day']}: {row['orders']} ta\n"
+    return response
+
 @dp.callback_query(F.data == 'admin_stats')
 async def admin_stats(callback: CallbackQuery):
     """Show admin statistics"""
@@ -1332,27 +1952,108 @@ async def admin_stats(callback: CallbackQuery):
         return
     
     try:
-        # Get statistics from the database
-        medicines = await db.get_all_medicines()
-        orders = await db.get_all_orders()
-        
-        stats = {
-            'total_medicines': len(medicines),
-            'total_orders': len(orders),
-            'pending_orders': len([o for o in orders.values() if o.get('status') == 'new']),
-        }
-        
-        response = "📊 Statistika:\n\n"
-        response += f"💊 Jami dorilar: {stats['total_medicines']}\n"
-        response += f"📦 Jami buyurtmalar: {stats['total_orders']}\n"
-        response += f"⏳ Kutilayotgan buyurtmalar: {stats['pending_orders']}"
-        
-        await callback.message.answer(response)
+        stats = await db.get_order_stats('all')
+        await callback.message.answer(format_order_stats(stats, 'all'), reply_markup=get_stats_keyboard('all'))
+        await callback.answer()
+    except Exception as e:
+        logger.error("Xatolik yuz berdi: %s", e)
+        await callback.message.answer("❌ Xatolik yuz berdi. Iltimos, qaytadan urinib ko'ring.")
+        await callback.answer()
+
+@dp.callback_query(F.data.startswith('stats_'))
+async def admin_stats_period(callback: CallbackQuery):
+    """Boshqa davr uchun statistikani ko'rsatish"""
+    if callback.from_user.id not in ADMIN_IDS:
+        await callback.answer("❌ Sizda admin huquqlari yo'q!")
+        return
+    
+    period = callback.data[len('stats_'):]
+    if period not in STATS_PERIOD_LABELS:
         await callback.answer()
+        return
+    
+    try:
+        stats = await db.get_order_stats(period)
+        await callback.message.edit_text(format_order_stats(stats, period), reply_markup=get_stats_keyboard(period))
     except Exception as e:
-        logging.error(f"Xatolik yuz berdi: {e}")
+        logger.error("Xatolik yuz berdi: %s", e)
+    await callback.answer()
+
+# Mijozlarga xabar yuborish
+async def ask_broadcast_message(message: Message, state: FSMContext):
+    await state.set_state(BroadcastStates.waiting_for_message)
+    await message.answer(
+        "📢 Barcha mijozlarga yuboriladigan xabarni yuboring (matn yoki rasm).\n\n"
+        "Bekor qilish uchun /cancel"
+    )
+
+@dp.message(Command("broadcast"))
+async def cmd_broadcast(message: Message, state: FSMContext):
+    """Mijozlarga xabar yuborishni boshlash"""
+    if message.from_user.id not in ADMIN_IDS:
+        await message.answer("❌ Sizda admin huquqlari yo'q!")
+        return
+    await ask_broadcast_message(message, state)
+
+@dp.callback_query(F.data == 'admin_broadcast')
+async def admin_broadcast(callback: CallbackQuery, state: FSMContext):
+    """Admin paneldan xabar yuborish"""
+    if callback.from_user.id not in ADMIN_IDS:
+        await callback.answer("❌ Sizda admin huquqlari yo'q!")
+        return
+    await ask_broadcast_message(callback.message, state)
+    await callback.answer()
+
+@dp.message(BroadcastStates.waiting_for_message, Command("cancel"))
+async def cancel_broadcast_message(message: Message, state: FSMContext):
+    await state.clear()
+    await message.answer("❌ Xabar yuborish bekor qilindi.")
+
+@dp.message(BroadcastStates.waiting_for_message)
+async def preview_broadcast(message: Message, state: FSMContext):
+    """Yuboriladigan xabarni tasdiqlash"""
+    recipients = await db.count_customers()
+    await state.update_data(broadcast_message_id=message.message_id)
+    await state.set_state(BroadcastStates.confirming)
+    await message.answer(
+        f"📢 Ushbu xabar {recipients} ta mijozga yuboriladi. Tasdiqlaysizmi?",
+        reply_markup=InlineKeyboardMarkup(inline_keyboard=[[
+            InlineKeyboardButton(text="✅ Yuborish", callback_data="broadcast_confirm"),
+            InlineKeyboardButton(text="❌ Bekor qilish", callback_data="broadcast_abort")
+        ]])
+    )
+
+@dp.callback_query(BroadcastStates.confirming, F.data.in_({'broadcast_confirm', 'broadcast_abort'}))
+async def confirm_broadcast(callback: CallbackQuery, state: FSMContext):
+    data = await state.get_data()
+    await state.clear()
+    if callback.data == 'broadcast_abort':
+        await callback.message.edit_text("❌ Xabar yuborish bekor qilindi.")
+        await callback.answer()
+        return
+    await callback.message.edit_reply_markup(reply_markup=None)
+    try:
+        await broadcaster.start(bot, callback.message.chat.id, data['broadcast_message_id'])
+    except Exception as e:
+        logger.error("Error starting broadcast: %s", e)
         await callback.message.answer("❌ Xatolik yuz berdi. Iltimos, qaytadan urinib ko'ring.")
+    await callback.answer()
+
+@dp.callback_query(F.data.startswith('broadcast_cancel_'))
+async def cancel_broadcast(callback: CallbackQuery):
+    """Davom etayotgan xabar yuborishni to'xtatish"""
+    if callback.from_user.id not in ADMIN_IDS:
+        await callback.answer("❌ Sizda admin huquqlari yo'q!")
+        return
+    try:
+        broadcast_id = int(callback.data[len('broadcast_cancel_'):])
+    except ValueError:
         await callback.answer()
+        return
+    if await broadcaster.cancel(broadcast_id):
+        await callback.answer("⛔ To'xtatilmoqda...")
+    else:
+        await callback.answer("Xabar yuborish allaqachon tugagan")
 
 # Inline menu callback handlers
 
@@ -1381,7 +2082,7 @@ async def show_medicines_callback(callback: CallbackQuery):
     """Show medicines list"""
     await callback.message.edit_text(
         "🌿 <b>Mavjud o'simlik dorilar:</b>",
-        reply_markup=get_medicines_menu(),
+        reply_markup=get_catalog_menu(),
         parse_mode='HTML'
     )
     await callback.answer()
@@ -1391,35 +2092,77 @@ async def place_order_callback(callback: CallbackQuery):
     """Show order menu"""
     await callback.message.edit_text(
         "🛒 <b>Buyurtma berish:</b>\n\nQaysi dorini buyurtma qilmoqchisiz?",
-        reply_markup=get_medicines_menu(),
+        reply_markup=get_catalog_menu(),
         parse_mode='HTML'
     )
     await callback.answer()
 
 
 async def main():
-    # Initialize database data
-    global MEDICINES, orders
-    try:
-        MEDICINES = await load_medicines()
-        orders = await load_orders()
-        logging.info(f"Loaded {len(MEDICINES)} medicines and {len(orders)} orders from database")
-        logging.info(f"Medicine IDs loaded: {list(MEDICINES.keys())}")
-    except Exception as e:
-        logging.error(f"Error loading data from database: {e}")
-        # Use hardcoded medicines as fallback
-        logging.info("Using hardcoded medicines as fallback")
-        orders = {}
+    # Katalog diskdagi nusxadan darhol yuklanadi va fonda faqat o'zgarishlar olinadi
+    has_snapshot = catalog.load_snapshot()
+    
+    # O'zgarishlar oqimi fonda, bazadan katalog olinishidan oldin boshlanadi:
+    # hech narsa o'tkazib yuborilmaydi va baza sekin bo'lsa ham bot ishga tushishi kutmaydi
+    change_feed.start()
+    
+    if has_snapshot:
+        logger.info("Loaded %s medicines from the catalog snapshot, syncing changes in background", len(catalog))
+        catalog_sync.watermark = catalog.watermark
+        if catalog.watermark is None:
+            catalog.refresh_in_background()
+    else:
+        try:
+            await catalog_sync.sync()
+            logger.info("Loaded %s medicines from database", len(catalog))
+        except Exception as e:
+            logger.error("Error loading data from database: %s", e)
+            # Use hardcoded medicines as fallback
+            logger.info("Using hardcoded medicines as fallback")
+    catalog_sync.start()
+    
+    # Rasmlar holati fonda yuklanadi, so'ng tekshirilmagan file_id lar getFile bilan tekshiriladi
+    media.start(bot, catalog.values())
+    
+    # Oldingi ishga tushirishdan qolgan saqlanmagan buyurtmalar bazaga yuboriladi
+    await order_journal.start(order_writer.submit)
+    await outbox.start()
+    if not HAS_PILLOW:
+        logger.warning("Pillow is not installed: medicine photos are not compressed or stored, "
+                       "receipts are stored as received")
+    await image_pipeline.start()
+    await broadcaster.resume(bot)
+    
+    # /metrics lokal portda (METRICS_PORT)
+    metrics_runner = await serve_metrics()
     
     # Start the bot
-    logging.info("Bot is starting...")
+    logger.info("Bot is starting in %s mode...", RUN_MODE)
     try:
-        await dp.start_polling(bot, skip_updates=True)
+        if RUN_MODE == 'webhook':
+            await run_webhook(dp, bot, update_scheduler,
+                              metrics={'rate_limit': rate_limiter.stats, 'scheduler': update_scheduler.stats})
+        else:
+            # Kutilayotgan yangilanishlar tashlab yuborilmaydi: bot o'chiq paytdagi buyurtmalar ham qayta ishlanadi
+            await bot.delete_webhook(drop_pending_updates=False)
+            # Parallellikni update_scheduler cheklaydi; bu yerda faqat xotiradagi navbat chegaralanadi
+            await dp.start_polling(bot, tasks_concurrency_limit=UPDATE_QUEUE_LIMIT)
     except Exception as e:
-        logging.error(f"Botda xatolik yuz berdi: {e}")
+        logger.error("Botda xatolik yuz berdi: %s", e)
     finally:
+        await change_feed.stop()
+        await catalog_sync.stop()
+        await outbox.stop()
+        await image_pipeline.stop()
+        await broadcaster.stop()
+        await order_journal.close()
+        await order_writer.close()
+        await media.close()
         await bot.session.close()
-        logging.info("Bot to'xtatildi")
+        if metrics_runner:
+            await metrics_runner.cleanup()
+        db.close()
+        logger.info("Bot to'xtatildi")
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,257 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+
+from local_store import LocalDatabase
+from ratelimit import PRIORITY_LOW, send_priority
+
+logger = logging.getLogger(__name__)
+
+# Messages in flight at once; the session rate limiter still caps the overall rate
+BROADCAST_CONCURRENCY = int(os.getenv('BROADCAST_CONCURRENCY', '8'))
+# Recipients fetched per page; progress is checkpointed after every page
+BROADCAST_BATCH_SIZE = int(os.getenv('BROADCAST_BATCH_SIZE', '200'))
+BROADCAST_PROGRESS_INTERVAL = float(os.getenv('BROADCAST_PROGRESS_INTERVAL', '5'))
+
+RecipientPage = Callable[[int, int], Awaitable[List[int]]]
+RecipientCount = Callable[[], Awaitable[int]]
+
+
+class Broadcaster:
+    """Copies one admin message to every customer.
+
+    Recipients are streamed from ``fetch_recipients(after_id, limit)`` in
+    ascending user ID order. After each page the last ID and the counters
+    are saved to local SQLite, so a restarted bot resumes from the next page
+    (at worst re-sending part of the page it was on). Users who blocked the
+    bot are remembered and skipped by later broadcasts. Sends run in the
+    low-priority lane of the rate limiter, behind customer replies.
+    """
+
+    def __init__(self, fetch_recipients: RecipientPage, count_recipients: RecipientCount,
+                 database: Optional[LocalDatabase] = None, concurrency: int = BROADCAST_CONCURRENCY,
+                 batch_size: int = BROADCAST_BATCH_SIZE, progress_interval: float = BROADCAST_PROGRESS_INTERVAL):
+        self.fetch_recipients = fetch_recipients
+        self.count_recipients = count_recipients
+        self.database = database or LocalDatabase()
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.progress_interval = progress_interval
+        self._jobs: Dict[int, Dict[str, Any]] = {}
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self._ready = False
+
+    async def _prepare(self) -> None:
+        if self._ready:
+            return
+        await self.database.executescript("""
+            CREATE TABLE IF NOT EXISTS broadcasts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                admin_chat_id INTEGER NOT NULL,
+                source_message_id INTEGER NOT NULL,
+                status_message_id INTEGER,
+                status TEXT NOT NULL DEFAULT 'running',
+                cursor INTEGER NOT NULL DEFAULT 0,
+                total INTEGER NOT NULL DEFAULT 0,
+                sent INTEGER NOT NULL DEFAULT 0,
+                failed INTEGER NOT NULL DEFAULT 0,
+                blocked INTEGER NOT NULL DEFAULT 0,
+                started_at REAL NOT NULL,
+                finished_at REAL
+            );
+            CREATE TABLE IF NOT EXISTS blocked_users (
+                user_id INTEGER PRIMARY KEY,
+                blocked_at REAL NOT NULL
+            );
+        """)
+        self._ready = True
+
+    async def start(self, bot: Bot, admin_chat_id: int, source_message_id: int) -> int:
+        """Start copying ``source_message_id`` from the admin chat to every customer"""
+        await self._prepare()
+        total = await self.count_recipients()
+        status = await bot.send_message(admin_chat_id, "📢 Xabar yuborish boshlanmoqda...")
+        await self.database.execute(
+            "INSERT INTO broadcasts (admin_chat_id, source_message_id, status_message_id, total, started_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (admin_chat_id, source_message_id, status.message_id, total, time.time())
+        )
+        row = await self.database.fetchone('SELECT * FROM broadcasts WHERE id = last_insert_rowid()')
+        self._launch(bot, dict(row))
+        return row['id']
+
+    async def resume(self, bot: Bot) -> None:
+        """Continue broadcasts interrupted by a restart"""
+        await self._prepare()
+        for row in await self.database.fetchall("SELECT * FROM broadcasts WHERE status = 'running'"):
+            logger.info("Resuming broadcast %s after user %s", row['id'], row['cursor'])
+            self._launch(bot, dict(row))
+
+    def _launch(self, bot: Bot, job: Dict[str, Any]) -> None:
+        self._jobs[job['id']] = job
+        self._tasks[job['id']] = asyncio.create_task(self._run(bot, job))
+
+    async def cancel(self, broadcast_id: int) -> bool:
+        job = self._jobs.get(broadcast_id)
+        if job is None or job['status'] != 'running':
+            return False
+        job['status'] = 'cancelled'
+        return True
+
+    async def stop(self) -> None:
+        """Stop workers on shutdown; running broadcasts resume from their checkpoint"""
+        for task in self._tasks.values():
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        self._tasks.clear()
+
+    async def forget_blocked(self, user_id: int) -> None:
+        """A user who writes to the bot again can receive broadcasts again"""
+        await self._prepare()
+        await self.database.execute('DELETE FROM blocked_users WHERE user_id = ?', (user_id,))
+
+    async def _checkpoint(self, job: Dict[str, Any]) -> None:
+        await self.database.execute(
+            "UPDATE broadcasts SET status = ?, cursor = ?, sent = ?, failed = ?, blocked = ?, finished_at = ? "
+            "WHERE id = ?",
+            (job['status'], job['cursor'], job['sent'], job['failed'], job['blocked'], job['finished_at'], job['id'])
+        )
+
+    async def _run(self, bot: Bot, job: Dict[str, Any]) -> None:
+        semaphore = asyncio.Semaphore(self.concurrency)
+        run = {'started': time.monotonic(), 'processed': 0, 'page': {}}
+        reporter = asyncio.create_task(self._report_periodically(bot, job, run))
+        try:
+            while job['status'] == 'running':
+                ids = await self.fetch_recipients(job['cursor'], self.batch_size)
+                if not ids:
+                    job['status'] = 'done'
+                    break
+                placeholders = ','.join('?' * len(ids))
+                blocked = {row['user_id'] for row in await self.database.fetchall(
+                    f'SELECT user_id FROM blocked_users WHERE user_id IN ({placeholders})', ids
+                )}
+                # Counters are only committed with the cursor, so a resumed page is counted once
+                counts = run['page'] = {'sent': 0, 'failed': 0, 'blocked': len(blocked)}
+                results = await asyncio.gather(*(
+                    self._send(bot, job, user_id, semaphore, counts) for user_id in ids if user_id not in blocked
+                ))
+                if job['status'] != 'running':
+                    # Cancelled: it will not resume, so keep what was sent
+                    for key, value in counts.items():
+                        job[key] += value
+                    run['page'] = {}
+                    break
+                newly_blocked = [(user_id, time.time()) for user_id in results if user_id is not None]
+                if newly_blocked:
+                    await self.database.executemany(
+                        'INSERT OR REPLACE INTO blocked_users (user_id, blocked_at) VALUES (?, ?)', newly_blocked
+                    )
+                for key, value in counts.items():
+                    job[key] += value
+                run['page'] = {}
+                run['processed'] += len(ids)
+                job['cursor'] = ids[-1]
+                await self._checkpoint(job)
+            job['finished_at'] = time.time()
+            await self._checkpoint(job)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error("Broadcast %s stopped: %s", job['id'], e)
+            job['status'] = 'failed'
+            job['finished_at'] = time.time()
+            await self._checkpoint(job)
+        finally:
+            reporter.cancel()
+            if job['status'] != 'running':
+                self._jobs.pop(job['id'], None)
+                self._tasks.pop(job['id'], None)
+                await self._report(bot, job, run)
+
+    async def _send(self, bot: Bot, job: Dict[str, Any], user_id: int, semaphore: asyncio.Semaphore,
+                    counts: Dict[str, int]) -> Optional[int]:
+        """Copy the message to one user; returns the user ID if they blocked the bot"""
+        async with semaphore:
+            for attempt in range(3):
+                if job['status'] != 'running':
+                    return None
+                try:
+                    with send_priority(PRIORITY_LOW):
+                        await bot.copy_message(
+                            chat_id=user_id, from_chat_id=job['admin_chat_id'], message_id=job['source_message_id']
+                        )
+                    counts['sent'] += 1
+                    return None
+                except TelegramRetryAfter as e:
+                    await asyncio.sleep(e.retry_after)
+                except TelegramForbiddenError:
+                    counts['blocked'] += 1
+                    return user_id
+                except TelegramBadRequest as e:
+                    logger.warning("Broadcast to %s rejected: %s", user_id, e)
+                    break
+                except Exception as e:
+                    logger.warning("Broadcast to %s failed (attempt %s): %s", user_id, attempt + 1, e)
+                    await asyncio.sleep(2 ** attempt)
+            counts['failed'] += 1
+            return None
+
+    async def _report_periodically(self, bot: Bot, job: Dict[str, Any], run: Dict[str, Any]) -> None:
+        while True:
+            await asyncio.sleep(self.progress_interval)
+            await self._report(bot, job, run)
+
+    async def _report(self, bot: Bot, job: Dict[str, Any], run: Dict[str, Any]) -> None:
+        try:
+            await bot.edit_message_text(
+                chat_id=job['admin_chat_id'],
+                message_id=job['status_message_id'],
+                text=self.format_progress(job, run),
+                reply_markup=self.cancel_keyboard(job['id']) if job['status'] == 'running' else None,
+            )
+        except TelegramBadRequest:
+            # "message is not modified" when nothing changed since the last report
+            pass
+        except Exception as e:
+            logger.error("Broadcast progress update failed: %s", e)
+
+    @staticmethod
+    def cancel_keyboard(broadcast_id: int) -> InlineKeyboardMarkup:
+        return InlineKeyboardMarkup(inline_keyboard=[[
+            InlineKeyboardButton(text="⛔ To'xtatish", callback_data=f'broadcast_cancel_{broadcast_id}')
+        ]])
+
+    @staticmethod
+    def format_progress(job: Dict[str, Any], run: Dict[str, Any]) -> str:
+        page = run['page']
+        sent, failed, blocked = (job[key] + page.get(key, 0) for key in ('sent', 'failed', 'blocked'))
+        processed = sent + failed + blocked
+        total = max(job['total'], processed)
+        elapsed = time.monotonic() - run['started']
+        rate = (run['processed'] + sum(page.values())) / elapsed if elapsed > 0 else 0.0
+        titles = {
+            'running': "📢 Xabar yuborilmoqda...",
+            'done': "✅ Xabar yuborish yakunlandi",
+            'cancelled': "⛔ Xabar yuborish to'xtatildi",
+            'failed': "❌ Xabar yuborish xatolik bilan to'xtadi",
+        }
+        text = (
+            f"{titles.get(job['status'], job['status'])}\n\n"
+            f"📊 Jarayon: {processed}/{total}"
+            f"{f' ({processed * 100 // total}%)' if total else ''}\n"
+            f"✅ Yuborildi: {sent}\n"
+            f"🚫 Bloklagan: {blocked}\n"
+            f"❌ Xatolik: {failed}\n"
+            f"⚡ Tezlik: {rate:.1f} ta/s"
+        )
+        if job['status'] == 'running' and rate > 0:
+            remaining = int((total - processed) / rate)
+            text += f"\n⏳ Qolgan vaqt: ~{remaining // 60} daq {remaining % 60} s"
+        return text
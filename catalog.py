@@ -0,0 +1,306 @@
+import asyncio
+import functools
+import json
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, Iterator, List, Optional
+
+from models import Medicine
+
+logger = logging.getLogger(__name__)
+
+CATALOG_TTL = float(os.getenv('CATALOG_TTL', '300'))
+CATALOG_NEGATIVE_TTL = float(os.getenv('CATALOG_NEGATIVE_TTL', '60'))
+CATALOG_SNAPSHOT_PATH = os.getenv('CATALOG_SNAPSHOT_PATH', 'data/catalog.json')
+
+
+class CatalogSnapshot:
+    """Last known catalog saved as one compact JSON file.
+
+    Loading it takes a single small read, so the bot can answer with the
+    catalog immediately after a deploy, before (or without) reaching the
+    database. Saves write a temporary file and rename it over the old one,
+    so a crash never leaves a half-written snapshot.
+    """
+
+    FORMAT = 1
+
+    def __init__(self, path: str = CATALOG_SNAPSHOT_PATH):
+        self.path = path
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        """The saved document: ``items`` and the delta sync ``watermark``"""
+        try:
+            with open(self.path, encoding='utf-8') as handle:
+                data = json.load(handle)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable catalog snapshot %s: %s", self.path, e)
+            return None
+        if data.get('format') != self.FORMAT:
+            return None
+        data['items'] = {med_id: Medicine.from_row({'id': med_id, **row}) for med_id, row in data['items'].items()}
+        return data
+
+    def _write(self, items: Dict[str, Medicine], watermark: Optional[str] = None) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary = f'{self.path}.tmp'
+        with open(temporary, 'w', encoding='utf-8') as handle:
+            document = {'format': self.FORMAT, 'saved_at': time.time(), 'watermark': watermark,
+                        'items': {med_id: med.to_row() for med_id, med in items.items()}}
+            json.dump(document, handle, ensure_ascii=False, separators=(',', ':'))
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(temporary, self.path)
+
+    async def save(self, items: Dict[str, Medicine], watermark: Optional[str] = None) -> None:
+        await asyncio.to_thread(self._write, items, watermark)
+
+
+class CatalogCache:
+    """In-memory medicine catalog.
+
+    Entries are served from memory and kept current by a delta sync (see
+    sync.py), which calls ``touch`` after every successful pass; only if
+    no pass succeeded within the TTL does the next read trigger a full
+    background reload. Concurrent reloads are coalesced into one
+    loader call (single-flight), and IDs that are known to be gone are kept
+    in a negative cache so stale buttons do not each force a reload. Every
+    change bumps ``version``, which derived caches use as their key. With a
+    ``snapshot`` the catalog is also saved to disk after changes and can be
+    restored from it at startup, together with the sync ``watermark``.
+    """
+
+    def __init__(self, loader: Callable[[], Awaitable[Dict[str, Medicine]]],
+                 ttl: float = CATALOG_TTL, negative_ttl: float = CATALOG_NEGATIVE_TTL,
+                 snapshot: Optional[CatalogSnapshot] = None):
+        self._loader = loader
+        self.snapshot = snapshot
+        self._snapshot_task: Optional[asyncio.Task] = None
+        self._snapshot_dirty = False
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._items: Dict[str, Medicine] = {}
+        self._missing: Dict[str, float] = {}
+        self._reload: Optional[asyncio.Future] = None
+        self._listeners: List[Callable[[str, Optional[Medicine]], None]] = []
+        self.version = 0
+        self.loaded_at = 0.0
+        self.watermark: Optional[str] = None
+
+    # Read access
+    def __contains__(self, med_id: str) -> bool:
+        return med_id in self._items
+
+    def __getitem__(self, med_id: str) -> Medicine:
+        return self._items[med_id]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._items)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def get(self, med_id: str, default=None):
+        return self._items.get(med_id, default)
+
+    def items(self):
+        return self._items.items()
+
+    def keys(self):
+        return self._items.keys()
+
+    def values(self):
+        return self._items.values()
+
+    @property
+    def stale(self) -> bool:
+        return time.monotonic() - self.loaded_at > self.ttl
+
+    async def lookup(self, med_id: str) -> Optional[Medicine]:
+        """Get a medicine, reloading the catalog once if the ID is unknown"""
+        med = self._items.get(med_id)
+        if med is not None:
+            if self.stale:
+                self.refresh_in_background()
+            return med
+
+        expires = self._missing.get(med_id)
+        if expires is not None:
+            if expires > time.monotonic():
+                return None
+            del self._missing[med_id]
+
+        try:
+            await self.reload()
+        except Exception:
+            # Already logged by _reload_done
+            return None
+
+        med = self._items.get(med_id)
+        if med is None:
+            self._missing[med_id] = time.monotonic() + self.negative_ttl
+        return med
+
+    # Loading
+    async def reload(self) -> int:
+        """Reload the whole catalog; concurrent callers share one loader call"""
+        return await asyncio.shield(self.refresh_in_background())
+
+    def touch(self) -> None:
+        """Mark the catalog as current without reloading it"""
+        self.loaded_at = time.monotonic()
+
+    def refresh_in_background(self) -> asyncio.Future:
+        if self._reload is None:
+            self._reload = asyncio.ensure_future(self._load())
+            self._reload.add_done_callback(self._reload_done)
+        return self._reload
+
+    def _reload_done(self, future: asyncio.Future) -> None:
+        self._reload = None
+        if not future.cancelled() and future.exception() is not None:
+            logger.error("Catalog reload failed: %s", future.exception())
+
+    async def _load(self) -> int:
+        items = await self._loader()
+        if not items and self._items:
+            # DatabaseManager reports failures as an empty result; keep serving what we have
+            logger.warning("Catalog loader returned no medicines, keeping the cached catalog")
+            self.loaded_at = time.monotonic()
+            return self.version
+        self.replace(items)
+        logger.info("Reloaded %s medicines (catalog version %s)", len(items), self.version)
+        return self.version
+
+    # Snapshot
+    def load_snapshot(self) -> bool:
+        """Serve the catalog saved by a previous run.
+
+        A snapshot with a sync watermark is brought up to date by the next
+        delta sync; one without is treated as stale so the next read reloads it.
+        """
+        data = self.snapshot.load() if self.snapshot else None
+        if not data or not data['items']:
+            return False
+        self.replace(data['items'])
+        self.watermark = data.get('watermark')
+        # Already on disk
+        self._snapshot_dirty = False
+        if self.watermark is None:
+            self.loaded_at = 0.0
+        return True
+
+    def _schedule_snapshot(self) -> None:
+        if self.snapshot is None:
+            return
+        self._snapshot_dirty = True
+        if self._snapshot_task is not None and not self._snapshot_task.done():
+            return
+        try:
+            self._snapshot_task = asyncio.get_running_loop().create_task(self._save_snapshot())
+        except RuntimeError:
+            # No event loop yet (import-time seeding); nothing worth saving
+            pass
+
+    async def _save_snapshot(self) -> None:
+        # Yield once so a burst of changes is saved together
+        await asyncio.sleep(0)
+        while self._snapshot_dirty:
+            self._snapshot_dirty = False
+            try:
+                await self.snapshot.save(dict(self._items), self.watermark)
+            except Exception as e:
+                logger.error("Failed to save catalog snapshot: %s", e)
+
+    # Incremental updates
+    def subscribe(self, listener: Callable[[str, Optional[Medicine]], None]) -> None:
+        """Call ``listener(med_id, med)`` for every changed entry; ``med`` is None on removal"""
+        self._listeners.append(listener)
+
+    def _notify(self, med_id: str, med: Optional[Medicine]) -> None:
+        for listener in self._listeners:
+            try:
+                listener(med_id, med)
+            except Exception as e:
+                logger.error("Catalog listener failed for %s: %s", med_id, e)
+
+    def replace(self, items: Dict[str, Medicine]) -> None:
+        old, self._items = self._items, dict(items)
+        self._missing.clear()
+        self.loaded_at = time.monotonic()
+        self.version += 1
+        changed = False
+        for med_id in old.keys() - self._items.keys():
+            changed = True
+            self._notify(med_id, None)
+        for med_id, med in self._items.items():
+            if old.get(med_id) != med:
+                changed = True
+                self._notify(med_id, med)
+        if changed:
+            self._schedule_snapshot()
+
+    def apply_changes(self, changed: Dict[str, Medicine], removed: Iterable[str] = ()) -> int:
+        """Patch the catalog with changed and removed entries; returns how many differed"""
+        patched = 0
+        for med_id, med in changed.items():
+            if self._items.get(med_id) != med:
+                self.put(med_id, med)
+                patched += 1
+        for med_id in removed:
+            if med_id in self._items:
+                self.remove(med_id)
+                patched += 1
+        return patched
+
+    def put(self, med_id: str, data: Medicine) -> None:
+        self._items[med_id] = data
+        self._missing.pop(med_id, None)
+        self.version += 1
+        self._notify(med_id, data)
+        self._schedule_snapshot()
+
+    def update(self, med_id: str, changes: Dict) -> None:
+        if med_id in self._items:
+            self._items[med_id] = self._items[med_id].with_changes(changes)
+            self.version += 1
+            self._notify(med_id, self._items[med_id])
+            self._schedule_snapshot()
+
+    def remove(self, med_id: str) -> Optional[Medicine]:
+        med = self._items.pop(med_id, None)
+        self._missing[med_id] = time.monotonic() + self.negative_ttl
+        self.version += 1
+        if med is not None:
+            self._notify(med_id, None)
+            self._schedule_snapshot()
+        return med
+
+    # Derived caches
+    def memoize(self, build: Callable[..., Any]) -> Callable[..., Any]:
+        """Cache a builder's results until the catalog version changes.
+
+        Results are keyed on the positional arguments, so they must be
+        hashable, and the returned objects are shared between callers.
+        """
+        cached: Dict[tuple, Any] = {}
+        cached_version = None
+
+        @functools.wraps(build)
+        def wrapper(*args):
+            nonlocal cached_version
+            if cached_version != self.version:
+                cached.clear()
+                cached_version = self.version
+            try:
+                return cached[args]
+            except KeyError:
+                result = cached[args] = build(*args)
+                return result
+
+        return wrapper
@@ -0,0 +1,109 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Seconds between polls of the change_log table
+CHANGE_FEED_INTERVAL = float(os.getenv('CHANGE_FEED_INTERVAL', '2'))
+CHANGE_FEED_MAX_BACKOFF = 60.0
+# Entries older than this are deleted from change_log (checked hourly)
+CHANGE_LOG_RETENTION = float(os.getenv('CHANGE_LOG_RETENTION', str(7 * 24 * 60 * 60)))
+CHANGE_LOG_PRUNE_INTERVAL = 3600.0
+
+Handler = Callable[[List[Dict]], Awaitable[None]]
+
+
+class ChangeFeed:
+    """Delivers rows changed in the database to every bot process.
+
+    Triggers append one ``change_log`` entry per insert, update or delete
+    (see create_tables.sql), whoever made the change: this process, another
+    worker or the Supabase dashboard. The feed polls for entries after the
+    last sequence number it has seen and hands them to the subscribers of
+    each table, newest entry per row only. The cursor moves past a batch only
+    once every handler has accepted it, so a failed handler sees the same
+    changes again on the next poll; handlers must therefore be idempotent.
+    With ``prune``, entries older than ``retention`` seconds are deleted
+    about once an hour; a process that was stopped for longer than that
+    skips the pruned entries and relies on its delta sync for them.
+    """
+
+    def __init__(self, fetch_changes: Callable[[int, int], Awaitable[List[Dict]]],
+                 fetch_head: Callable[[], Awaitable[int]], interval: float = CHANGE_FEED_INTERVAL,
+                 batch_size: int = 500, prune: Optional[Callable[[float], Awaitable[None]]] = None,
+                 retention: float = CHANGE_LOG_RETENTION):
+        self.fetch_changes = fetch_changes
+        self.fetch_head = fetch_head
+        self.prune = prune
+        self.retention = retention
+        self._next_prune = 0.0
+        self.interval = interval
+        self.batch_size = batch_size
+        self.cursor: Optional[int] = None
+        self._handlers: Dict[str, List[Handler]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def subscribe(self, table: str, handler: Handler) -> None:
+        """Call ``await handler(entries)`` with new change_log entries for ``table``"""
+        self._handlers.setdefault(table, []).append(handler)
+
+    def start(self) -> None:
+        """Start polling in the background from the current head of the log.
+
+        Earlier changes are covered by the initial load. The head is read by
+        the first poll, so a slow or unreachable database does not hold up the
+        caller; failures are logged and retried with backoff.
+        """
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def poll(self) -> int:
+        """Apply everything logged since the cursor; returns the number of entries read"""
+        if self.cursor is None:
+            self.cursor = await self.fetch_head()
+            return 0
+        total = 0
+        while True:
+            entries = await self.fetch_changes(self.cursor, self.batch_size)
+            if not entries:
+                return total
+            latest: Dict[str, Dict[str, Dict]] = {}
+            for entry in entries:
+                latest.setdefault(entry['table_name'], {})[entry['row_id']] = entry
+            for table, rows in latest.items():
+                for handler in self._handlers.get(table, ()):
+                    await handler(list(rows.values()))
+            self.cursor = entries[-1]['seq']
+            total += len(entries)
+            if len(entries) < self.batch_size:
+                return total
+
+    async def _run(self) -> None:
+        delay = self.interval
+        while True:
+            try:
+                changes = await self.poll()
+                if changes:
+                    logger.info("Applied %s changes from the change feed", changes)
+                delay = self.interval
+            except Exception as e:
+                delay = min(CHANGE_FEED_MAX_BACKOFF, delay * 2)
+                logger.error("Change feed poll failed, retrying in %.0fs: %s", delay, e)
+            if self.prune is not None and time.monotonic() >= self._next_prune:
+                await self._prune()
+            await asyncio.sleep(delay)
+
+    async def _prune(self) -> None:
+        self._next_prune = time.monotonic() + CHANGE_LOG_PRUNE_INTERVAL
+        try:
+            await self.prune(self.retention)
+        except Exception as e:
+            logger.error("Could not prune the change log: %s", e)
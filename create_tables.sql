@@ -24,6 +24,10 @@ CREATE TABLE IF NOT EXISTS medicines (
     updated_at TIMESTAMP DEFAULT NOW()
 );
 
+-- Optional grouping for the paged catalog menu
+ALTER TABLE medicines ADD COLUMN IF NOT EXISTS category TEXT;
+CREATE INDEX IF NOT EXISTS medicines_category_idx ON medicines (category);
+
 -- Create image storage table for Supabase Storage integration
 CREATE TABLE IF NOT EXISTS images (
     id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
@@ -58,6 +62,243 @@ CREATE TABLE IF NOT EXISTS orders (
     updated_at TIMESTAMP DEFAULT NOW()
 );
 
+-- Integer prices in minor units (tiyin, 1/100 so'm). The price TEXT columns stay
+-- as the labels shown to customers; orders also store the unit price and the
+-- total fixed when the order was placed, so revenue is a plain numeric sum.
+ALTER TABLE medicines ADD COLUMN IF NOT EXISTS price_minor BIGINT CHECK (price_minor >= 0);
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS unit_price_minor BIGINT CHECK (unit_price_minor >= 0);
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS total_minor BIGINT CHECK (total_minor >= 0);
+
+-- The one amount in a price label in tiyin, e.g. '150 000 so''m' -> 15000000 and
+-- '150.50' -> 15050; NULL for no amount, several or a multiplier such as '1,5 mln'
+-- (same rules as models.parse_price)
+CREATE OR REPLACE FUNCTION price_to_minor(price TEXT)
+RETURNS BIGINT
+LANGUAGE SQL IMMUTABLE
+AS $$
+    SELECT CASE
+        WHEN amounts IS NULL OR cardinality(amounts) <> 1 THEN NULL
+        WHEN price ~* '[0-9]\s*(mln|million|mlrd|ming|k|млн|минг|тыс)\M' THEN NULL
+        WHEN amounts[1] ~ '[.,][0-9]{1,2}$' THEN
+            regexp_replace(regexp_replace(amounts[1], '[.,][0-9]{1,2}$', ''), '[^0-9]', '', 'g')::BIGINT * 100
+            + rpad(substring(amounts[1] FROM '[.,]([0-9]{1,2})$'), 2, '0')::BIGINT
+        ELSE regexp_replace(amounts[1], '[^0-9]', '', 'g')::BIGINT * 100
+    END
+    FROM (
+        SELECT array_agg(m[1]) AS amounts
+        FROM regexp_matches(COALESCE(price, ''), '([0-9](?:[0-9\s.,''’]*[0-9])?)', 'g') AS m
+    ) found;
+$$;
+
+-- Migration of rows written before the integer columns existed, and of rows whose
+-- amount was read from the first word of the label only ('150 000 so''m' as 150 so'm);
+-- order_daily_stats follows through its trigger
+UPDATE medicines SET price_minor = price_to_minor(price)
+WHERE price_to_minor(price) IS NOT NULL AND price_minor IS DISTINCT FROM price_to_minor(price);
+UPDATE orders SET unit_price_minor = price_to_minor(price),
+                  total_minor = price_to_minor(price) * COALESCE(months, 1)
+WHERE price_to_minor(price) IS NOT NULL
+  AND total_minor IS DISTINCT FROM price_to_minor(price) * COALESCE(months, 1);
+
+-- Keyset pagination for the admin order listing (DatabaseManager.list_orders)
+CREATE INDEX IF NOT EXISTS orders_created_at_id_idx ON orders (created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS orders_status_created_at_id_idx ON orders (status, created_at DESC, id DESC);
+
+-- Daily order rollup for the admin statistics (DatabaseManager.get_order_stats).
+-- Maintained by a trigger so the stats query reads a few rows per day instead of
+-- scanning the orders table.
+CREATE TABLE IF NOT EXISTS order_daily_stats (
+    day DATE NOT NULL,
+    status TEXT NOT NULL,
+    medicine TEXT NOT NULL,
+    region TEXT NOT NULL,
+    orders INTEGER NOT NULL DEFAULT 0,
+    revenue BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, status, medicine, region)
+);
+
+CREATE OR REPLACE FUNCTION order_revenue(price TEXT, months INTEGER)
+RETURNS BIGINT
+LANGUAGE SQL IMMUTABLE
+AS $$
+    SELECT COALESCE(price_to_minor(price) / 100, 0) * COALESCE(months, 1);
+$$;
+
+CREATE OR REPLACE FUNCTION order_daily_stats_apply(o orders, delta INTEGER)
+RETURNS VOID
+LANGUAGE SQL
+AS $$
+    INSERT INTO order_daily_stats AS s (day, status, medicine, region, orders, revenue)
+    VALUES (o.created_at::DATE, COALESCE(o.status, 'new'), o.medicine, COALESCE(o.delivery_region, ''),
+            delta, delta * COALESCE(o.total_minor / 100, order_revenue(o.price, o.months)))
+    ON CONFLICT (day, status, medicine, region) DO UPDATE
+    SET orders = s.orders + EXCLUDED.orders,
+        revenue = s.revenue + EXCLUDED.revenue;
+$$;
+
+CREATE OR REPLACE FUNCTION order_daily_stats_trigger()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM order_daily_stats_apply(OLD, -1);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM order_daily_stats_apply(NEW, 1);
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS orders_daily_stats ON orders;
+CREATE TRIGGER orders_daily_stats
+AFTER INSERT OR DELETE OR UPDATE OF status, medicine, price, months, total_minor, delivery_region ON orders
+FOR EACH ROW EXECUTE FUNCTION order_daily_stats_trigger();
+
+-- One-off backfill for orders created before the trigger existed
+INSERT INTO order_daily_stats (day, status, medicine, region, orders, revenue)
+SELECT created_at::DATE, COALESCE(status, 'new'), medicine, COALESCE(delivery_region, ''),
+       count(*), sum(COALESCE(total_minor / 100, order_revenue(price, months)))
+FROM orders
+GROUP BY 1, 2, 3, 4
+ON CONFLICT (day, status, medicine, region) DO NOTHING;
+
+CREATE OR REPLACE FUNCTION get_order_stats(since DATE DEFAULT NULL)
+RETURNS JSON
+LANGUAGE SQL STABLE
+AS $$
+    WITH scoped AS (
+        SELECT * FROM order_daily_stats WHERE since IS NULL OR day >= since
+    )
+    SELECT json_build_object(
+        'total_medicines', (SELECT count(*) FROM medicines WHERE is_active),
+        'total_orders', (SELECT COALESCE(sum(orders), 0) FROM scoped),
+        'total_revenue', (SELECT COALESCE(sum(revenue), 0) FROM scoped WHERE status <> 'cancelled'),
+        'by_status', (SELECT COALESCE(json_object_agg(status, n), '{}'::JSON)
+                      FROM (SELECT status, sum(orders) AS n FROM scoped GROUP BY status) t),
+        'by_medicine', (SELECT COALESCE(json_agg(t ORDER BY t.revenue DESC), '[]'::JSON)
+                        FROM (SELECT medicine, sum(orders) AS orders, sum(revenue) AS revenue
+                              FROM scoped WHERE status <> 'cancelled' GROUP BY medicine
+                              ORDER BY revenue DESC LIMIT 10) t),
+        'by_region', (SELECT COALESCE(json_agg(t ORDER BY t.orders DESC), '[]'::JSON)
+                      FROM (SELECT region, sum(orders) AS orders FROM scoped GROUP BY region
+                            ORDER BY orders DESC LIMIT 10) t),
+        'by_day', (SELECT COALESCE(json_agg(t ORDER BY t.day DESC), '[]'::JSON)
+                   FROM (SELECT day, sum(orders) AS orders FROM scoped GROUP BY day
+                         ORDER BY day DESC LIMIT 31) t)
+    );
+$$;
+
+-- Broadcast recipients: every distinct customer, streamed in user_id order so a
+-- broadcast can resume after the last ID it reached (DatabaseManager.get_customer_ids).
+CREATE INDEX IF NOT EXISTS orders_user_id_idx ON orders (user_id);
+
+CREATE OR REPLACE FUNCTION get_customer_ids(after_id BIGINT DEFAULT 0, batch_size INT DEFAULT 500)
+RETURNS TABLE (user_id BIGINT)
+LANGUAGE SQL STABLE
+AS $$
+    SELECT DISTINCT o.user_id FROM orders o WHERE o.user_id > after_id ORDER BY o.user_id LIMIT batch_size;
+$$;
+
+CREATE OR REPLACE FUNCTION count_customers()
+RETURNS BIGINT
+LANGUAGE SQL STABLE
+AS $$
+    SELECT count(DISTINCT user_id) FROM orders;
+$$;
+
+-- Change feed (changefeed.py): inserts, updates and deletes on medicines are
+-- logged here, so changes made by every bot process (and edits made in the
+-- Supabase dashboard) can be picked up as incremental cache patches. The bot
+-- deletes entries older than CHANGE_LOG_RETENTION itself. Orders are not
+-- logged: no process caches them, admin order lists are read from orders directly.
+CREATE TABLE IF NOT EXISTS change_log (
+    seq BIGSERIAL PRIMARY KEY,
+    table_name TEXT NOT NULL,
+    row_id TEXT NOT NULL,
+    op TEXT NOT NULL CHECK (op IN ('insert', 'update', 'delete')),
+    status TEXT,
+    changed_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+CREATE INDEX IF NOT EXISTS change_log_changed_at_idx ON change_log (changed_at);
+
+CREATE OR REPLACE FUNCTION change_log_trigger()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        INSERT INTO change_log (table_name, row_id, op) VALUES (TG_TABLE_NAME, OLD.id, 'delete');
+        RETURN OLD;
+    END IF;
+    INSERT INTO change_log (table_name, row_id, op, status)
+    VALUES (TG_TABLE_NAME, NEW.id, lower(TG_OP), to_jsonb(NEW) ->> 'status');
+    RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS medicines_change_log ON medicines;
+CREATE TRIGGER medicines_change_log
+AFTER INSERT OR UPDATE OR DELETE ON medicines
+FOR EACH ROW EXECUTE FUNCTION change_log_trigger();
+
+DROP TRIGGER IF EXISTS orders_change_log ON orders;
+
+-- Delta sync (sync.py): processes pull only rows whose updated_at moved past
+-- their last watermark. updated_at is bumped on every update, including edits
+-- made in the Supabase dashboard, and the bot deletes medicines by setting
+-- is_active = false so the deletion reaches other processes as a tombstone.
+CREATE OR REPLACE FUNCTION set_updated_at()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    NEW.updated_at = NOW();
+    RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS medicines_set_updated_at ON medicines;
+CREATE TRIGGER medicines_set_updated_at
+BEFORE UPDATE ON medicines
+FOR EACH ROW EXECUTE FUNCTION set_updated_at();
+
+DROP TRIGGER IF EXISTS orders_set_updated_at ON orders;
+CREATE TRIGGER orders_set_updated_at
+BEFORE UPDATE ON orders
+FOR EACH ROW EXECUTE FUNCTION set_updated_at();
+
+CREATE INDEX IF NOT EXISTS medicines_updated_at_id_idx ON medicines (updated_at, id);
+CREATE INDEX IF NOT EXISTS orders_updated_at_id_idx ON orders (updated_at, id);
+
+-- Medicine photo cache (media.py): one row per medicine with the file_id Telegram
+-- last accepted and whether the photo is broken, so
+-- product cards stop retrying a bad photo until an admin uploads a new one.
+-- source is the medicines.photo value the row was checked for. Photos known only
+-- by their Telegram file_id have no stored file, hence no file_path.
+ALTER TABLE images ADD COLUMN IF NOT EXISTS medicine_id TEXT REFERENCES medicines(id) ON DELETE CASCADE;
+ALTER TABLE images ADD COLUMN IF NOT EXISTS source TEXT;
+ALTER TABLE images ADD COLUMN IF NOT EXISTS width INTEGER;
+ALTER TABLE images ADD COLUMN IF NOT EXISTS height INTEGER;
+ALTER TABLE images ADD COLUMN IF NOT EXISTS is_broken BOOLEAN NOT NULL DEFAULT false;
+ALTER TABLE images ADD COLUMN IF NOT EXISTS last_error TEXT;
+ALTER TABLE images ADD COLUMN IF NOT EXISTS checked_at TIMESTAMP;
+ALTER TABLE images ALTER COLUMN file_path DROP NOT NULL;
+CREATE UNIQUE INDEX IF NOT EXISTS images_medicine_id_type_idx ON images (medicine_id, image_type);
+
+-- Stored copies (image_store.py): admin-uploaded medicine photos and order receipts
+-- are compressed in the background and kept in image storage (file_path, and
+-- supabase_url for the Supabase Storage backend) along with a thumbnail.
+-- Receipts are matched by order_id: the order row and the image are written
+-- independently, in either order, so orders.receipt_image_id is left unset.
+ALTER TABLE images ADD COLUMN IF NOT EXISTS order_id TEXT;
+ALTER TABLE images ADD COLUMN IF NOT EXISTS thumbnail_path TEXT;
+ALTER TABLE images ADD COLUMN IF NOT EXISTS thumbnail_url TEXT;
+-- Set when Telegram rejects the stored copy too (e.g. a non-public bucket)
+ALTER TABLE images ADD COLUMN IF NOT EXISTS is_stored_broken BOOLEAN NOT NULL DEFAULT false;
+CREATE UNIQUE INDEX IF NOT EXISTS images_order_id_type_idx ON images (order_id, image_type);
+
 -- Insert default admin (replace with your admin user ID)
 INSERT INTO admins (user_id, username, full_name, role) VALUES
 (5747916482, 'admin', 'Bot Admin', 'super_admin')
@@ -1,20 +1,76 @@
 import os
 import asyncio
-from typing import Dict, List, Optional
-from supabase import create_client, Client
+import contextvars
+import datetime
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+import httpx
+from supabase import ClientOptions, create_client, Client
 from dotenv import load_dotenv
 
+from metrics import metrics, timed
+from models import Medicine, MedicineImage, Order, StoredImage
+
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# The supabase client is synchronous, so every query runs in a bounded worker
+# pool instead of on the event loop thread.
+DB_MAX_WORKERS = int(os.getenv('DB_MAX_WORKERS', '8'))
+# HTTP timeout of a query; it ends the request in its worker thread, so a slow query frees its pool slot
+DB_TIMEOUT = float(os.getenv('DB_TIMEOUT', '10'))
+# Extra seconds the caller waits before giving up on a worker that did not return by itself
+DB_TIMEOUT_BACKSTOP = 2.0
+
 # Supabase connection
 supabase_url = os.getenv('SUPABASE_URL')
 supabase_key = os.getenv('SUPABASE_KEY')
-supabase: Client = create_client(supabase_url, supabase_key)
+supabase: Client = create_client(supabase_url, supabase_key,
+                                 options=ClientOptions(postgrest_client_timeout=DB_TIMEOUT))
+
+
+class DatabaseTimeout(Exception):
+    """A query got no answer in time; a write may or may not have been applied"""
+
 
 class DatabaseManager:
-    def __init__(self):
-        self.supabase = supabase
+    def __init__(self, client: Optional[Client] = None, max_workers: int = DB_MAX_WORKERS,
+                 timeout: float = DB_TIMEOUT):
+        self.supabase = client or supabase
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='supabase')
     
+    async def _execute(self, query) -> Any:
+        """Run a blocking query in the worker pool.
+
+        The HTTP timeout of the client ends slow queries inside the worker
+        thread; ``wait_for`` is only a backstop for a thread that still does
+        not return. Either way DatabaseTimeout is raised.
+        """
+        loop = asyncio.get_running_loop()
+        # The worker thread sees the caller's context, so its logs keep the update's correlation ID
+        context = contextvars.copy_context()
+        started = time.perf_counter()
+        try:
+            # Per-method timings come from @timed; this counts failed and timed-out queries
+            with metrics.track('bot_db_query'):
+                return await asyncio.wait_for(
+                    loop.run_in_executor(self._executor, context.run, query.execute),
+                    timeout=self.timeout + DB_TIMEOUT_BACKSTOP
+                )
+        except (asyncio.TimeoutError, httpx.TimeoutException) as e:
+            raise DatabaseTimeout(f"No answer from Supabase within {self.timeout:.0f}s") from e
+        finally:
+            logger.debug("Supabase query took %.1f ms", (time.perf_counter() - started) * 1000)
+    
+    def close(self) -> None:
+        """Release the worker pool"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+    
+    @timed('bot_db')
     async def create_tables(self):
         """Create necessary tables if they don't exist"""
         try:
@@ -55,35 +111,55 @@ class DatabaseManager:
             """
             
             # Execute SQL commands (Note: Supabase handles table creation via dashboard)
-            print("Tables should be created via Supabase dashboard")
+            logger.info("Tables should be created via Supabase dashboard")
             return True
             
         except Exception as e:
-            print(f"Error creating tables: {e}")
+            logger.error("Error creating tables: %s", e)
             return False
     
     # Medicine operations
-    async def get_all_medicines(self) -> Dict[str, Dict]:
+    @timed('bot_db')
+    async def get_all_medicines(self) -> Dict[str, Medicine]:
         """Get all medicines from database"""
         try:
-            response = self.supabase.table('medicines').select('*').execute()
-            medicines = {}
-            for med in response.data:
-                medicines[med['id']] = {
-                    'name': med['name'],
-                    'benefits': med.get('benefits'),
-                    'contraindications': med.get('contraindications'),
-                    'description': med.get('description'),
-                    'price': med.get('price'),
-                    'photo': med.get('photo')
-                }
-            return medicines
+            response = await self._execute(self.supabase.table('medicines').select('*').eq('is_active', True))
+            return {med['id']: Medicine.from_row(med) for med in response.data}
         except Exception as e:
-            print(f"Error getting medicines: {e}")
+            logger.error("Error getting medicines: %s", e)
             return {}
     
-    async def add_medicine(self, med_id: str, medicine_data: Dict) -> bool:
-        """Add a new medicine to database"""
+    @timed('bot_db')
+    async def list_medicines(self, limit: int = 20,
+                             cursor: Optional[str] = None) -> Tuple[List[Medicine], Optional[str]]:
+        """Get one page of active medicines ordered by ID.
+
+        Keyset pagination like ``list_orders``: ``cursor`` is the last ID of
+        the previous page. Returns the page and the cursor of the next page
+        (None on the last page).
+        """
+        try:
+            query = self.supabase.table('medicines').select('*').eq('is_active', True)
+            if cursor:
+                query = query.gt('id', cursor)
+            response = await self._execute(query.order('id').limit(limit + 1))
+            rows = response.data
+            next_cursor = rows[limit - 1]['id'] if len(rows) > limit else None
+            return [Medicine.from_row(row) for row in rows[:limit]], next_cursor
+        except Exception as e:
+            logger.error("Error listing medicines: %s", e)
+            return [], None
+    
+    @staticmethod
+    def split_medicine_changes(rows: List[Dict]) -> Tuple[Dict[str, Medicine], List[str]]:
+        """Split changed medicines rows into live medicines and IDs of deleted ones (tombstones)"""
+        changed = {row['id']: Medicine.from_row(row) for row in rows if row.get('is_active') is not False}
+        removed = [row['id'] for row in rows if row.get('is_active') is False]
+        return changed, removed
+    
+    @timed('bot_db')
+    async def add_medicine(self, med_id: str, medicine_data: Dict) -> Optional[bool]:
+        """Add a new medicine to database; None if it timed out and the outcome is unknown"""
         try:
             data = {
                 'id': med_id,
@@ -92,97 +168,288 @@ class DatabaseManager:
                 'contraindications': medicine_data.get('contraindications'),
                 'description': medicine_data.get('description'),
                 'price': medicine_data.get('price'),
-                'photo': medicine_data.get('photo')
+                'price_minor': medicine_data.get('price_minor'),
+                'photo': medicine_data.get('photo'),
+                'category': medicine_data.get('category'),
+                'is_active': True
             }
-            response = self.supabase.table('medicines').insert(data).execute()
+            # Upsert: repeating the call after a timeout does not fail on the row it may have written
+            response = await self._execute(self.supabase.table('medicines').upsert(data, on_conflict='id'))
             return True
+        except DatabaseTimeout as e:
+            logger.warning("Adding medicine %s timed out, it may or may not be saved: %s", med_id, e)
+            return None
         except Exception as e:
-            print(f"Error adding medicine: {e}")
+            logger.error("Error adding medicine: %s", e)
             return False
     
-    async def update_medicine(self, med_id: str, medicine_data: Dict) -> bool:
-        """Update medicine in database"""
+    @timed('bot_db')
+    async def update_medicine(self, med_id: str, medicine_data: Dict) -> Optional[bool]:
+        """Update medicine in database; None if it timed out and the outcome is unknown"""
         try:
-            response = self.supabase.table('medicines').update(medicine_data).eq('id', med_id).execute()
+            response = await self._execute(self.supabase.table('medicines').update(medicine_data).eq('id', med_id))
             return True
+        except DatabaseTimeout as e:
+            logger.warning("Updating medicine %s timed out, it may or may not be saved: %s", med_id, e)
+            return None
         except Exception as e:
-            print(f"Error updating medicine: {e}")
+            logger.error("Error updating medicine: %s", e)
             return False
     
-    async def delete_medicine(self, med_id: str) -> bool:
-        """Delete medicine from database"""
+    @timed('bot_db')
+    async def delete_medicine(self, med_id: str) -> Optional[bool]:
+        """Delete medicine from database; None if it timed out and the outcome is unknown.
+
+        The row is kept as a tombstone (``is_active = false``) so delta syncs
+        in other processes see the deletion.
+        """
         try:
-            response = self.supabase.table('medicines').delete().eq('id', med_id).execute()
+            response = await self._execute(
+                self.supabase.table('medicines').update({'is_active': False}).eq('id', med_id)
+            )
             return True
+        except DatabaseTimeout as e:
+            logger.warning("Deleting medicine %s timed out, it may or may not be deleted: %s", med_id, e)
+            return None
         except Exception as e:
-            print(f"Error deleting medicine: {e}")
+            logger.error("Error deleting medicine: %s", e)
             return False
     
     # Order operations
-    async def get_all_orders(self) -> Dict[str, Dict]:
-        """Get all orders from database"""
+    @timed('bot_db')
+    async def list_orders(self, limit: int = 5, cursor: Optional[str] = None, status: Optional[str] = None,
+                          since: Optional[str] = None) -> Tuple[List[Order], Optional[str]]:
+        """Get one page of orders, newest first.
+
+        Uses keyset pagination on (created_at, id): ``cursor`` is the value
+        returned for the previous page and the query only touches the rows it
+        returns. Returns the page and the cursor of the next page (None on the
+        last page).
+        """
         try:
-            response = self.supabase.table('orders').select('*').order('created_at', desc=True).execute()
-            orders = {}
-            for order in response.data:
-                orders[order['id']] = {
-                    'order_id': order['id'],
-                    'user_id': order['user_id'],
-                    'username': order.get('username'),
-                    'full_name': order.get('full_name'),
-                    'medicine': order['medicine'],
-                    'months': order.get('months', 1),
-                    'price': order.get('price'),
-                    'status': order.get('status', 'new'),
-                    'timestamp': order['created_at'],
-                    'delivery_info': {
-                        'region': order.get('delivery_region'),
-                        'district': order.get('delivery_district'),
-                        'address': order.get('delivery_address'),
-                        'phone': order.get('phone_number')
-                    },
-                    'receipt_photo_id': order.get('receipt_photo_id')
-                }
-            return orders
+            query = self.supabase.table('orders').select('*')
+            if status:
+                query = query.eq('status', status)
+            if since:
+                query = query.gte('created_at', since)
+            if cursor:
+                created_at, order_id = cursor.split('|', 1)
+                query = query.or_(
+                    f'created_at.lt."{created_at}",'
+                    f'and(created_at.eq."{created_at}",id.lt."{order_id}")'
+                )
+            query = query.order('created_at', desc=True).order('id', desc=True).limit(limit + 1)
+            response = await self._execute(query)
+            rows = response.data
+            next_cursor = None
+            if len(rows) > limit:
+                last = rows[limit - 1]
+                next_cursor = f"{last['created_at']}|{last['id']}"
+            return [Order.from_row(order) for order in rows[:limit]], next_cursor
         except Exception as e:
-            print(f"Error getting orders: {e}")
-            return {}
+            logger.error("Error listing orders: %s", e)
+            return [], None
     
+    @staticmethod
+    def _order_to_row(order_data: Dict) -> Dict:
+        """Convert a handler order dict into an orders row"""
+        return {
+            'id': order_data['order_id'],
+            'user_id': order_data['user_id'],
+            'username': order_data.get('username'),
+            'full_name': order_data.get('full_name'),
+            'medicine': order_data['medicine'],
+            'months': order_data.get('months', 1),
+            'price': order_data.get('price'),
+            'unit_price_minor': order_data.get('unit_price_minor'),
+            'total_minor': order_data.get('total_minor'),
+            'status': order_data.get('status', 'new'),
+            'delivery_region': order_data['delivery_info'].get('region'),
+            'delivery_district': order_data['delivery_info'].get('district'),
+            'delivery_address': order_data['delivery_info'].get('address'),
+            'phone_number': order_data['delivery_info'].get('phone'),
+            'receipt_photo_id': order_data.get('receipt_photo_id')
+        }
+    
+    @timed('bot_db')
     async def add_order(self, order_data: Dict) -> bool:
         """Add a new order to database"""
         try:
-            data = {
-                'id': order_data['order_id'],
-                'user_id': order_data['user_id'],
-                'username': order_data.get('username'),
-                'full_name': order_data.get('full_name'),
-                'medicine': order_data['medicine'],
-                'months': order_data.get('months', 1),
-                'price': order_data.get('price'),
-                'status': order_data.get('status', 'new'),
-                'delivery_region': order_data['delivery_info'].get('region'),
-                'delivery_district': order_data['delivery_info'].get('district'),
-                'delivery_address': order_data['delivery_info'].get('address'),
-                'phone_number': order_data['delivery_info'].get('phone'),
-                'receipt_photo_id': order_data.get('receipt_photo_id')
-            }
-            response = self.supabase.table('orders').insert(data).execute()
+            await self.add_orders([order_data])
             return True
         except Exception as e:
-            print(f"Error adding order: {e}")
+            logger.error("Error adding order: %s", e)
             return False
     
-    async def update_order_status(self, order_id: str, status: str) -> bool:
-        """Update order status in database"""
+    @timed('bot_db')
+    async def add_orders(self, orders: List[Dict]) -> List[str]:
+        """Insert several orders in one request and return the IDs that were new.
+
+        Orders whose ID already exists are skipped rather than failing the
+        batch, which makes resubmitting the same order harmless. Errors are
+        raised so callers can tell the customer the order was not saved.
+        """
+        rows = [self._order_to_row(order) for order in orders]
+        response = await self._execute(
+            self.supabase.table('orders').upsert(rows, on_conflict='id', ignore_duplicates=True)
+        )
+        return [row['id'] for row in response.data or []]
+    
+    @timed('bot_db')
+    async def get_order_owners(self, order_ids: List[str]) -> Dict[str, int]:
+        """Map existing order IDs to the user who placed them"""
+        response = await self._execute(
+            self.supabase.table('orders').select('id, user_id').in_('id', order_ids)
+        )
+        return {row['id']: row['user_id'] for row in response.data or []}
+    
+    @timed('bot_db')
+    async def update_order_status(self, order_id: str, status: str) -> Optional[bool]:
+        """Update order status in database; None if it timed out and the outcome is unknown"""
         try:
-            response = self.supabase.table('orders').update({
+            response = await self._execute(self.supabase.table('orders').update({
                 'status': status,
                 'updated_at': 'NOW()'
-            }).eq('id', order_id).execute()
+            }).eq('id', order_id))
             return True
+        except DatabaseTimeout as e:
+            logger.warning("Updating order %s status timed out, it may or may not be saved: %s", order_id, e)
+            return None
         except Exception as e:
-            print(f"Error updating order status: {e}")
+            logger.error("Error updating order status: %s", e)
             return False
 
+    # Statistics
+    STATS_PERIODS = {'day': 1, 'week': 7, 'month': 30, 'all': None}
+    
+    @timed('bot_db')
+    async def get_order_stats(self, period: str = 'all') -> Dict:
+        """Get aggregated order statistics for a period ('day', 'week', 'month' or 'all').
+
+        Aggregation happens in the database (``get_order_stats`` in
+        create_tables.sql) over a trigger-maintained daily rollup, so the
+        response size and cost do not grow with the orders table.
+        """
+        try:
+            days = self.STATS_PERIODS[period]
+            since = None
+            if days is not None:
+                since = (datetime.date.today() - datetime.timedelta(days=days - 1)).isoformat()
+            response = await self._execute(self.supabase.rpc('get_order_stats', {'since': since}))
+            return response.data or {}
+        except Exception as e:
+            logger.error("Error getting order stats: %s", e)
+            return {}
+
+    # Delta sync
+    @timed('bot_db')
+    async def fetch_changes(self, table: str, since: Optional[str] = None, limit: int = 500) -> List[Dict]:
+        """Get up to ``limit`` rows of ``table`` changed after ``since``, oldest change first.
+
+        ``since`` is an ``updated_at|id`` keyset position (the last row of
+        the previous page); None starts from the beginning of the table.
+        Deleted medicines come back as tombstones with ``is_active = false``.
+        Errors are raised so a failed page is not mistaken for no changes.
+        """
+        query = self.supabase.table(table).select('*')
+        if since:
+            updated_at, row_id = since.split('|', 1)
+            query = query.or_(
+                f'updated_at.gt."{updated_at}",'
+                f'and(updated_at.eq."{updated_at}",id.gt."{row_id}")'
+            )
+        response = await self._execute(query.order('updated_at').order('id').limit(limit))
+        return response.data or []
+    
+    # Medicine photos
+    @timed('bot_db')
+    async def get_medicine_images(self) -> List[MedicineImage]:
+        """Known state of every medicine photo (validated file_ids, thumbnails, broken flags)"""
+        try:
+            response = await self._execute(
+                self.supabase.table('images').select('*').eq('image_type', 'medicine_photo')
+            )
+            return [MedicineImage.from_row(row) for row in response.data or [] if row.get('medicine_id')]
+        except Exception as e:
+            logger.error("Error getting medicine images: %s", e)
+            return []
+    
+    @timed('bot_db')
+    async def save_medicine_image(self, image: MedicineImage) -> None:
+        """Insert or replace the ``images`` row of a medicine's photo; errors are raised"""
+        row = dict(image.to_row(), checked_at=datetime.datetime.now(datetime.timezone.utc).isoformat())
+        await self._execute(self.supabase.table('images').upsert(row, on_conflict='medicine_id,image_type'))
+    
+    # Receipt photos
+    @timed('bot_db')
+    async def save_receipt_image(self, order_id: str, file_id: str, uploaded_by: Optional[int],
+                                 image: StoredImage) -> None:
+        """Insert or replace the stored copy of an order's receipt; errors are raised"""
+        row = dict(image.to_row(), order_id=order_id, image_type='receipt_photo',
+                   telegram_file_id=file_id, uploaded_by=uploaded_by)
+        await self._execute(self.supabase.table('images').upsert(row, on_conflict='order_id,image_type'))
+    
+    @timed('bot_db')
+    async def get_receipt_image(self, order_id: str) -> Optional[StoredImage]:
+        """Stored copy of an order's receipt, None if there is none (yet)"""
+        try:
+            response = await self._execute(
+                self.supabase.table('images').select('*')
+                .eq('order_id', order_id).eq('image_type', 'receipt_photo').limit(1)
+            )
+            return StoredImage.from_row(response.data[0]) if response.data else None
+        except Exception as e:
+            logger.error("Error getting receipt image of order %s: %s", order_id, e)
+            return None
+    
+    # Change feed
+    @timed('bot_db')
+    async def get_latest_change_seq(self) -> int:
+        """Sequence number of the newest change_log entry (0 when empty)"""
+        response = await self._execute(
+            self.supabase.table('change_log').select('seq').order('seq', desc=True).limit(1)
+        )
+        return response.data[0]['seq'] if response.data else 0
+    
+    @timed('bot_db')
+    async def get_changes(self, after_seq: int, limit: int = 500) -> List[Dict]:
+        """change_log entries newer than ``after_seq``, oldest first"""
+        response = await self._execute(
+            self.supabase.table('change_log').select('*').gt('seq', after_seq).order('seq').limit(limit)
+        )
+        return response.data or []
+    
+    @timed('bot_db')
+    async def prune_changes(self, older_than: float) -> None:
+        """Delete change_log entries logged more than ``older_than`` seconds ago; errors are raised"""
+        # changed_at is a UTC timestamp without a time zone
+        cutoff = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=older_than)
+        await self._execute(
+            self.supabase.table('change_log').delete().lt('changed_at', cutoff.replace(tzinfo=None).isoformat())
+        )
+    
+    # Broadcast recipients
+    @timed('bot_db')
+    async def get_customer_ids(self, after: int = 0, limit: int = 500) -> List[int]:
+        """Get up to ``limit`` distinct customer user IDs greater than ``after``, ascending.
+
+        Errors are raised rather than swallowed so a failed page is not
+        mistaken for the end of the list.
+        """
+        response = await self._execute(
+            self.supabase.rpc('get_customer_ids', {'after_id': after, 'batch_size': limit})
+        )
+        return [row['user_id'] for row in response.data or []]
+
+    @timed('bot_db')
+    async def count_customers(self) -> int:
+        """Count distinct customers who have placed an order"""
+        try:
+            response = await self._execute(self.supabase.rpc('count_customers', {}))
+            return int(response.data or 0)
+        except Exception as e:
+            logger.error("Error counting customers: %s", e)
+            return 0
+
 # Global database manager instance
 db = DatabaseManager()
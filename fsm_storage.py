@@ -0,0 +1,128 @@
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, Mapping, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from local_store import LOCAL_DB_PATH, LocalDatabase
+
+logger = logging.getLogger(__name__)
+
+# memory | sqlite | redis
+FSM_STORAGE = os.getenv('FSM_STORAGE', 'sqlite')
+# Abandoned checkouts expire after this many seconds of inactivity
+FSM_TTL = int(os.getenv('FSM_TTL', str(24 * 60 * 60)))
+REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+
+
+class SQLiteStorage(BaseStorage):
+    """Durable FSM storage in a local SQLite (WAL) database.
+
+    Every write refreshes the record's expiry; expired records are ignored on
+    read and purged periodically. Writing the state or the data of an
+    expired record also clears the other one, so it is not revived.
+    """
+
+    PURGE_INTERVAL = 600
+
+    def __init__(self, database: Optional[LocalDatabase] = None, ttl: int = FSM_TTL):
+        self.database = database or LocalDatabase()
+        self.ttl = ttl
+        self.key_builder = DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self._ready = False
+        self._next_purge = 0.0
+
+    async def _prepare(self) -> None:
+        if self._ready:
+            return
+        await self.database.execute("""
+            CREATE TABLE IF NOT EXISTS fsm_sessions (
+                key TEXT PRIMARY KEY,
+                state TEXT,
+                data TEXT NOT NULL DEFAULT '{}',
+                expires_at REAL NOT NULL
+            )
+        """)
+        self._ready = True
+
+    async def _purge_expired(self, now: float) -> None:
+        if now < self._next_purge:
+            return
+        self._next_purge = now + self.PURGE_INTERVAL
+        removed = await self.database.execute('DELETE FROM fsm_sessions WHERE expires_at < ?', (now,))
+        if removed:
+            logger.info("Purged %s expired FSM sessions", removed)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        await self._prepare()
+        now = time.time()
+        value = state.state if isinstance(state, State) else state
+        await self.database.execute(
+            """
+            INSERT INTO fsm_sessions (key, state, expires_at) VALUES (?, ?, ?)
+            ON CONFLICT (key) DO UPDATE SET
+                state = excluded.state,
+                data = CASE WHEN fsm_sessions.expires_at < ? THEN '{}' ELSE fsm_sessions.data END,
+                expires_at = excluded.expires_at
+            """,
+            (self.key_builder.build(key), value, now + self.ttl, now)
+        )
+        await self._purge_expired(now)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        await self._prepare()
+        row = await self.database.fetchone(
+            'SELECT state FROM fsm_sessions WHERE key = ? AND expires_at >= ?',
+            (self.key_builder.build(key), time.time())
+        )
+        return row['state'] if row else None
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        await self._prepare()
+        now = time.time()
+        await self.database.execute(
+            """
+            INSERT INTO fsm_sessions (key, data, expires_at) VALUES (?, ?, ?)
+            ON CONFLICT (key) DO UPDATE SET
+                data = excluded.data,
+                state = CASE WHEN fsm_sessions.expires_at < ? THEN NULL ELSE fsm_sessions.state END,
+                expires_at = excluded.expires_at
+            """,
+            (self.key_builder.build(key), json.dumps(dict(data), ensure_ascii=False), now + self.ttl, now)
+        )
+        await self._purge_expired(now)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        await self._prepare()
+        row = await self.database.fetchone(
+            'SELECT data FROM fsm_sessions WHERE key = ? AND expires_at >= ?',
+            (self.key_builder.build(key), time.time())
+        )
+        return json.loads(row['data']) if row else {}
+
+    async def close(self) -> None:
+        await self.database.close()
+
+
+def create_fsm_storage(backend: str = FSM_STORAGE, redis=None) -> BaseStorage:
+    """Build the FSM storage selected by FSM_STORAGE.
+
+    ``redis`` may be an already constructed (or stand-in) asyncio Redis
+    client; otherwise one is created from REDIS_URL.
+    """
+    if backend == 'memory':
+        return MemoryStorage()
+    if backend == 'sqlite':
+        return SQLiteStorage(LocalDatabase(os.getenv('FSM_SQLITE_PATH', LOCAL_DB_PATH)))
+    if backend == 'redis':
+        # Optional dependency: pip install redis
+        from aiogram.fsm.storage.redis import RedisStorage
+        if redis is None:
+            from redis.asyncio import Redis
+            redis = Redis.from_url(REDIS_URL)
+        return RedisStorage(redis, state_ttl=FSM_TTL, data_ttl=FSM_TTL)
+    raise ValueError(f"Unknown FSM_STORAGE backend: {backend}")
@@ -0,0 +1,204 @@
+import asyncio
+import hashlib
+import io
+import logging
+import os
+from typing import Any, Awaitable, Callable, Dict, NamedTuple, Optional, Union
+
+from aiogram.types import FSInputFile, InputFile
+
+from models import StoredImage
+from outbox import Outbox
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    # Listed in requirements.txt; without it photos are stored as received, with no thumbnail
+    Image = ImageOps = None
+
+logger = logging.getLogger(__name__)
+
+# Whether stored copies are compressed and get a thumbnail
+HAS_PILLOW = Image is not None
+
+# local | supabase
+IMAGE_STORAGE = os.getenv('IMAGE_STORAGE', 'local')
+# Directory of the local storage
+IMAGE_STORAGE_PATH = os.getenv('IMAGE_STORAGE_PATH', 'data/images')
+# Supabase Storage bucket; it must be public for Telegram to fetch stored copies by URL
+IMAGE_BUCKET = os.getenv('IMAGE_BUCKET', 'images')
+# Stored copies are re-encoded as JPEG no larger than this on either side
+IMAGE_MAX_SIDE = int(os.getenv('IMAGE_MAX_SIDE', '1280'))
+IMAGE_THUMBNAIL_SIDE = int(os.getenv('IMAGE_THUMBNAIL_SIDE', '320'))
+IMAGE_QUALITY = int(os.getenv('IMAGE_QUALITY', '82'))
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', '2'))
+
+# Bots cannot download larger files through the Bot API
+MAX_DOWNLOAD_SIZE = 20 * 1024 * 1024
+
+Downloader = Callable[[str], Awaitable[bytes]]
+StoredHandler = Callable[[Dict[str, Any], StoredImage], Awaitable[None]]
+
+
+class LocalImageStorage:
+    """Image storage in a local directory; stands in for Supabase Storage in
+    development and benchmarks"""
+
+    def __init__(self, root: str = IMAGE_STORAGE_PATH):
+        self.root = root
+
+    def _full_path(self, path: str) -> str:
+        return os.path.join(self.root, *path.split('/'))
+
+    def _write(self, path: str, data: bytes) -> None:
+        full_path = self._full_path(path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        temporary = full_path + '.tmp'
+        with open(temporary, 'wb') as file:
+            file.write(data)
+        os.replace(temporary, full_path)
+
+    async def put(self, path: str, data: bytes, content_type: str) -> Optional[str]:
+        """Store ``data`` under ``path``; local files have no URL"""
+        await asyncio.to_thread(self._write, path, data)
+        return None
+
+    def input_file(self, image: StoredImage) -> Union[str, InputFile]:
+        return FSInputFile(self._full_path(image.path))
+
+
+class SupabaseImageStorage:
+    """Image storage in a Supabase Storage bucket, served by its public URLs"""
+
+    def __init__(self, client, bucket: str = IMAGE_BUCKET):
+        self.client = client
+        self.bucket = bucket
+
+    def _upload(self, path: str, data: bytes, content_type: str) -> str:
+        bucket = self.client.storage.from_(self.bucket)
+        # Paths include a hash of the file, so a path never changes content and can be cached for good
+        bucket.upload(path, data, {'content-type': content_type, 'upsert': 'true', 'cache-control': '31536000'})
+        return bucket.get_public_url(path)
+
+    async def put(self, path: str, data: bytes, content_type: str) -> Optional[str]:
+        """Upload ``data`` to ``path``; returns its public URL"""
+        return await asyncio.to_thread(self._upload, path, data, content_type)
+
+    def input_file(self, image: StoredImage) -> Union[str, InputFile]:
+        # Telegram fetches the URL itself, so the bot does not upload the bytes
+        return image.url
+
+
+def create_image_storage(backend: str = IMAGE_STORAGE, supabase=None):
+    """Build the image storage selected by IMAGE_STORAGE"""
+    if backend == 'local':
+        return LocalImageStorage()
+    if backend == 'supabase':
+        return SupabaseImageStorage(supabase)
+    raise ValueError(f"Unknown IMAGE_STORAGE backend: {backend}")
+
+
+class CompressedImage(NamedTuple):
+    data: bytes
+    width: Optional[int]
+    height: Optional[int]
+    thumbnail: Optional[bytes]
+
+
+def _encode_jpeg(image, max_side: int, quality: int) -> bytes:
+    image = image.copy()
+    image.thumbnail((max_side, max_side))
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=quality, optimize=True, progressive=True)
+    return buffer.getvalue()
+
+
+def compress_image(data: bytes, max_side: int = IMAGE_MAX_SIDE, thumbnail_side: int = IMAGE_THUMBNAIL_SIDE,
+                   quality: int = IMAGE_QUALITY) -> CompressedImage:
+    """Re-encode a photo as a JPEG of at most ``max_side`` pixels and make a thumbnail.
+
+    CPU-bound, run it in a thread. Without Pillow the photo is kept as it is
+    and there is no thumbnail.
+    """
+    if not HAS_PILLOW:
+        return CompressedImage(data, None, None, None)
+    with Image.open(io.BytesIO(data)) as original:
+        image = ImageOps.exif_transpose(original)
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        compressed = _encode_jpeg(image, max_side, quality)
+        width, height = image.size
+        scale = min(1.0, max_side / max(width, height))
+        size = (round(width * scale), round(height * scale))
+        # Telegram photos are already compressed JPEGs: keep the original if re-encoding did not help
+        if original.format == 'JPEG' and scale == 1.0 and len(compressed) >= len(data):
+            compressed = data
+        return CompressedImage(compressed, size[0], size[1], _encode_jpeg(image, thumbnail_side, quality))
+
+
+class ImagePipeline:
+    """Background ingestion of uploaded photos into image storage.
+
+    ``submit`` only queues a job in a durable local queue, so handlers never
+    wait for a download. Workers fetch the file from Telegram, store a
+    compressed copy and a thumbnail, and pass the result to the handler
+    registered for the image type, which records it in the ``images`` table.
+    Failed jobs are retried with backoff, also after a restart; a stored copy
+    is kept in the job, so a retry does not upload it again.
+    """
+
+    def __init__(self, storage, download: Downloader, queue: Optional[Outbox] = None):
+        self.storage = storage
+        self.download = download
+        self.queue = queue or Outbox(workers=IMAGE_WORKERS, table='image_jobs')
+        self._handlers: Dict[str, StoredHandler] = {}
+
+    def register(self, image_type: str, handler: StoredHandler) -> None:
+        self._handlers[image_type] = handler
+
+    async def submit(self, image_type: str, file_id: str, owner_id: str, uploaded_by: Optional[int] = None) -> None:
+        """Queue a Telegram file for storage; ``owner_id`` is the medicine or order it belongs to"""
+        await self.queue.enqueue(image_type, {
+            'image_type': image_type,
+            'file_id': file_id,
+            'owner_id': owner_id,
+            'uploaded_by': uploaded_by,
+        })
+
+    async def _store(self, job: Dict[str, Any]) -> StoredImage:
+        data = await self.download(job['file_id'])
+        compressed = await asyncio.to_thread(compress_image, data)
+        digest = hashlib.sha256(job['file_id'].encode()).hexdigest()[:16]
+        base = f"{job['image_type']}/{job['owner_id']}/{digest}"
+        image = StoredImage(
+            path=f'{base}.jpg',
+            size=len(compressed.data),
+            width=compressed.width,
+            height=compressed.height,
+        )
+        image.url = await self.storage.put(image.path, compressed.data, image.mime_type)
+        if compressed.thumbnail is not None:
+            image.thumbnail_path = f'{base}_thumb.jpg'
+            image.thumbnail_url = await self.storage.put(image.thumbnail_path, compressed.thumbnail, image.mime_type)
+        logger.info("Stored %s of %s: %s bytes (was %s)", job['image_type'], job['owner_id'],
+                    image.size, len(data))
+        return image
+
+    async def _ingest(self, job: Dict[str, Any]) -> None:
+        handler = self._handlers[job['image_type']]
+        image = StoredImage.from_row(job['stored']) if job.get('stored') else None
+        if image is None:
+            image = await self._store(job)
+            job['stored'] = image.to_row()
+        await handler(job, image)
+
+    async def start(self) -> None:
+        for image_type in self._handlers:
+            self.queue.register(image_type, self._ingest)
+        await self.queue.start()
+
+    async def stop(self) -> None:
+        await self.queue.stop()
+
+    async def pending(self) -> int:
+        return await self.queue.pending()
@@ -0,0 +1,280 @@
+import asyncio
+import contextlib
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: no file locking, so give each process its own ORDER_JOURNAL_PATH
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+ORDER_JOURNAL_PATH = os.getenv('ORDER_JOURNAL_PATH', 'data/orders.journal')
+# Seconds between attempts to drain the journal while the database is unreachable (doubles up to the max)
+JOURNAL_RETRY_INTERVAL = float(os.getenv('JOURNAL_RETRY_INTERVAL', '5'))
+JOURNAL_RETRY_MAX = float(os.getenv('JOURNAL_RETRY_MAX', '300'))
+
+Sink = Callable[[Dict[str, Any]], Awaitable[Any]]
+ReassignedHandler = Callable[[Dict[str, Any], str], Awaitable[None]]
+
+
+class OrderJournal:
+    """Append-only JSONL write-ahead log for orders.
+
+    An order is appended (and fsynced) before anything else happens to it,
+    so once ``append`` returns the order survives a crash or a database
+    outage. Appends that arrive while a write is in progress are grouped
+    into the next write and share one fsync. A background replayer hands
+    unacknowledged orders to ``sink`` (the remote insert) and appends an
+    ``ack`` record for each one stored; on startup the file is read back and
+    whatever was not acknowledged is replayed. Once everything is
+    acknowledged the file is compacted; compaction holds the write lock, so
+    it neither drops nor races records that are still being appended.
+
+    Several processes may share one file: every write and the compaction
+    hold an exclusive ``flock`` on it, a compaction keeps every order still
+    unacknowledged in the file (whichever process wrote it), and a process
+    whose file was replaced by another's compaction reopens it before
+    writing. On startup each process replays all unacknowledged orders; the
+    sink is idempotent, so an order still in flight elsewhere is not stored twice.
+
+    A sink may return ``(saved_id, created)``; when the order was stored
+    under a different ID (see order_writer.py), ``on_reassigned(order,
+    saved_id)`` is awaited before the ack, so whoever was told the original
+    ID can be told the new one.
+    """
+
+    COMPACT_BYTES = 1024 * 1024
+
+    def __init__(self, path: str = ORDER_JOURNAL_PATH, retry_interval: float = JOURNAL_RETRY_INTERVAL,
+                 retry_max: float = JOURNAL_RETRY_MAX):
+        self.path = path
+        self.retry_interval = retry_interval
+        self.retry_max = retry_max
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='journal')
+        self._file = None
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        # Orders whose record is in the file and whose ack is not: stay known after a compaction
+        self._unacked: Dict[str, Dict[str, Any]] = {}
+        self._known: Set[str] = set()
+        self._buffer: List[Tuple[str, Dict[str, Any], asyncio.Future]] = []
+        self._write_lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._replay_task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+        self._size = 0
+        self.on_reassigned: Optional[ReassignedHandler] = None
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    # File access, always on the journal thread
+    def _open(self):
+        if self._file is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._file = open(self.path, 'a', encoding='utf-8')
+        return self._file
+
+    @contextlib.contextmanager
+    def _locked(self) -> Iterator[Any]:
+        """The open journal, exclusively locked against other processes using the same path"""
+        while True:
+            handle = self._open()
+            if fcntl is not None:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+            try:
+                replaced = os.stat(self.path).st_ino != os.fstat(handle.fileno()).st_ino
+            except FileNotFoundError:
+                replaced = True
+            if not replaced:
+                break
+            # Another process compacted the file while we held the old one open
+            handle.close()
+            self._file = None
+        try:
+            yield handle
+        finally:
+            if fcntl is not None and not handle.closed:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+
+    def _write_lines(self, lines: List[str]) -> int:
+        with self._locked() as handle:
+            handle.write(''.join(lines))
+            handle.flush()
+            os.fsync(handle.fileno())
+            return handle.tell()
+
+    def _read(self) -> Tuple[Dict[str, Dict[str, Any]], Set[str], int]:
+        pending: Dict[str, Dict[str, Any]] = {}
+        known: Set[str] = set()
+        if not os.path.exists(self.path):
+            return pending, known, 0
+        with open(self.path, encoding='utf-8') as handle:
+            for number, line in enumerate(handle, 1):
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A torn final line from a crash mid-write; the append never returned
+                    logger.warning("Skipping unreadable journal line %s", number)
+                    continue
+                if record['op'] == 'order':
+                    order = record['order']
+                    known.add(order['order_id'])
+                    pending[order['order_id']] = order
+                elif record['op'] == 'ack':
+                    pending.pop(record['id'], None)
+        return pending, known, os.path.getsize(self.path)
+
+    def _rewrite(self) -> int:
+        """Replace the file with its unacknowledged orders, including other processes' ones"""
+        with self._locked() as journal:
+            pending, _, _ = self._read()
+            temporary = f'{self.path}.{os.getpid()}.tmp'
+            with open(temporary, 'w', encoding='utf-8') as handle:
+                for order in pending.values():
+                    handle.write(json.dumps({'op': 'order', 'order': order}, ensure_ascii=False) + '\n')
+                handle.flush()
+                os.fsync(handle.fileno())
+            os.replace(temporary, self.path)
+            # Closing releases the lock; waiting processes then see the new inode and reopen
+            journal.close()
+            self._file = None
+        return os.path.getsize(self.path)
+
+    async def _run(self, func, *args) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    # Group commit
+    async def _append_record(self, record: Dict[str, Any]) -> None:
+        future = asyncio.get_running_loop().create_future()
+        self._buffer.append((json.dumps(record, ensure_ascii=False) + '\n', record, future))
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush())
+        await future
+
+    async def _flush(self) -> None:
+        while self._buffer:
+            async with self._write_lock:
+                batch, self._buffer = self._buffer, []
+                try:
+                    self._size = await self._run(self._write_lines, [line for line, _, _ in batch])
+                except Exception as e:
+                    logger.error("Order journal write failed: %s", e)
+                    for _, _, future in batch:
+                        if not future.done():
+                            future.set_exception(e)
+                    continue
+                for _, record, _ in batch:
+                    if record['op'] == 'order':
+                        self._unacked[record['order']['order_id']] = record['order']
+                    else:
+                        self._unacked.pop(record['id'], None)
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_result(None)
+
+    async def append(self, order: Dict[str, Any]) -> bool:
+        """Durably record an order; False if this order ID was already journaled"""
+        order_id = order['order_id']
+        if order_id in self._known:
+            return False
+        self._known.add(order_id)
+        try:
+            await self._append_record({'op': 'order', 'order': order})
+        except Exception:
+            self._known.discard(order_id)
+            raise
+        self._pending[order_id] = order
+        self._wakeup.set()
+        return True
+
+    async def _ack(self, order_id: str) -> None:
+        self._pending.pop(order_id, None)
+        await self._append_record({'op': 'ack', 'id': order_id})
+
+    # Recovery and replay
+    async def start(self, sink: Sink) -> None:
+        """Load unacknowledged orders and start draining them into ``sink``"""
+        pending, known, self._size = await self._run(self._read)
+        self._pending.update(pending)
+        self._unacked.update(pending)
+        self._known.update(known)
+        if pending:
+            logger.info("Recovered %s unsaved orders from the journal", len(pending))
+            self._wakeup.set()
+        self._replay_task = asyncio.create_task(self._replay_forever(sink))
+
+    async def _replay_once(self, sink: Sink) -> bool:
+        """Try every pending order once; True when all were stored"""
+        orders = list(self._pending.values())
+        results = await asyncio.gather(*(sink(order) for order in orders), return_exceptions=True)
+        failed = 0
+        for order, result in zip(orders, results):
+            if isinstance(result, BaseException):
+                failed += 1
+                continue
+            saved_id = result[0] if isinstance(result, tuple) else order['order_id']
+            if saved_id != order['order_id'] and self.on_reassigned is not None:
+                logger.warning("Order %s was saved as %s", order['order_id'], saved_id)
+                try:
+                    await self.on_reassigned(order, saved_id)
+                except Exception as e:
+                    # Stored either way; acking keeps it from being written again
+                    logger.error("Could not report new ID %s of order %s: %s", saved_id, order['order_id'], e)
+            await self._ack(order['order_id'])
+        if failed:
+            logger.warning("%s journaled orders not saved yet, will retry", failed)
+        return not failed
+
+    async def _replay_forever(self, sink: Sink) -> None:
+        delay = self.retry_interval
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            if not self._pending:
+                continue
+            if await self._replay_once(sink):
+                delay = self.retry_interval
+                await self._maybe_compact()
+                continue
+            # Database unreachable: back off, but new orders still wake the loop up
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.set()
+            delay = min(self.retry_max, delay * 2)
+
+    async def _maybe_compact(self) -> None:
+        # No write is in flight while the lock is held; queued ones go to the new file afterwards
+        async with self._write_lock:
+            if self._pending or self._size < self.COMPACT_BYTES:
+                return
+            self._size = await self._run(self._rewrite)
+            # Orders still waiting in the buffer stay known, so a retry cannot journal them twice
+            self._known = set(self._unacked) | {
+                record['order']['order_id'] for _, record, _ in self._buffer if record['op'] == 'order'
+            }
+        logger.info("Order journal compacted")
+
+    async def close(self) -> None:
+        """Stop replaying and flush outstanding records; pending orders stay for the next start"""
+        if self._replay_task is not None:
+            self._replay_task.cancel()
+            await asyncio.gather(self._replay_task, return_exceptions=True)
+        if self._flush_task is not None:
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+
+        def close_file():
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+        await self._run(close_file)
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,67 @@
+import asyncio
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Iterable, List, Optional, Sequence
+
+LOCAL_DB_PATH = os.getenv('LOCAL_DB_PATH', 'data/bot.sqlite3')
+
+
+class LocalDatabase:
+    """SQLite database owned by a single worker thread.
+
+    All statements run on that thread, so callers on the event loop never
+    block on disk I/O and the connection is never shared between threads.
+    The database uses WAL journaling, so several processes can share one
+    file.
+    """
+
+    def __init__(self, path: str = LOCAL_DB_PATH):
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='sqlite')
+        self._connection: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            connection.row_factory = sqlite3.Row
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._connection = connection
+        return self._connection
+
+    async def _run(self, func, *args) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    async def execute(self, sql: str, params: Sequence = ()) -> int:
+        """Run a statement and return the number of affected rows"""
+        return await self._run(lambda: self._connect().execute(sql, params).rowcount)
+
+    async def executemany(self, sql: str, rows: Iterable[Sequence]) -> None:
+        def run():
+            connection = self._connect()
+            with connection:
+                connection.execute('BEGIN')
+                connection.executemany(sql, rows)
+        await self._run(run)
+
+    async def executescript(self, script: str) -> None:
+        await self._run(lambda: self._connect().executescript(script))
+
+    async def fetchone(self, sql: str, params: Sequence = ()) -> Optional[sqlite3.Row]:
+        return await self._run(lambda: self._connect().execute(sql, params).fetchone())
+
+    async def fetchall(self, sql: str, params: Sequence = ()) -> List[sqlite3.Row]:
+        return await self._run(lambda: self._connect().execute(sql, params).fetchall())
+
+    async def close(self) -> None:
+        def run():
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+        await self._run(run)
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,127 @@
+import contextvars
+import datetime
+import json
+import logging
+import os
+import random
+import sys
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+# Root level, e.g. INFO or DEBUG
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+# 'text' for people, 'json' (one object per line) for log collectors
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')
+# Per-logger levels: "database=DEBUG,aiogram.event=WARNING"
+LOG_LEVELS = os.getenv('LOG_LEVELS', 'aiogram.event=WARNING')
+# Fraction of DEBUG/INFO records kept per logger: "bot.views=0.05"
+LOG_SAMPLE = os.getenv('LOG_SAMPLE', 'bot.views=0.1')
+
+# Set for the duration of each update, so every record logged while handling
+# it (including in DatabaseManager) can be tied back to that update
+correlation_id: contextvars.ContextVar[str] = contextvars.ContextVar('correlation_id', default='-')
+
+# Attributes every LogRecord has; anything else came in through ``extra=``
+_RECORD_FIELDS = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+
+def parse_mapping(spec: str) -> Dict[str, str]:
+    """Parse "name=value,name=value" (blank entries are ignored)"""
+    mapping = {}
+    for entry in spec.split(','):
+        name, _, value = entry.partition('=')
+        if name.strip() and value.strip():
+            mapping[name.strip()] = value.strip()
+    return mapping
+
+
+def _lookup(rates: Dict[str, float], name: str) -> Optional[float]:
+    # The most specific configured ancestor wins: "bot.views" before "bot"
+    while name:
+        if name in rates:
+            return rates[name]
+        name = name.rpartition('.')[0]
+    return None
+
+
+class CorrelationFilter(logging.Filter):
+    """Adds ``correlation_id`` to every record"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.correlation_id = correlation_id.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps only a fraction of DEBUG/INFO records from high-frequency loggers.
+
+    Warnings and errors always pass. Kept records carry ``sample_rate`` so
+    counts can be scaled back up downstream.
+    """
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = _lookup(self.rates, record.name)
+        if rate is None or rate >= 1:
+            return True
+        record.sample_rate = rate
+        return random.random() < rate
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record; fields passed with ``extra=`` are included"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            'ts': datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def setup_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT, levels: str = LOG_LEVELS,
+                  sample: str = LOG_SAMPLE) -> None:
+    """Configure the root handler; call once at startup.
+
+    Per-logger levels are applied with ``setLevel`` so disabled calls return
+    before their arguments are formatted.
+    """
+    handler = logging.StreamHandler(sys.stderr)
+    if fmt == 'json':
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter(
+            '%(asctime)s - %(name)s - %(levelname)s - [%(correlation_id)s] %(message)s'
+        ))
+    handler.addFilter(CorrelationFilter())
+    rates = {name: float(rate) for name, rate in parse_mapping(sample).items()}
+    if rates:
+        handler.addFilter(SamplingFilter(rates))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level.upper())
+    for name, name_level in parse_mapping(levels).items():
+        logging.getLogger(name).setLevel(name_level.upper())
+
+
+async def correlation_middleware(handler: Callable[..., Awaitable[Any]], event, data: Dict[str, Any]) -> Any:
+    """Outer update middleware: tag everything logged while handling an update with its ID"""
+    token = correlation_id.set(f'u{event.update_id}')
+    try:
+        return await handler(event, data)
+    finally:
+        correlation_id.reset(token)
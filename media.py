@@ -0,0 +1,211 @@
+import asyncio
+import dataclasses
+import logging
+import os
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set, Union
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import InputFile, PhotoSize
+
+from models import Medicine, MedicineImage, StoredImage
+
+logger = logging.getLogger(__name__)
+
+# Unchecked medicine photos validated with getFile at the same time at startup
+MEDIA_WARM_CONCURRENCY = int(os.getenv('MEDIA_WARM_CONCURRENCY', '4'))
+
+# Bad Request descriptions that mean the photo itself is unusable, as opposed
+# to e.g. a message that can no longer be edited
+_BROKEN_PHOTO_ERRORS = (
+    'wrong file identifier', 'file_id', 'wrong remote file', 'failed to get http url content',
+    'wrong type of the web page content', 'photo_invalid', 'image_process_failed', 'file must be non-empty',
+)
+
+
+def is_broken_photo_error(error: BaseException) -> bool:
+    return isinstance(error, TelegramBadRequest) and any(
+        marker in error.message.lower() for marker in _BROKEN_PHOTO_ERRORS
+    )
+
+
+class MediaCache:
+    """Working Telegram file_ids for medicine photos, backed by the ``images`` table.
+
+    After Telegram accepts a photo once, the file_id it returned is what gets
+    sent from then on, so photos given as URLs are not fetched again. Once a
+    compressed copy is kept in image storage (see image_store.py), the next
+    view sends that copy instead and its file_id replaces the original one,
+    so customers download the smaller photo from then on. Inline search
+    shows the stored copy's thumbnail, which Telegram can only take as a URL.
+    A photo Telegram rejects is marked broken, here and in the table, so
+    product cards go straight to text instead of retrying it on every view,
+    unless a stored copy exists and Telegram has not rejected that as well. Entries apply to the ``photo`` value they
+    were recorded for: an admin uploading a new photo starts over.
+    """
+
+    def __init__(self, load: Callable[[], Awaitable[List[MedicineImage]]],
+                 save: Callable[[MedicineImage], Awaitable[None]], storage=None):
+        self._load = load
+        self._save = save
+        self.storage = storage
+        self._entries: Dict[str, MedicineImage] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self._warming: Optional[asyncio.Task] = None
+
+    async def load(self) -> int:
+        """Read the saved photo states; returns how many there are.
+
+        States recorded while the load was running are newer and kept.
+        """
+        loaded = {image.medicine_id: image for image in await self._load()}
+        self._entries = {**loaded, **self._entries}
+        return len(self._entries)
+
+    def _entry(self, med: Medicine) -> Optional[MedicineImage]:
+        entry = self._entries.get(med.id)
+        if entry is None or entry.source != med.photo:
+            return None
+        return entry
+
+    def photo(self, med: Medicine) -> Union[str, InputFile, None]:
+        """What to send as ``med``'s photo; None when it has none or it is broken"""
+        if not med.photo:
+            return None
+        entry = self._entry(med)
+        if entry is None:
+            return med.photo
+        if entry.file_id and not entry.broken:
+            return entry.file_id
+        # No file_id for the stored copy yet: send the copy, remember() keeps the one Telegram returns
+        if self._sends_copy(entry):
+            return self.storage.input_file(entry.stored)
+        return None if entry.broken else med.photo
+
+    def _sends_copy(self, entry: MedicineImage) -> bool:
+        """Whether ``photo`` sends the stored copy for ``entry``"""
+        return (not (entry.file_id and not entry.broken) and entry.stored is not None
+                and not entry.stored_broken and self.storage is not None)
+
+    def thumbnail(self, med: Medicine) -> Optional[str]:
+        """URL of a small version of ``med``'s photo for inline results; None if there is none"""
+        entry = self._entry(med)
+        if entry is not None and entry.stored is not None and not entry.stored_broken and entry.stored.thumbnail_url:
+            return entry.stored.thumbnail_url
+        if med.photo and med.photo.startswith(('http://', 'https://')) and not self.is_broken(med):
+            return med.photo
+        return None
+
+    def is_broken(self, med: Medicine) -> bool:
+        entry = self._entry(med)
+        return entry is not None and entry.broken
+
+    def remember(self, med: Medicine, sizes: Optional[List[PhotoSize]]) -> None:
+        """Record the sizes Telegram returned for ``med``'s photo after a send or an upload"""
+        if not med.photo or not sizes:
+            return
+        entry = self._entry(med)
+        if entry is not None and entry.file_id and entry.width is not None and not entry.broken:
+            return
+        full = max(sizes, key=lambda size: size.width)
+        self._store(self._updated(
+            med,
+            file_id=full.file_id,
+            width=full.width,
+            height=full.height,
+            file_size=full.file_size,
+            broken=False,
+            error=None,
+        ))
+
+    def mark_broken(self, med: Medicine, error: BaseException) -> None:
+        """Record that Telegram rejected what ``photo`` returned for ``med``.
+
+        If that was the stored copy, the copy is marked broken as well, so the
+        card goes to text instead of sending it again on every view.
+        """
+        entry = self._entry(med)
+        copy = entry is not None and self._sends_copy(entry)
+        logger.warning("%s of medicine %s is broken: %s", 'Stored photo copy' if copy else 'Photo', med.id, error)
+        changes = {'stored_broken': True} if copy else {}
+        self._store(self._updated(med, file_id=None, broken=True, error=str(error)[:500], **changes))
+
+    async def attach(self, med: Medicine, stored: StoredImage) -> None:
+        """Record the copy of ``med``'s photo kept in image storage; save errors are raised.
+
+        The file_id of the original upload is dropped, so the next view sends the copy.
+        """
+        entry = self._entries[med.id] = self._updated(med, stored=stored, stored_broken=False, file_id=None)
+        await self._save(entry)
+
+    def _updated(self, med: Medicine, **changes) -> MedicineImage:
+        entry = self._entry(med) or MedicineImage(medicine_id=med.id, source=med.photo or '')
+        return dataclasses.replace(entry, **changes)
+
+    def _store(self, entry: MedicineImage) -> None:
+        self._entries[entry.medicine_id] = entry
+        task = asyncio.get_running_loop().create_task(self._persist(entry))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _persist(self, entry: MedicineImage) -> None:
+        try:
+            await self._save(entry)
+        except Exception as e:
+            logger.error("Error saving photo state of medicine %s: %s", entry.medicine_id, e)
+
+    async def warm(self, bot: Bot, medicines: Iterable[Medicine],
+                   concurrency: int = MEDIA_WARM_CONCURRENCY) -> int:
+        """Check photos with no saved state using getFile; returns how many are broken.
+
+        URLs are left alone: Telegram only turns them into a file_id when one
+        is actually sent.
+        """
+        unchecked = [
+            med for med in medicines
+            if med.photo and self._entry(med) is None and not med.photo.startswith(('http://', 'https://'))
+        ]
+        semaphore = asyncio.Semaphore(concurrency)
+        broken = 0
+
+        async def check(med: Medicine) -> None:
+            nonlocal broken
+            async with semaphore:
+                try:
+                    file = await bot.get_file(med.photo)
+                except Exception as e:
+                    if is_broken_photo_error(e):
+                        broken += 1
+                        self.mark_broken(med, e)
+                    else:
+                        logger.warning("Could not check photo of medicine %s: %s", med.id, e)
+                    return
+            self._store(MedicineImage(medicine_id=med.id, source=med.photo, file_id=med.photo,
+                                      file_size=file.file_size))
+
+        await asyncio.gather(*(check(med) for med in unchecked))
+        if unchecked:
+            logger.info("Checked %s medicine photos, %s broken", len(unchecked), broken)
+        return broken
+
+    async def _load_and_warm(self, bot: Bot, medicines: List[Medicine]) -> None:
+        try:
+            await self.load()
+        except Exception as e:
+            # Photos with no known state are sent as they are, so the bot works without it
+            logger.error("Error loading medicine images: %s", e)
+            return
+        await self.warm(bot, medicines)
+
+    def start(self, bot: Bot, medicines: Iterable[Medicine]) -> asyncio.Task:
+        """Load the saved states and then warm, both in the background"""
+        self._warming = asyncio.get_running_loop().create_task(self._load_and_warm(bot, list(medicines)))
+        return self._warming
+
+    async def close(self) -> None:
+        """Wait for pending saves; loading and warming are cancelled"""
+        if self._warming is not None:
+            self._warming.cancel()
+            await asyncio.gather(self._warming, return_exceptions=True)
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
@@ -0,0 +1,240 @@
+import bisect
+import contextlib
+import functools
+import logging
+import os
+import time
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+from aiogram.types import CallbackQuery, TelegramObject
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# GET /metrics (Prometheus text format) is served here; port 0 turns it off
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9100'))
+
+# Upper bounds of the latency buckets, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """Latency distribution in fixed buckets, plus sum, count and max"""
+
+    __slots__ = ('counts', 'sum', 'count', 'max')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q: float) -> float:
+        """Estimate from the buckets, interpolating inside the one that holds it"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                if index == len(BUCKETS):
+                    return self.max
+                lower = BUCKETS[index - 1] if index else 0.0
+                return min(self.max, lower + (BUCKETS[index] - lower) * (rank - seen) / count)
+            seen += count
+        return self.max
+
+
+class Metrics:
+    """In-process latency histograms, error counters and in-flight gauges.
+
+    Every timed operation ``name`` produces ``<name>_seconds``,
+    ``<name>_errors_total`` and ``<name>_in_flight``, each keyed by labels.
+    """
+
+    def __init__(self):
+        self.histograms: Dict[str, Dict[Labels, Histogram]] = defaultdict(dict)
+        self.errors: Dict[str, Dict[Labels, int]] = defaultdict(lambda: defaultdict(int))
+        self.in_flight: Dict[str, Dict[Labels, int]] = defaultdict(lambda: defaultdict(int))
+        self.collectors: Dict[str, Callable[[], Dict[str, Any]]] = {}
+        self.started = time.monotonic()
+
+    def register_gauges(self, prefix: str, collect: Callable[[], Dict[str, Any]]) -> None:
+        """Expose the numeric values ``collect()`` returns as ``<prefix>_<key>`` gauges"""
+        self.collectors[prefix] = collect
+
+    def observe(self, name: str, seconds: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        histogram = self.histograms[name].get(key)
+        if histogram is None:
+            histogram = self.histograms[name][key] = Histogram()
+        histogram.observe(seconds)
+
+    @contextlib.contextmanager
+    def track(self, name: str, **labels: str) -> Iterator[None]:
+        """Time the block; an exception escaping it is counted as an error"""
+        key = tuple(sorted(labels.items()))
+        self.in_flight[name][key] += 1
+        started = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.errors[name][key] += 1
+            raise
+        finally:
+            self.in_flight[name][key] -= 1
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def summary(self, name: str, top: int = 5) -> List[Dict[str, Any]]:
+        """The ``top`` label sets with the most total time spent, slowest first"""
+        rows = []
+        errors = self.errors.get(name, {})
+        in_flight = self.in_flight.get(name, {})
+        for key, histogram in self.histograms.get(name, {}).items():
+            rows.append({
+                'labels': dict(key),
+                'count': histogram.count,
+                'total': histogram.sum,
+                'p50': histogram.quantile(0.5),
+                'p95': histogram.quantile(0.95),
+                'max': histogram.max,
+                'errors': errors.get(key, 0),
+                'in_flight': in_flight.get(key, 0),
+            })
+        rows.sort(key=lambda row: row['total'], reverse=True)
+        return rows[:top]
+
+    def render(self) -> str:
+        """Everything in the Prometheus text exposition format"""
+        lines = []
+        for name, series in sorted(self.histograms.items()):
+            lines.append(f'# TYPE {name}_seconds histogram')
+            for key, histogram in sorted(series.items()):
+                cumulative = 0
+                for bound, count in zip(BUCKETS + (float('inf'),), histogram.counts):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f'{name}_seconds_bucket{_format_labels(key + (("le", le),))} {cumulative}')
+                lines.append(f'{name}_seconds_sum{_format_labels(key)} {histogram.sum:.6f}')
+                lines.append(f'{name}_seconds_count{_format_labels(key)} {histogram.count}')
+        for name, series in sorted(self.errors.items()):
+            lines.append(f'# TYPE {name}_errors_total counter')
+            for key, count in sorted(series.items()):
+                lines.append(f'{name}_errors_total{_format_labels(key)} {count}')
+        for name, series in sorted(self.in_flight.items()):
+            lines.append(f'# TYPE {name}_in_flight gauge')
+            for key, count in sorted(series.items()):
+                lines.append(f'{name}_in_flight{_format_labels(key)} {count}')
+        for prefix, collect in sorted(self.collectors.items()):
+            for key, value in collect().items():
+                if isinstance(value, (int, float)):
+                    lines.append(f'# TYPE {prefix}_{key} gauge')
+                    lines.append(f'{prefix}_{key} {value}')
+        lines.append('# TYPE process_uptime_seconds gauge')
+        lines.append(f'process_uptime_seconds {time.monotonic() - self.started:.1f}')
+        return '\n'.join(lines) + '\n'
+
+
+def _format_labels(key: Labels) -> str:
+    if not key:
+        return ''
+    pairs = ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in key
+    )
+    return '{' + pairs + '}'
+
+
+# Process-wide registry shared by the middlewares, DatabaseManager and /metrics
+metrics = Metrics()
+
+
+def timed(name: str, registry: Metrics = metrics) -> Callable:
+    """Decorator timing an async method as ``name`` with a ``method`` label"""
+    def decorate(func: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with registry.track(name, method=func.__name__):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def callback_prefix(data: Optional[str]) -> str:
+    # "med_bio_tribesteron" -> "med", "orders_status_new" -> "orders"
+    return (data or '').split('_', 1)[0] or '-'
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Inner middleware timing each handler by name; callback queries are also
+    timed by the prefix of their data, so one slow button shows up on its own"""
+
+    def __init__(self, registry: Metrics = metrics):
+        self.metrics = registry
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        handler_object = data.get('handler')
+        name = getattr(getattr(handler_object, 'callback', None), '__name__', 'unknown')
+        with contextlib.ExitStack() as stack:
+            stack.enter_context(self.metrics.track('bot_handler', handler=name))
+            if isinstance(event, CallbackQuery):
+                stack.enter_context(self.metrics.track('bot_callback', prefix=callback_prefix(event.data)))
+            return await handler(event, data)
+
+
+class ApiMetricsMiddleware(BaseRequestMiddleware):
+    """Bot session middleware timing each Bot API request by method"""
+
+    def __init__(self, registry: Metrics = metrics):
+        self.metrics = registry
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        with self.metrics.track('bot_api', method=method.__api_method__):
+            return await make_request(bot, method)
+
+
+async def serve_metrics(registry: Metrics = metrics, host: str = METRICS_HOST,
+                        port: int = METRICS_PORT) -> Optional[web.AppRunner]:
+    """Serve GET /metrics; returns the runner to clean up, or None if disabled or the port is taken"""
+    if not port:
+        return None
+
+    async def handle(request: web.Request) -> web.Response:
+        return web.Response(text=registry.render(), content_type='text/plain', charset='utf-8')
+
+    app = web.Application()
+    app.router.add_get('/metrics', handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, host, port).start()
+    except OSError as e:
+        logger.warning("Metrics endpoint disabled, cannot listen on %s:%s: %s", host, port, e)
+        await runner.cleanup()
+        return None
+    logger.info("Metrics served on http://%s:%s/metrics", host, port)
+    return runner
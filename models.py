@@ -0,0 +1,279 @@
+import re
+import sys
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+_NON_DIGIT = re.compile(r'[^0-9]')
+# One amount, digit groups separated by spaces, commas, dots or apostrophes
+_AMOUNT = re.compile(r"[0-9](?:[0-9\s.,'’]*[0-9])?")
+# Trailing ".5" or ",50": a fraction of a so'm rather than a thousands separator
+_FRACTION = re.compile(r'[.,]([0-9]{1,2})$')
+# "1,5 mln", "150 ming": the digits alone are not the amount
+_MULTIPLIER = re.compile(r'[0-9]\s*(?:mln|million|mlrd|ming|k|млн|минг|тыс)\b', re.IGNORECASE)
+
+# Prices are kept as integers in minor units (tiyin): 1 so'm = 100 tiyin
+MINOR_UNITS = 100
+
+
+def parse_price(label: Optional[str]) -> Optional[int]:
+    """Price in minor units from a label such as "150 000 so'm", "UZS 1,500,000" or "150.50".
+
+    All digit groups of the one amount in the label count; a last group of
+    one or two digits after a dot or comma is tiyin. None when the label
+    holds no number ("Narx kiritilmagan"), several ("2 x 150 000") or a
+    multiplier ("1,5 mln"), which would be a guess. Same rules as
+    ``price_to_minor`` in create_tables.sql.
+    """
+    label = str(label or '')
+    amounts = _AMOUNT.findall(label)
+    if len(amounts) != 1 or _MULTIPLIER.search(label):
+        return None
+    amount = amounts[0]
+    fraction = _FRACTION.search(amount)
+    if fraction is None:
+        return int(_NON_DIGIT.sub('', amount)) * MINOR_UNITS
+    whole = _NON_DIGIT.sub('', amount[:fraction.start()])
+    return int(whole) * MINOR_UNITS + int(fraction.group(1).ljust(2, '0'))
+
+
+def format_price(minor: int) -> str:
+    if minor % MINOR_UNITS:
+        return f"{minor / MINOR_UNITS:,.2f} UZS"
+    return f"{minor // MINOR_UNITS:,} UZS"
+
+
+def _amount(row: Dict[str, Any], column: str, label: Optional[str], quantity: int = 1) -> Optional[int]:
+    # Rows written before the integer columns existed only have the label
+    if row.get(column) is not None:
+        return row[column]
+    unit = parse_price(label)
+    return unit * quantity if unit is not None else None
+
+
+def _shared(value: Optional[str]) -> Optional[str]:
+    # Low-cardinality values (statuses, regions, medicine names) repeat across
+    # thousands of records; interning keeps one copy of each
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+@dataclass(slots=True)
+class Medicine:
+    """One catalog entry.
+
+    ``price_minor`` is the price in minor units (the ``price_minor``
+    column); ``price_label`` is the free-form text an admin entered, shown
+    to customers as is.
+    """
+
+    id: str
+    name: str
+    benefits: Optional[str] = None
+    contraindications: Optional[str] = None
+    description: Optional[str] = None
+    price_label: Optional[str] = None
+    price_minor: Optional[int] = None
+    photo: Optional[str] = None
+    category: Optional[str] = None
+
+    @classmethod
+    def from_row(cls, row: Dict[str, Any]) -> 'Medicine':
+        """Build from a medicines row (or a snapshot entry of the same shape)"""
+        return cls(
+            id=row['id'],
+            name=row['name'],
+            benefits=row.get('benefits'),
+            contraindications=row.get('contraindications'),
+            description=row.get('description'),
+            price_label=row.get('price'),
+            price_minor=_amount(row, 'price_minor', row.get('price')),
+            photo=row.get('photo'),
+            category=_shared(row.get('category')),
+        )
+
+    def to_row(self) -> Dict[str, Any]:
+        return {
+            'id': self.id,
+            'name': self.name,
+            'benefits': self.benefits,
+            'contraindications': self.contraindications,
+            'description': self.description,
+            'price': self.price_label,
+            'price_minor': self.price_minor,
+            'photo': self.photo,
+            'category': self.category,
+        }
+
+    def with_changes(self, changes: Dict[str, Any]) -> 'Medicine':
+        """Copy with some columns replaced, e.g. the ones an admin just edited"""
+        row = {**self.to_row(), **changes}
+        if 'price' in changes and 'price_minor' not in changes:
+            # A new label without an amount: derive the amount from the label
+            row['price_minor'] = None
+        return Medicine.from_row(row)
+
+    @property
+    def price_text(self) -> Optional[str]:
+        return self.price_label or (format_price(self.price_minor) if self.price_minor is not None else None)
+
+    def total_text(self, months: int) -> str:
+        """Price of ``months`` months for the checkout summary"""
+        total = self.total_minor(months)
+        if total is None:
+            return f"{months} x {self.price_label or 'N/A'}"
+        return format_price(total)
+
+    def total_minor(self, months: int) -> Optional[int]:
+        return self.price_minor * months if self.price_minor is not None else None
+
+
+@dataclass(slots=True)
+class Order:
+    """One order as read back from the database, with the delivery fields flattened.
+
+    ``unit_price_minor`` and ``total_minor`` are fixed when the order is
+    placed, so later catalog price changes do not alter past orders.
+    """
+
+    order_id: str
+    user_id: int
+    medicine: str
+    username: Optional[str] = None
+    full_name: Optional[str] = None
+    months: int = 1
+    price_label: Optional[str] = None
+    unit_price_minor: Optional[int] = None
+    total_minor: Optional[int] = None
+    status: str = 'new'
+    created_at: Optional[str] = None
+    region: Optional[str] = None
+    district: Optional[str] = None
+    address: Optional[str] = None
+    phone: Optional[str] = None
+    receipt_photo_id: Optional[str] = None
+
+    @classmethod
+    def from_row(cls, row: Dict[str, Any]) -> 'Order':
+        return cls(
+            order_id=row['id'],
+            user_id=row['user_id'],
+            medicine=_shared(row['medicine']),
+            username=row.get('username'),
+            full_name=row.get('full_name'),
+            months=row.get('months') or 1,
+            price_label=_shared(row.get('price')),
+            unit_price_minor=_amount(row, 'unit_price_minor', row.get('price')),
+            total_minor=_amount(row, 'total_minor', row.get('price'), row.get('months') or 1),
+            status=_shared(row.get('status') or 'new'),
+            created_at=row.get('created_at'),
+            region=_shared(row.get('delivery_region')),
+            district=_shared(row.get('delivery_district')),
+            address=row.get('delivery_address'),
+            phone=row.get('phone_number'),
+            receipt_photo_id=row.get('receipt_photo_id'),
+        )
+
+    @property
+    def total_text(self) -> str:
+        return format_price(self.total_minor) if self.total_minor is not None else (self.price_label or 'N/A')
+
+
+@dataclass(slots=True)
+class StoredImage:
+    """A compressed copy of a photo in image storage, plus an optional thumbnail.
+
+    ``url`` is set by storages that serve files over HTTP (Supabase Storage);
+    local files only have their ``path``.
+    """
+
+    path: str
+    size: int
+    mime_type: str = 'image/jpeg'
+    width: Optional[int] = None
+    height: Optional[int] = None
+    url: Optional[str] = None
+    thumbnail_path: Optional[str] = None
+    thumbnail_url: Optional[str] = None
+
+    @classmethod
+    def from_row(cls, row: Dict[str, Any]) -> Optional['StoredImage']:
+        if not row.get('file_path'):
+            return None
+        return cls(
+            path=row['file_path'],
+            size=row.get('file_size') or 0,
+            mime_type=row.get('mime_type') or 'image/jpeg',
+            width=row.get('width'),
+            height=row.get('height'),
+            url=row.get('supabase_url'),
+            thumbnail_path=row.get('thumbnail_path'),
+            thumbnail_url=row.get('thumbnail_url'),
+        )
+
+    def to_row(self) -> Dict[str, Any]:
+        return {
+            'file_name': self.path.rsplit('/', 1)[-1],
+            'file_path': self.path,
+            'file_size': self.size,
+            'mime_type': self.mime_type,
+            'width': self.width,
+            'height': self.height,
+            'supabase_url': self.url,
+            'thumbnail_path': self.thumbnail_path,
+            'thumbnail_url': self.thumbnail_url,
+        }
+
+
+@dataclass(slots=True)
+class MedicineImage:
+    """What is known about one medicine's photo (an ``images`` row of type ``medicine_photo``).
+
+    ``source`` is the ``photo`` value the row was checked for; once an admin
+    changes the photo the row no longer applies. ``file_id`` is a file_id
+    Telegram accepted and ``stored`` the copy kept in image storage, if one
+    was made; ``stored_broken`` is set once Telegram rejects that copy too.
+    """
+
+    medicine_id: str
+    source: str
+    file_id: Optional[str] = None
+    width: Optional[int] = None
+    height: Optional[int] = None
+    file_size: Optional[int] = None
+    broken: bool = False
+    error: Optional[str] = None
+    stored: Optional[StoredImage] = None
+    stored_broken: bool = False
+
+    @classmethod
+    def from_row(cls, row: Dict[str, Any]) -> 'MedicineImage':
+        return cls(
+            medicine_id=row['medicine_id'],
+            source=row.get('source') or '',
+            file_id=row.get('telegram_file_id'),
+            width=row.get('width'),
+            height=row.get('height'),
+            file_size=row.get('file_size'),
+            broken=bool(row.get('is_broken')),
+            error=row.get('last_error'),
+            stored=StoredImage.from_row(row),
+            stored_broken=bool(row.get('is_stored_broken')),
+        )
+
+    def to_row(self) -> Dict[str, Any]:
+        row = {
+            'medicine_id': self.medicine_id,
+            'image_type': 'medicine_photo',
+            'file_name': f'{self.medicine_id}.jpg',
+            'source': self.source,
+            'telegram_file_id': self.file_id,
+            'width': self.width,
+            'height': self.height,
+            'file_size': self.file_size,
+            'is_broken': self.broken,
+            'is_stored_broken': self.stored_broken,
+            'last_error': self.error,
+        }
+        # File columns of the images table describe the stored copy once there is one
+        if self.stored is not None:
+            row.update(self.stored.to_row())
+        return row
@@ -0,0 +1,143 @@
+import asyncio
+import hashlib
+import logging
+import os
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Orders confirmed within this many seconds are written in one request
+ORDER_WRITE_WINDOW = float(os.getenv('ORDER_WRITE_WINDOW', '0.05'))
+ORDER_WRITE_BATCH = int(os.getenv('ORDER_WRITE_BATCH', '50'))
+
+ORDER_ID_ALPHABET = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+ORDER_ID_LENGTH = 12
+
+
+def order_id_for(key: str) -> str:
+    """Deterministic 12-character order ID for a checkout key (~62 bits)"""
+    number = int.from_bytes(hashlib.sha256(key.encode()).digest()[:8], 'big')
+    chars = []
+    for _ in range(ORDER_ID_LENGTH):
+        number, index = divmod(number, len(ORDER_ID_ALPHABET))
+        chars.append(ORDER_ID_ALPHABET[index])
+    return ''.join(chars)
+
+
+def checkout_order_id(chat_id: int, message_id: int) -> str:
+    """Order ID for the checkout confirmed from a given summary message.
+
+    Every tap on the same "Tasdiqlash" button maps to the same ID, so a
+    double tap, a retried callback or a second bot process cannot create a
+    second order.
+    """
+    return order_id_for(f'checkout:{chat_id}:{message_id}')
+
+
+class OrderWriter:
+    """Coalesces order inserts into bulk, idempotent writes.
+
+    ``submit`` queues an order and resolves once it is stored. Orders queued
+    within ``window`` seconds (or ``max_batch`` of them) go to the database in
+    one upsert that skips IDs already present. A repeated submit of a queued
+    ID shares the first one's result. An existing row with the same ID but a
+    different customer is a hash collision: the order is given the next ID
+    in a deterministic sequence and written again, and ``submit`` returns
+    that ID, which the caller has to pass on (see OrderJournal.on_reassigned).
+    """
+
+    MAX_COLLISIONS = 3
+    MAX_ATTEMPTS = 3
+
+    def __init__(self, database, window: float = ORDER_WRITE_WINDOW, max_batch: int = ORDER_WRITE_BATCH):
+        self.database = database
+        self.window = window
+        self.max_batch = max_batch
+        self._queue: Dict[str, Tuple[Dict, asyncio.Future]] = {}
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._flushes: set = set()
+
+    async def submit(self, order: Dict) -> Tuple[str, bool]:
+        """Store an order; returns its final ID and whether this call created it.
+
+        Raises if the order could not be saved.
+        """
+        order_id = order['order_id']
+        shared = self._in_flight.get(order_id)
+        if shared is not None:
+            saved_id, _ = await asyncio.shield(shared)
+            return saved_id, False
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[order_id] = future
+        self._enqueue(order, future)
+        try:
+            return await asyncio.shield(future)
+        finally:
+            self._in_flight.pop(order_id, None)
+
+    def _enqueue(self, order: Dict, future: asyncio.Future) -> None:
+        self._queue[order['order_id']] = (order, future)
+        if len(self._queue) >= self.max_batch:
+            self._flush_soon()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.window, self._flush_soon)
+
+    def _flush_soon(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._queue:
+            return
+        batch, self._queue = self._queue, {}
+        task = asyncio.create_task(self._flush(batch))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def _write(self, orders: List[Dict]) -> List[str]:
+        for attempt in range(1, self.MAX_ATTEMPTS + 1):
+            try:
+                return await self.database.add_orders(orders)
+            except Exception as e:
+                if attempt == self.MAX_ATTEMPTS:
+                    raise
+                logger.warning("Order batch write failed (attempt %s), retrying: %s", attempt, e)
+                await asyncio.sleep(0.2 * attempt)
+
+    async def _flush(self, batch: Dict[str, Tuple[Dict, asyncio.Future]]) -> None:
+        orders = [order for order, _ in batch.values()]
+        try:
+            inserted = set(await self._write(orders))
+            skipped = [order['order_id'] for order in orders if order['order_id'] not in inserted]
+            owners = await self.database.get_order_owners(skipped) if skipped else {}
+        except Exception as e:
+            logger.error("Failed to save %s orders: %s", len(orders), e)
+            for _, future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for order_id, (order, future) in batch.items():
+            if future.done():
+                continue
+            if order_id in inserted:
+                future.set_result((order_id, True))
+            elif owners.get(order_id) == order['user_id']:
+                # Already stored by an earlier submit of the same checkout
+                future.set_result((order_id, False))
+            else:
+                collisions = order.get('_collisions', 0) + 1
+                if collisions > self.MAX_COLLISIONS:
+                    future.set_exception(RuntimeError(f"Could not allocate an order ID for {order_id}"))
+                    continue
+                logger.warning("Order ID %s already used by another customer, reassigning", order_id)
+                order = {**order, 'order_id': order_id_for(order_id), '_collisions': collisions}
+                self._enqueue(order, future)
+
+    async def close(self) -> None:
+        """Write everything still queued; called on shutdown"""
+        self._flush_soon()
+        while self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
+            self._flush_soon()
@@ -0,0 +1,212 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+
+from local_store import LocalDatabase
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_WORKERS = int(os.getenv('OUTBOX_WORKERS', '2'))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '10'))
+# Delivered messages are kept this many seconds for inspection
+OUTBOX_RETENTION = int(os.getenv('OUTBOX_RETENTION', str(7 * 24 * 60 * 60)))
+
+Handler = Callable[[Dict[str, Any]], Awaitable[None]]
+FailureHandler = Callable[[str, Dict[str, Any], BaseException], Awaitable[None]]
+
+# Errors that will not go away by retrying the same request
+PERMANENT_ERRORS = (TelegramBadRequest, TelegramForbiddenError)
+
+
+class Outbox:
+    """Durable queue of outgoing notifications stored in local SQLite.
+
+    ``enqueue`` only writes a row, so callers never wait on the Bot API.
+    Background workers claim due rows, run the handler registered for their
+    kind and retry failures with exponential backoff. A flood-control
+    ``RetryAfter`` pauses every worker for the requested time without using
+    up an attempt. Handlers may record progress in the payload dict; it is
+    saved with every retry so finished steps are not repeated. Rows left in
+    ``sending`` by a crash are picked up again on the next start. Queues
+    with their own workers share a database under different ``table`` names.
+    """
+
+    POLL_INTERVAL = 30.0
+    BASE_DELAY = 2.0
+    MAX_DELAY = 600.0
+
+    def __init__(self, database: Optional[LocalDatabase] = None, workers: int = OUTBOX_WORKERS,
+                 max_attempts: int = OUTBOX_MAX_ATTEMPTS, retention: int = OUTBOX_RETENTION,
+                 table: str = 'outbox'):
+        self.database = database or LocalDatabase()
+        self.table = table
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retention = retention
+        self.on_failure: Optional[FailureHandler] = None
+        self._handlers: Dict[str, Handler] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup = asyncio.Event()
+        self._paused_until = 0.0
+        self._ready = False
+
+    def register(self, kind: str, handler: Handler) -> None:
+        self._handlers[kind] = handler
+
+    async def _prepare(self) -> None:
+        if self._ready:
+            return
+        await self.database.executescript(f"""
+            CREATE TABLE IF NOT EXISTS {self.table} (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL,
+                last_error TEXT,
+                created_at REAL NOT NULL,
+                sent_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS {self.table}_due_idx ON {self.table} (status, next_attempt_at);
+        """)
+        self._ready = True
+
+    async def enqueue(self, kind: str, payload: Dict[str, Any]) -> None:
+        """Persist a notification for background delivery"""
+        await self._prepare()
+        now = time.time()
+        await self.database.execute(
+            f'INSERT INTO {self.table} (kind, payload, next_attempt_at, created_at) VALUES (?, ?, ?, ?)',
+            (kind, json.dumps(payload, ensure_ascii=False), now, now)
+        )
+        self._wakeup.set()
+
+    async def pending(self) -> int:
+        await self._prepare()
+        row = await self.database.fetchone(
+            f"SELECT COUNT(*) AS n FROM {self.table} WHERE status IN ('pending', 'sending')"
+        )
+        return row['n']
+
+    async def start(self) -> None:
+        await self._prepare()
+        # Anything still marked as sending was interrupted by a restart
+        recovered = await self.database.execute(
+            f"UPDATE {self.table} SET status = 'pending' WHERE status = 'sending'"
+        )
+        if recovered:
+            logger.info("Requeued %s interrupted outbox messages", recovered)
+        await self.database.execute(
+            f"DELETE FROM {self.table} WHERE status = 'sent' AND sent_at < ?", (time.time() - self.retention,)
+        )
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _claim(self) -> Optional[Dict[str, Any]]:
+        """Mark the oldest due message as sending; None when nothing is due"""
+        while True:
+            row = await self.database.fetchone(
+                f"SELECT id, kind, payload, attempts FROM {self.table} "
+                "WHERE status = 'pending' AND next_attempt_at <= ? ORDER BY id LIMIT 1",
+                (time.time(),)
+            )
+            if row is None:
+                return None
+            claimed = await self.database.execute(
+                f"UPDATE {self.table} SET status = 'sending', attempts = attempts + 1 "
+                "WHERE id = ? AND status = 'pending'",
+                (row['id'],)
+            )
+            # Another worker may have taken it between the two statements
+            if claimed:
+                return dict(row, attempts=row['attempts'] + 1)
+
+    async def _idle_timeout(self) -> float:
+        row = await self.database.fetchone(
+            f"SELECT MIN(next_attempt_at) AS due FROM {self.table} WHERE status = 'pending'"
+        )
+        if row['due'] is None:
+            return self.POLL_INTERVAL
+        return min(self.POLL_INTERVAL, max(0.0, row['due'] - time.time()))
+
+    async def _worker(self) -> None:
+        while True:
+            pause = self._paused_until - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+                continue
+            try:
+                message = await self._claim()
+                if message is None:
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), await self._idle_timeout())
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                await self._deliver(message)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Outbox worker error: %s", e)
+                await asyncio.sleep(1)
+
+    async def _deliver(self, message: Dict[str, Any]) -> None:
+        message_id, kind, attempts = message['id'], message['kind'], message['attempts']
+        payload = json.loads(message['payload'])
+        try:
+            handler = self._handlers[kind]
+            await handler(payload)
+        except asyncio.CancelledError:
+            await self.database.execute(
+                f"UPDATE {self.table} SET status = 'pending', attempts = attempts - 1, payload = ? WHERE id = ?",
+                (json.dumps(payload, ensure_ascii=False), message_id)
+            )
+            raise
+        except TelegramRetryAfter as e:
+            # Flood control: wait as told and do not count it as a failed attempt
+            self._paused_until = max(self._paused_until, time.monotonic() + e.retry_after)
+            logger.warning("Outbox paused for %ss by flood control", e.retry_after)
+            await self.database.execute(
+                f"UPDATE {self.table} SET status = 'pending', attempts = attempts - 1, next_attempt_at = ?, "
+                "last_error = ?, "
+                "payload = ? WHERE id = ?",
+                (time.time() + e.retry_after, str(e), json.dumps(payload, ensure_ascii=False), message_id)
+            )
+        except Exception as e:
+            if isinstance(e, (KeyError, *PERMANENT_ERRORS)) or attempts >= self.max_attempts:
+                logger.error("Outbox message %s (%s) failed after %s attempts: %s", message_id, kind, attempts, e)
+                await self.database.execute(
+                    f"UPDATE {self.table} SET status = 'failed', last_error = ? WHERE id = ?", (str(e), message_id)
+                )
+                if self.on_failure:
+                    try:
+                        await self.on_failure(kind, payload, e)
+                    except Exception as failure_error:
+                        logger.error("Outbox failure handler error: %s", failure_error)
+                return
+            delay = min(self.MAX_DELAY, self.BASE_DELAY * 2 ** (attempts - 1)) * random.uniform(0.8, 1.2)
+            logger.warning("Outbox message %s (%s) attempt %s failed, retrying in %.0fs: %s",
+                           message_id, kind, attempts, delay, e)
+            await self.database.execute(
+                f"UPDATE {self.table} SET status = 'pending', next_attempt_at = ?, last_error = ?, payload = ? "
+                "WHERE id = ?",
+                (time.time() + delay, str(e), json.dumps(payload, ensure_ascii=False), message_id)
+            )
+        else:
+            await self.database.execute(
+                f"UPDATE {self.table} SET status = 'sent', sent_at = ?, last_error = NULL WHERE id = ?",
+                (time.time(), message_id)
+            )
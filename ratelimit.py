@@ -0,0 +1,246 @@
+import asyncio
+import contextlib
+import contextvars
+import heapq
+import itertools
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Iterator, List, Tuple
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+
+logger = logging.getLogger(__name__)
+
+# Telegram's documented limits: ~30 messages/s overall, 1/s per chat, 20/min per group or channel
+RATE_LIMIT_GLOBAL = float(os.getenv('RATE_LIMIT_GLOBAL', '30'))
+RATE_LIMIT_CHAT = float(os.getenv('RATE_LIMIT_CHAT', '1'))
+RATE_LIMIT_GROUP_PER_MINUTE = float(os.getenv('RATE_LIMIT_GROUP_PER_MINUTE', '20'))
+# Flood waits up to this many seconds are slept through and retried instead of raised
+RATE_LIMIT_MAX_RETRY_AFTER = float(os.getenv('RATE_LIMIT_MAX_RETRY_AFTER', '10'))
+
+# Priority lanes: lower is served first
+PRIORITY_HIGH = 0
+PRIORITY_LOW = 1
+LANES = {PRIORITY_HIGH: 'high', PRIORITY_LOW: 'low'}
+
+request_priority: contextvars.ContextVar[int] = contextvars.ContextVar('request_priority', default=PRIORITY_HIGH)
+
+# Methods that deliver a new message count against both global and per-chat limits
+SEND_METHODS = frozenset({
+    'sendMessage', 'sendPhoto', 'sendLocation', 'sendDocument', 'sendVideo', 'sendAnimation',
+    'sendAudio', 'sendVoice', 'sendMediaGroup', 'sendVenue', 'sendContact', 'sendPoll',
+    'sendSticker', 'copyMessage', 'forwardMessage',
+})
+# Edits only count against the global limit
+EDIT_METHODS = frozenset({
+    'editMessageText', 'editMessageCaption', 'editMessageMedia', 'editMessageReplyMarkup',
+})
+
+
+@contextlib.contextmanager
+def send_priority(priority: int) -> Iterator[None]:
+    """Run Bot API calls made inside the block in the given lane"""
+    token = request_priority.set(priority)
+    try:
+        yield
+    finally:
+        request_priority.reset(token)
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self) -> float:
+        """Seconds until a token is available"""
+        now = time.monotonic()
+        self._refill(now)
+        wait = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+        return max(wait, self.blocked_until - now)
+
+    def take(self) -> None:
+        self.tokens -= 1
+
+    def reserve(self) -> float:
+        """Take a token now, possibly going into debt; returns how long to wait for it"""
+        wait = self.delay()
+        self.take()
+        return wait
+
+    def block(self, seconds: float) -> None:
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    @property
+    def idle(self) -> bool:
+        return self.delay() == 0 and self.tokens >= self.capacity - 1
+
+
+class LaneStats:
+    WINDOW = 1000
+
+    def __init__(self):
+        self.requests = 0
+        self.waited = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.recent: Deque[float] = deque(maxlen=self.WINDOW)
+
+    def record(self, wait: float) -> None:
+        self.requests += 1
+        self.recent.append(wait)
+        if wait > 0.001:
+            self.waited += 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+
+    def snapshot(self) -> Dict[str, float]:
+        recent = sorted(self.recent)
+        p99 = recent[min(len(recent) - 1, int(len(recent) * 0.99))] if recent else 0.0
+        return {
+            'requests': self.requests,
+            'waited': self.waited,
+            'wait_avg_ms': round(self.wait_total / self.waited * 1000, 1) if self.waited else 0.0,
+            'wait_p99_ms': round(p99 * 1000, 1),
+            'wait_max_ms': round(self.wait_max * 1000, 1),
+        }
+
+
+class RateLimitMiddleware(BaseRequestMiddleware):
+    """Bot session middleware that paces outgoing messages with token buckets.
+
+    Each new message first waits for its chat's bucket (1/s in private chats,
+    20/min in groups and channels), then for a token from the global bucket.
+    Global tokens are handed out by lane, so customer-facing replies overtake
+    queued low-priority traffic such as channel notifications and broadcasts.
+    A short ``RetryAfter`` from Telegram blocks the chat and is retried here;
+    longer ones are raised to the caller.
+    """
+
+    MAX_CHATS = 10000
+
+    def __init__(self, global_rate: float = RATE_LIMIT_GLOBAL, chat_rate: float = RATE_LIMIT_CHAT,
+                 group_per_minute: float = RATE_LIMIT_GROUP_PER_MINUTE,
+                 max_retry_after: float = RATE_LIMIT_MAX_RETRY_AFTER):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.group_rate = group_per_minute / 60
+        self.max_retry_after = max_retry_after
+        self._chats: Dict[Any, TokenBucket] = {}
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._pump_task = None
+        self._lanes = {priority: LaneStats() for priority in LANES}
+        self._queued = {priority: 0 for priority in LANES}
+        self._chat_waiting = 0
+
+    @staticmethod
+    def _is_group(chat_id: Any) -> bool:
+        # Channels and groups have negative IDs or are addressed by @username
+        return isinstance(chat_id, str) or chat_id < 0
+
+    def _chat_bucket(self, chat_id: Any) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= self.MAX_CHATS:
+                self._chats = {key: value for key, value in self._chats.items() if not value.idle}
+            if self._is_group(chat_id):
+                bucket = TokenBucket(self.group_rate, 3)
+            else:
+                bucket = TokenBucket(self.chat_rate, 3)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    async def _acquire_global(self, priority: int) -> None:
+        if not self._waiters and self.global_bucket.delay() == 0:
+            self.global_bucket.take()
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        self._queued[priority] += 1
+        if self._pump_task is None or self._pump_task.done():
+            self._pump_task = asyncio.create_task(self._pump())
+        try:
+            await future
+        finally:
+            self._queued[priority] -= 1
+
+    async def _pump(self) -> None:
+        """Hand out global tokens to waiters, highest priority first"""
+        while self._waiters:
+            delay = self.global_bucket.delay()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                self.global_bucket.take()
+                future.set_result(None)
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        api_method = method.__api_method__
+        if api_method not in SEND_METHODS and api_method not in EDIT_METHODS:
+            return await make_request(bot, method)
+
+        priority = request_priority.get()
+        chat_id = getattr(method, 'chat_id', None)
+        while True:
+            started = time.monotonic()
+            if api_method in SEND_METHODS and chat_id is not None:
+                wait = self._chat_bucket(chat_id).reserve()
+                if wait > 0:
+                    self._chat_waiting += 1
+                    try:
+                        await asyncio.sleep(wait)
+                    finally:
+                        self._chat_waiting -= 1
+            await self._acquire_global(priority)
+            self._lanes[priority].record(time.monotonic() - started)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                if chat_id is not None:
+                    self._chat_bucket(chat_id).block(e.retry_after)
+                if e.retry_after > self.max_retry_after:
+                    raise
+                logger.warning("Flood control on %s to %s, retrying in %ss", api_method, chat_id, e.retry_after)
+                if chat_id is None:
+                    await asyncio.sleep(e.retry_after)
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth and wait times per lane"""
+        return {
+            'queue_depth': sum(self._queued.values()) + self._chat_waiting,
+            'waiting_for_chat': self._chat_waiting,
+            'tracked_chats': len(self._chats),
+            'lanes': {
+                name: dict(self._lanes[priority].snapshot(), queued=self._queued[priority])
+                for priority, name in LANES.items()
+            },
+        }
+
+    def gauges(self) -> Dict[str, float]:
+        """``stats`` flattened to top-level numbers, e.g. ``high_wait_p99_ms``, for /metrics"""
+        stats = self.stats()
+        flat = {key: value for key, value in stats.items() if key != 'lanes'}
+        for lane, values in stats['lanes'].items():
+            flat.update({f'{lane}_{key}': value for key, value in values.items()})
+        return flat
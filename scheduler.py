@@ -0,0 +1,175 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Updates handled at the same time; the rest wait in memory
+UPDATE_CONCURRENCY = int(os.getenv('UPDATE_CONCURRENCY', '32'))
+# Updates accepted (running or waiting) before polling stops fetching more
+UPDATE_QUEUE_LIMIT = int(os.getenv('UPDATE_QUEUE_LIMIT', '1000'))
+# Waiting updates at which low-priority ones are dropped on arrival
+UPDATE_SHED_DEPTH = int(os.getenv('UPDATE_SHED_DEPTH', '200'))
+# Seconds a low-priority update may wait for a slot before it is dropped
+UPDATE_SHED_AFTER = float(os.getenv('UPDATE_SHED_AFTER', '10'))
+
+PRIORITY_HIGH = 0
+PRIORITY_LOW = 1
+
+ShedHandler = Callable[[Update], Awaitable[Any]]
+
+
+class _ChatQueue:
+    __slots__ = ('lock', 'users')
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.users = 0
+
+
+class UpdateScheduler(BaseMiddleware):
+    """Outer update middleware that runs different chats in parallel and each chat in order.
+
+    An update first waits for the previous update from its chat to finish,
+    so one user's FSM steps never overtake each other, then for one of
+    ``limit`` global slots. Slots go to normal updates before low-priority
+    ones (``is_low_priority``, e.g. admin listings). Under overload a
+    low-priority update is dropped when the backlog is already
+    ``shed_depth`` deep or when it has waited ``shed_after`` seconds;
+    ``on_shed`` is called for it instead of the handler.
+    """
+
+    def __init__(self, limit: int = UPDATE_CONCURRENCY, shed_depth: int = UPDATE_SHED_DEPTH,
+                 shed_after: float = UPDATE_SHED_AFTER,
+                 is_low_priority: Optional[Callable[[Update], bool]] = None):
+        self.limit = limit
+        self.shed_depth = shed_depth
+        self.shed_after = shed_after
+        self.is_low_priority = is_low_priority or (lambda update: False)
+        self.on_shed: Optional[ShedHandler] = None
+        self.in_flight = 0
+        self.waiting = 0
+        self.shed = 0
+        self._chats: Dict[Any, _ChatQueue] = {}
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._queued = {PRIORITY_HIGH: 0, PRIORITY_LOW: 0}
+
+    @staticmethod
+    def _chat_key(data: Dict[str, Any]) -> Any:
+        chat = data.get('event_chat')
+        if chat is not None:
+            return chat.id
+        user = data.get('event_from_user')
+        return user.id if user is not None else None
+
+    async def _acquire_slot(self, priority: int, timeout: Optional[float]) -> bool:
+        # Free slots are only ever left over when nobody live is waiting (see _release_slot)
+        if self.in_flight < self.limit:
+            self.in_flight += 1
+            return True
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        self._queued[priority] += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout)
+            return True
+        except asyncio.TimeoutError:
+            if future.done():
+                # The slot was handed over just as the wait expired: keep it
+                return True
+            future.cancel()
+            return False
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self._release_slot()
+            future.cancel()
+            raise
+        finally:
+            self._queued[priority] -= 1
+
+    def _release_slot(self) -> None:
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                # The slot passes straight to the next waiter; in_flight stays the same
+                future.set_result(None)
+                return
+        self.in_flight -= 1
+
+    async def _shed(self, event: Update) -> None:
+        self.shed += 1
+        logger.warning("Overloaded, dropped low-priority update %s (%s waiting)", event.update_id, self.waiting)
+        if self.on_shed is not None:
+            try:
+                await self.on_shed(event)
+            except Exception as e:
+                logger.error("Error notifying about a dropped update: %s", e)
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        priority = PRIORITY_LOW if self.is_low_priority(event) else PRIORITY_HIGH
+        if priority == PRIORITY_LOW and self.waiting >= self.shed_depth:
+            await self._shed(event)
+            return None
+
+        key = self._chat_key(data)
+        chat = None
+        if key is not None:
+            chat = self._chats.get(key)
+            if chat is None:
+                chat = self._chats[key] = _ChatQueue()
+            chat.users += 1
+
+        started = time.monotonic()
+        self.waiting += 1
+        locked = acquired = False
+        try:
+            try:
+                if chat is not None:
+                    await chat.lock.acquire()
+                    locked = True
+                timeout = self.shed_after if priority == PRIORITY_LOW else None
+                remaining = None if timeout is None else max(0.0, timeout - (time.monotonic() - started))
+                acquired = await self._acquire_slot(priority, remaining)
+            finally:
+                self.waiting -= 1
+            metrics.observe('bot_update_wait', time.monotonic() - started,
+                            priority='low' if priority == PRIORITY_LOW else 'high')
+            if not acquired:
+                await self._shed(event)
+                return None
+            return await handler(event, data)
+        finally:
+            if acquired:
+                self._release_slot()
+            if locked:
+                chat.lock.release()
+            if chat is not None:
+                chat.users -= 1
+                if not chat.users:
+                    del self._chats[key]
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth and load-shedding counters"""
+        return {
+            'in_flight': self.in_flight,
+            'waiting': self.waiting,
+            'waiting_for_slot_high': self._queued[PRIORITY_HIGH],
+            'waiting_for_slot_low': self._queued[PRIORITY_LOW],
+            'active_chats': len(self._chats),
+            'shed': self.shed,
+        }
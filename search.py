@@ -0,0 +1,173 @@
+import heapq
+import itertools
+import re
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from models import Medicine
+
+# Uzbek Cyrillic -> Latin (2023 official alphabet, apostrophes dropped below)
+CYRILLIC_TO_LATIN = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'ғ': "g'", 'д': 'd', 'е': 'e', 'ё': 'yo',
+    'ж': 'j', 'з': 'z', 'и': 'i', 'й': 'y', 'к': 'k', 'қ': 'q', 'л': 'l', 'м': 'm',
+    'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u', 'ў': "o'",
+    'ф': 'f', 'х': 'x', 'ҳ': 'h', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'sh', 'ъ': "'",
+    'ы': 'i', 'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya',
+}
+_TRANSLATE = str.maketrans(CYRILLIC_TO_LATIN)
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+
+
+def normalize(text: Optional[str]) -> str:
+    """Lowercase, transliterate Cyrillic to Latin and drop apostrophes and punctuation.
+
+    "Бўғимлар", "Bo'g'imlar" and "Boʻgʻimlar" all become "bogimlar".
+    """
+    if not text:
+        return ''
+    text = text.lower().translate(_TRANSLATE)
+    text = re.sub(r"['ʻʼ‘’`]", '', text)
+    return _NON_WORD.sub(' ', text).strip()
+
+
+def _trigrams(token: str) -> Set[str]:
+    return {token[i:i + 3] for i in range(len(token) - 2)}
+
+
+def _query_trigrams(token: str) -> Set[str]:
+    # Short tokens only match at the start of a word
+    return _trigrams(f' {token}') if len(token) < 3 else _trigrams(token)
+
+
+class SearchIndex:
+    """In-memory index over medicine names, benefits and descriptions.
+
+    Each field maps normalized words to the medicines containing them, and a
+    trigram index over the distinct words resolves a query word to every
+    indexed word it is a substring of. A medicine matches when every query
+    word matches one of its fields; results are ranked in tiers (all words in
+    the name, then in name or benefits, then anywhere) and by catalog order.
+    Postings hold integer ordinals and everything after the word lookup is
+    set arithmetic, so lookups stay under a millisecond on large catalogs.
+    """
+
+    FIELDS = ('name', 'benefits', 'description')
+    MATCH_CACHE_SIZE = 4096
+
+    def __init__(self):
+        self._words: Dict[str, Dict[str, Set[int]]] = {field: {} for field in self.FIELDS}
+        self._word_refs: Dict[str, int] = {}
+        self._vocabulary: Dict[str, Set[str]] = {}
+        self._doc_words: Dict[int, Dict[str, Set[str]]] = {}
+        self._ordinals: Dict[str, int] = {}
+        self._med_ids: Dict[int, str] = {}
+        self._next_ordinal = itertools.count()
+        self._match_cache: Dict[str, Set[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._doc_words)
+
+    def add(self, med_id: str, med: Medicine) -> None:
+        """Index a medicine, replacing any previous version of it"""
+        self.remove(med_id)
+        ordinal = self._ordinals.get(med_id)
+        if ordinal is None:
+            ordinal = self._ordinals[med_id] = next(self._next_ordinal)
+            self._med_ids[ordinal] = med_id
+        doc_words = {field: set(normalize(getattr(med, field)).split()) for field in self.FIELDS}
+        self._doc_words[ordinal] = doc_words
+        for field, words in doc_words.items():
+            index = self._words[field]
+            for word in words:
+                index.setdefault(word, set()).add(ordinal)
+                refs = self._word_refs.get(word, 0)
+                if not refs:
+                    for gram in _trigrams(f' {word} '):
+                        self._vocabulary.setdefault(gram, set()).add(word)
+                    self._match_cache.clear()
+                self._word_refs[word] = refs + 1
+
+    def remove(self, med_id: str) -> None:
+        ordinal = self._ordinals.get(med_id)
+        doc_words = self._doc_words.pop(ordinal, None)
+        if doc_words is None:
+            return
+        for field, words in doc_words.items():
+            index = self._words[field]
+            for word in words:
+                ids = index[word]
+                ids.discard(ordinal)
+                if not ids:
+                    del index[word]
+                self._word_refs[word] -= 1
+                if not self._word_refs[word]:
+                    del self._word_refs[word]
+                    for gram in _trigrams(f' {word} '):
+                        grams = self._vocabulary[gram]
+                        grams.discard(word)
+                        if not grams:
+                            del self._vocabulary[gram]
+                    self._match_cache.clear()
+
+    def rebuild(self, items: Iterable[Tuple[str, Medicine]]) -> None:
+        self.__init__()
+        for med_id, med in items:
+            self.add(med_id, med)
+
+    def on_catalog_change(self, med_id: str, med: Optional[Medicine]) -> None:
+        """CatalogCache listener keeping the index in step with the catalog"""
+        if med is None:
+            self.remove(med_id)
+            ordinal = self._ordinals.pop(med_id, None)
+            self._med_ids.pop(ordinal, None)
+        else:
+            self.add(med_id, med)
+
+    def _matching_words(self, token: str) -> Set[str]:
+        """Indexed words containing ``token``"""
+        words = self._match_cache.get(token)
+        if words is not None:
+            return words
+        grams = sorted(_query_trigrams(token), key=lambda gram: len(self._vocabulary.get(gram, ())))
+        if not grams or grams[0] not in self._vocabulary:
+            words = set()
+        else:
+            words = set(self._vocabulary[grams[0]]).intersection(*(self._vocabulary.get(g, ()) for g in grams[1:]))
+            # Trigrams can match out of order; confirm the substring
+            if len(token) >= 3:
+                words = {word for word in words if token in word}
+        if len(self._match_cache) >= self.MATCH_CACHE_SIZE:
+            self._match_cache.clear()
+        self._match_cache[token] = words
+        return words
+
+    def search(self, query: str, limit: int = 20) -> List[str]:
+        """Return medicine IDs matching every word of ``query``, best first"""
+        tokens = [token for token in normalize(query).split() if len(token) > 1]
+        if not tokens:
+            return []
+
+        in_name = in_name_or_benefits = anywhere = None
+        for token in tokens:
+            words = self._matching_words(token)
+            if not words:
+                return []
+            hits = [set().union(*(self._words[field].get(word, ()) for word in words)) for field in self.FIELDS]
+            name_hits = hits[0]
+            strong_hits = name_hits | hits[1]
+            all_hits = strong_hits | hits[2]
+            if in_name is None:
+                in_name, in_name_or_benefits, anywhere = name_hits, strong_hits, all_hits
+            else:
+                in_name &= name_hits
+                in_name_or_benefits &= strong_hits
+                anywhere &= all_hits
+            if not anywhere:
+                return []
+
+        results: List[int] = []
+        for tier in (in_name, in_name_or_benefits - in_name, anywhere - in_name_or_benefits):
+            wanted = limit - len(results)
+            if wanted <= 0:
+                break
+            results.extend(heapq.nsmallest(wanted, tier))
+        return [self._med_ids[ordinal] for ordinal in results]
@@ -0,0 +1,114 @@
+import asyncio
+import datetime
+import logging
+import os
+from typing import Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Seconds between delta syncs; the change feed triggers one sooner when something changed
+SYNC_INTERVAL = float(os.getenv('SYNC_INTERVAL', '60'))
+# Seconds re-read behind the watermark, for rows whose transaction committed late
+SYNC_OVERLAP = float(os.getenv('SYNC_OVERLAP', '5'))
+SYNC_MAX_BACKOFF = 300.0
+
+Fetch = Callable[[str, Optional[str], int], Awaitable[List[Dict]]]
+Apply = Callable[[List[Dict], bool], Awaitable[None]]
+
+
+class DeltaSync:
+    """Keeps an in-memory view of one table current by pulling changed rows.
+
+    ``watermark`` is the ``updated_at`` of the newest row applied so far;
+    each pass asks ``fetch_changes`` only for rows changed after it (minus
+    ``overlap``) and hands them to ``apply(rows, complete)`` page by page.
+    Deleted rows arrive as tombstones, so ``apply`` sees them like any other
+    change. Without a watermark the first pass reads the whole table and
+    calls ``apply`` once with ``complete=True`` so the view can be replaced.
+    While ``apply`` runs, ``watermark`` already covers the rows it was given.
+    Every pass calls ``apply`` at least once, with an empty page when
+    nothing changed. Rows from the overlap window are delivered again, so
+    ``apply`` must be idempotent.
+    """
+
+    def __init__(self, table: str, fetch_changes: Fetch, apply: Apply, interval: float = SYNC_INTERVAL,
+                 overlap: float = SYNC_OVERLAP, batch_size: int = 500):
+        self.table = table
+        self.fetch_changes = fetch_changes
+        self.apply = apply
+        self.interval = interval
+        self.overlap = overlap
+        self.batch_size = batch_size
+        self.watermark: Optional[str] = None
+        self._lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def _start_position(self) -> Optional[str]:
+        if self.watermark is None:
+            return None
+        start = datetime.datetime.fromisoformat(self.watermark) - datetime.timedelta(seconds=self.overlap)
+        return f'{start.isoformat()}|'
+
+    async def sync(self) -> int:
+        """Pull and apply everything changed since the watermark; returns the number of rows read"""
+        async with self._lock:
+            complete = self.watermark is None
+            position = self._start_position()
+            collected: List[Dict] = []
+            watermark = self.watermark
+            total = 0
+            while True:
+                rows = await self.fetch_changes(self.table, position, self.batch_size)
+                total += len(rows)
+                if rows:
+                    position = f"{rows[-1]['updated_at']}|{rows[-1]['id']}"
+                    watermark = max(watermark or '', rows[-1]['updated_at'])
+                if complete:
+                    collected.extend(rows)
+                elif rows or not total:
+                    await self._apply(rows, False, watermark)
+                if len(rows) < self.batch_size:
+                    break
+            if complete:
+                await self._apply(collected, True, watermark)
+            return total
+
+    async def _apply(self, rows: List[Dict], complete: bool, watermark: Optional[str]) -> None:
+        # The new watermark is visible to apply (e.g. to save it alongside the view) and rolled back if it fails
+        previous, self.watermark = self.watermark, watermark
+        try:
+            await self.apply(rows, complete)
+        except Exception:
+            self.watermark = previous
+            raise
+
+    def trigger(self) -> None:
+        """Run the next pass now instead of waiting for the interval"""
+        self._wakeup.set()
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        delay = self.interval
+        while True:
+            try:
+                changes = await self.sync()
+                if changes:
+                    logger.info("Synced %s changed %s rows", changes, self.table)
+                delay = self.interval
+            except Exception as e:
+                delay = min(SYNC_MAX_BACKOFF, delay * 2)
+                logger.error("Delta sync of %s failed, retrying in %.0fs: %s", self.table, delay, e)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
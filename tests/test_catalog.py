@@ -0,0 +1,75 @@
+import asyncio
+import unittest
+
+from catalog import CatalogCache
+from models import Medicine
+
+
+def medicine(med_id, name='Test'):
+    return Medicine(id=med_id, name=name, price_label='100', price_minor=10000)
+
+
+class CatalogCacheTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.loads = 0
+        self.release = asyncio.Event()
+        self.items = {'a': medicine('a')}
+
+        async def loader():
+            self.loads += 1
+            await self.release.wait()
+            return dict(self.items)
+
+        self.catalog = CatalogCache(loader, negative_ttl=60)
+
+    async def test_concurrent_misses_share_one_load(self):
+        lookups = [asyncio.create_task(self.catalog.lookup(med_id)) for med_id in ('a', 'a', 'b', 'c')]
+        await asyncio.sleep(0)
+        self.release.set()
+        results = await asyncio.gather(*lookups)
+
+        self.assertEqual(self.loads, 1)
+        self.assertEqual([med and med.id for med in results], ['a', 'a', None, None])
+
+    async def test_missing_id_is_cached(self):
+        self.release.set()
+        self.assertIsNone(await self.catalog.lookup('b'))
+        self.assertIsNone(await self.catalog.lookup('b'))
+        self.assertEqual(self.loads, 1)
+
+    async def test_put_clears_missing_entry(self):
+        self.release.set()
+        await self.catalog.lookup('b')
+        self.catalog.put('b', medicine('b'))
+        self.assertEqual((await self.catalog.lookup('b')).id, 'b')
+        self.assertEqual(self.loads, 1)
+
+    async def test_failed_load_is_shared_and_not_cached(self):
+        calls = 0
+
+        async def failing():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0)
+            raise RuntimeError('database down')
+
+        catalog = CatalogCache(failing)
+        results = await asyncio.gather(*(catalog.lookup('a') for _ in range(3)))
+        self.assertEqual(results, [None, None, None])
+        self.assertEqual(calls, 1)
+        # The next miss tries again instead of remembering the failure
+        await catalog.lookup('a')
+        self.assertEqual(calls, 2)
+
+    def test_apply_changes_notifies_and_bumps_version(self):
+        changes = []
+        self.catalog.replace({'a': medicine('a'), 'b': medicine('b')})
+        self.catalog.subscribe(lambda med_id, med: changes.append((med_id, med is not None)))
+        version = self.catalog.version
+
+        patched = self.catalog.apply_changes({'a': medicine('a'), 'c': medicine('c')}, removed=['b', 'x'])
+
+        self.assertEqual(patched, 2)
+        self.assertEqual(sorted(changes), [('b', False), ('c', True)])
+        self.assertGreater(self.catalog.version, version)
+        self.assertEqual(sorted(self.catalog), ['a', 'c'])
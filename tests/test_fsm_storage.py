@@ -0,0 +1,54 @@
+import os
+import tempfile
+import unittest
+
+from aiogram.fsm.storage.base import StorageKey
+
+from fsm_storage import SQLiteStorage
+from local_store import LocalDatabase
+
+KEY = StorageKey(bot_id=1, chat_id=100, user_id=100)
+
+
+class SQLiteStorageTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.storage = SQLiteStorage(LocalDatabase(os.path.join(self.directory.name, 'fsm.sqlite3')), ttl=60)
+
+    async def asyncTearDown(self):
+        await self.storage.close()
+        self.directory.cleanup()
+
+    async def expire(self):
+        await self.storage.database.execute('UPDATE fsm_sessions SET expires_at = 0')
+
+    async def test_round_trip(self):
+        await self.storage.set_state(KEY, 'OrderStates:waiting_for_receipt')
+        await self.storage.set_data(KEY, {'months': 2})
+        self.assertEqual(await self.storage.get_state(KEY), 'OrderStates:waiting_for_receipt')
+        self.assertEqual(await self.storage.get_data(KEY), {'months': 2})
+
+    async def test_set_data_does_not_revive_expired_state(self):
+        await self.storage.set_state(KEY, 'OrderStates:waiting_for_receipt')
+        await self.storage.set_data(KEY, {'months': 2})
+        await self.expire()
+
+        await self.storage.set_data(KEY, {'months': 3})
+
+        self.assertIsNone(await self.storage.get_state(KEY))
+        self.assertEqual(await self.storage.get_data(KEY), {'months': 3})
+
+    async def test_set_state_does_not_revive_expired_data(self):
+        await self.storage.set_state(KEY, 'OrderStates:waiting_for_receipt')
+        await self.storage.set_data(KEY, {'receipt_photo_id': 'old'})
+        await self.expire()
+
+        await self.storage.set_state(KEY, 'OrderStates:waiting_for_months')
+
+        self.assertEqual(await self.storage.get_state(KEY), 'OrderStates:waiting_for_months')
+        self.assertEqual(await self.storage.get_data(KEY), {})
+
+    async def test_live_record_keeps_other_column(self):
+        await self.storage.set_state(KEY, 'OrderStates:waiting_for_receipt')
+        await self.storage.set_data(KEY, {'months': 2})
+        self.assertEqual(await self.storage.get_state(KEY), 'OrderStates:waiting_for_receipt')
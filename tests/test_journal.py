@@ -0,0 +1,112 @@
+import asyncio
+import os
+import tempfile
+import unittest
+
+from journal import OrderJournal
+
+
+def order(order_id):
+    return {'order_id': order_id, 'medicine': 'Test', 'months': 1}
+
+
+class OrderJournalTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'orders.journal')
+        self.journal = OrderJournal(self.path)
+        # Compact whenever nothing is pending
+        self.journal.COMPACT_BYTES = 0
+
+    async def asyncTearDown(self):
+        await self.journal.close()
+        self.directory.cleanup()
+
+    def read_back(self):
+        pending, known, _ = OrderJournal(self.path)._read()
+        return pending, known
+
+    async def test_append_survives_concurrent_compaction(self):
+        await self.journal.append(order('a'))
+        await self.journal._ack('a')
+
+        appending = asyncio.create_task(self.journal.append(order('b')))
+        # Let the append reach the journal thread before compacting
+        await asyncio.sleep(0)
+        await self.journal._maybe_compact()
+        self.assertTrue(await appending)
+
+        pending, known = self.read_back()
+        self.assertEqual(set(pending), {'b'})
+        self.assertNotIn('a', known)
+        self.assertFalse(await self.journal.append(order('b')))
+
+    async def test_appends_queued_during_compaction_are_kept(self):
+        await self.journal.append(order('a'))
+        await self.journal._ack('a')
+
+        results = await asyncio.gather(
+            self.journal._maybe_compact(),
+            *(self.journal.append(order(order_id)) for order_id in 'bcd'),
+            self.journal._maybe_compact(),
+        )
+        self.assertEqual(results[1:4], [True, True, True])
+
+        pending, _ = self.read_back()
+        self.assertEqual(set(pending), {'b', 'c', 'd'})
+        for order_id in 'bcd':
+            self.assertFalse(await self.journal.append(order(order_id)))
+
+    async def test_compaction_waits_for_everything_acknowledged(self):
+        await self.journal.append(order('a'))
+        await self.journal._maybe_compact()
+        await self.journal._ack('a')
+
+        pending, known = self.read_back()
+        self.assertEqual(pending, {})
+        self.assertEqual(known, {'a'})
+
+    async def test_reassigned_id_is_reported_before_ack(self):
+        reported = []
+
+        async def sink(order):
+            return (order['order_id'] + '-2', True) if order['order_id'] == 'b' else (order['order_id'], True)
+
+        async def on_reassigned(order, saved_id):
+            reported.append((order['order_id'], saved_id, order['order_id'] in self.journal._pending))
+
+        self.journal.on_reassigned = on_reassigned
+        await self.journal.append(order('a'))
+        await self.journal.append(order('b'))
+        self.assertTrue(await self.journal._replay_once(sink))
+
+        self.assertEqual(reported, [('b', 'b-2', True)])
+        self.assertEqual(len(self.journal), 0)
+
+
+class SharedJournalTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'orders.journal')
+        self.first = OrderJournal(self.path)
+        self.second = OrderJournal(self.path)
+        self.first.COMPACT_BYTES = 0
+
+    async def asyncTearDown(self):
+        await self.first.close()
+        await self.second.close()
+        self.directory.cleanup()
+
+    async def test_compaction_keeps_other_writers_orders(self):
+        await self.first.append(order('a'))
+        await self.second.append(order('b'))
+        await self.first._ack('a')
+
+        await self.first._maybe_compact()
+        # The second journal still holds the replaced file open
+        await self.second.append(order('c'))
+        await self.first.append(order('d'))
+
+        pending, known, _ = OrderJournal(self.path)._read()
+        self.assertEqual(set(pending), {'b', 'c', 'd'})
+        self.assertNotIn('a', known)
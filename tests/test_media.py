@@ -0,0 +1,70 @@
+import unittest
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import PhotoSize
+
+from media import MediaCache
+from models import Medicine, MedicineImage, StoredImage
+
+
+class FakeStorage:
+    def input_file(self, image):
+        return image.url
+
+
+def rejected():
+    return TelegramBadRequest(method=None, message='Bad Request: wrong remote file identifier specified')
+
+
+class MediaCacheTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.saved = []
+
+        async def save(entry):
+            self.saved.append(entry)
+
+        async def load():
+            return []
+
+        self.media = MediaCache(load, save, storage=FakeStorage())
+        self.med = Medicine(id='a', name='A', photo='original-file-id')
+        self.stored = StoredImage(path='a.jpg', size=100, url='https://example.com/a.jpg',
+                                  thumbnail_url='https://example.com/a_thumb.jpg')
+
+    async def asyncTearDown(self):
+        await self.media.close()
+
+    async def test_broken_file_id_falls_back_to_stored_copy(self):
+        await self.media.attach(self.med, self.stored)
+        self.media.remember(self.med, [PhotoSize(file_id='copy-file-id', file_unique_id='c', width=800, height=600)])
+        self.assertEqual(self.media.photo(self.med), 'copy-file-id')
+
+        self.media.mark_broken(self.med, rejected())
+        self.assertEqual(self.media.photo(self.med), self.stored.url)
+
+    async def test_rejected_stored_copy_is_not_sent_again(self):
+        await self.media.attach(self.med, self.stored)
+        self.assertEqual(self.media.photo(self.med), self.stored.url)
+
+        self.media.mark_broken(self.med, rejected())
+        self.assertIsNone(self.media.photo(self.med))
+        self.assertIsNone(self.media.thumbnail(self.med))
+        await self.media.close()
+        self.assertTrue(self.saved[-1].to_row()['is_stored_broken'])
+
+    async def test_rejected_copy_survives_reload(self):
+        row = MedicineImage(medicine_id='a', source=self.med.photo, broken=True, stored=self.stored,
+                            stored_broken=True).to_row()
+
+        async def load():
+            return [MedicineImage.from_row(row)]
+
+        media = MediaCache(load, self.media._save, storage=FakeStorage())
+        await media.load()
+        self.assertIsNone(media.photo(self.med))
+
+    async def test_new_copy_clears_the_mark(self):
+        await self.media.attach(self.med, self.stored)
+        self.media.mark_broken(self.med, rejected())
+        await self.media.attach(self.med, self.stored)
+        self.assertEqual(self.media.photo(self.med), self.stored.url)
@@ -0,0 +1,37 @@
+import unittest
+
+from models import Medicine, Order, format_price, parse_price
+
+
+class ParsePriceTest(unittest.TestCase):
+    def test_digit_groups_are_joined(self):
+        self.assertEqual(parse_price("150 000 so'm"), 15000000)
+        self.assertEqual(parse_price('1 500 000'), 150000000)
+        self.assertEqual(parse_price('150,000 UZS'), 15000000)
+        self.assertEqual(parse_price('1.500.000'), 150000000)
+        self.assertEqual(parse_price("150000 so'm"), 15000000)
+
+    def test_currency_before_amount(self):
+        self.assertEqual(parse_price('UZS 150000'), 15000000)
+        self.assertEqual(parse_price("Narxi: 25 000 so'm"), 2500000)
+
+    def test_fraction_is_tiyin(self):
+        self.assertEqual(parse_price('150.50'), 15050)
+        self.assertEqual(parse_price('150,5'), 15050)
+        self.assertEqual(parse_price('1 500,25 UZS'), 150025)
+
+    def test_ambiguous_labels_are_rejected(self):
+        for label in ('Narx kiritilmagan', '', None, '2 x 150 000', '1,5 mln', "150 ming so'm", '150k'):
+            self.assertIsNone(parse_price(label), label)
+
+    def test_format_round_trip(self):
+        self.assertEqual(format_price(parse_price('1 500 000')), '1,500,000 UZS')
+        self.assertEqual(format_price(parse_price('150.50')), '150.50 UZS')
+
+
+class AmountFallbackTest(unittest.TestCase):
+    def test_label_only_rows_use_all_digit_groups(self):
+        med = Medicine.from_row({'id': 'a', 'name': 'A', 'price': "150 000 so'm"})
+        self.assertEqual(med.price_minor, 15000000)
+        order = Order.from_row({'id': 'o', 'user_id': 1, 'medicine': 'A', 'price': "150 000 so'm", 'months': 2})
+        self.assertEqual(order.total_minor, 30000000)
@@ -0,0 +1,42 @@
+import unittest
+
+from order_writer import OrderWriter, order_id_for
+
+
+class FakeOrders:
+    """add_orders/get_order_owners over a dict of order ID -> user ID"""
+
+    def __init__(self, owners=None):
+        self.owners = dict(owners or {})
+        self.writes = 0
+
+    async def add_orders(self, orders):
+        self.writes += 1
+        inserted = []
+        for order in orders:
+            if order['order_id'] not in self.owners:
+                self.owners[order['order_id']] = order['user_id']
+                inserted.append(order['order_id'])
+        return inserted
+
+    async def get_order_owners(self, order_ids):
+        return {order_id: self.owners[order_id] for order_id in order_ids if order_id in self.owners}
+
+
+class OrderWriterTest(unittest.IsolatedAsyncioTestCase):
+    async def test_collision_returns_new_id(self):
+        database = FakeOrders({'AAA': 1})
+        writer = OrderWriter(database, window=0)
+
+        saved_id, created = await writer.submit({'order_id': 'AAA', 'user_id': 2})
+
+        self.assertEqual((saved_id, created), (order_id_for('AAA'), True))
+        self.assertEqual(database.owners[saved_id], 2)
+        self.assertEqual(database.owners['AAA'], 1)
+
+    async def test_repeated_submit_is_not_a_collision(self):
+        database = FakeOrders()
+        writer = OrderWriter(database, window=0)
+
+        self.assertEqual(await writer.submit({'order_id': 'AAA', 'user_id': 2}), ('AAA', True))
+        self.assertEqual(await writer.submit({'order_id': 'AAA', 'user_id': 2}), ('AAA', False))
@@ -0,0 +1,101 @@
+import asyncio
+import unittest
+from types import SimpleNamespace
+
+from scheduler import UpdateScheduler
+
+
+def update(update_id, low=False):
+    return SimpleNamespace(update_id=update_id, low=low)
+
+
+def chat(chat_id):
+    return {'event_chat': SimpleNamespace(id=chat_id)}
+
+
+class UpdateSchedulerTest(unittest.IsolatedAsyncioTestCase):
+    def scheduler(self, **kwargs):
+        return UpdateScheduler(is_low_priority=lambda event: event.low, **kwargs)
+
+    async def test_same_chat_runs_in_order(self):
+        scheduler = self.scheduler(limit=4)
+        finished = []
+
+        async def handler(event, data):
+            # The first update is the slowest; a parallel run would finish it last
+            await asyncio.sleep(0.03 - event.update_id * 0.01)
+            finished.append((data['event_chat'].id, event.update_id))
+
+        await asyncio.gather(
+            *(scheduler(handler, update(update_id), chat(1)) for update_id in range(3)),
+            scheduler(handler, update(9), chat(2)),
+        )
+
+        self.assertEqual([update_id for chat_id, update_id in finished if chat_id == 1], [0, 1, 2])
+        # Another chat is not held up behind chat 1
+        self.assertEqual(finished[0], (2, 9))
+        self.assertEqual(scheduler.stats()['active_chats'], 0)
+
+    async def test_low_priority_shed_when_slots_stay_full(self):
+        scheduler = self.scheduler(limit=1, shed_after=0.05)
+        shed, handled = [], []
+        release = asyncio.Event()
+
+        async def on_shed(event):
+            shed.append(event.update_id)
+
+        async def handler(event, data):
+            handled.append(event.update_id)
+            await release.wait()
+
+        scheduler.on_shed = on_shed
+        busy = asyncio.create_task(scheduler(handler, update(1), chat(1)))
+        await asyncio.sleep(0)
+        self.assertIsNone(await scheduler(handler, update(2, low=True), chat(2)))
+        release.set()
+        await busy
+
+        self.assertEqual(handled, [1])
+        self.assertEqual(shed, [2])
+        self.assertEqual(scheduler.stats()['shed'], 1)
+        self.assertEqual(scheduler.in_flight, 0)
+
+    async def test_low_priority_shed_on_arrival_when_backlog_deep(self):
+        scheduler = self.scheduler(limit=1, shed_depth=1)
+        handled = []
+        release = asyncio.Event()
+
+        async def handler(event, data):
+            handled.append(event.update_id)
+            await release.wait()
+
+        running = [asyncio.create_task(scheduler(handler, update(update_id), chat(update_id))) for update_id in (1, 2)]
+        await asyncio.sleep(0)
+        self.assertEqual(scheduler.waiting, 1)
+        await scheduler(handler, update(3, low=True), chat(3))
+        release.set()
+        await asyncio.gather(*running)
+
+        self.assertEqual(handled, [1, 2])
+        self.assertEqual(scheduler.shed, 1)
+
+    async def test_free_slot_goes_to_normal_update_first(self):
+        scheduler = self.scheduler(limit=1, shed_after=5)
+        started = []
+        release = asyncio.Event()
+
+        async def handler(event, data):
+            started.append(event.update_id)
+            if event.update_id == 1:
+                await release.wait()
+
+        busy = asyncio.create_task(scheduler(handler, update(1), chat(1)))
+        await asyncio.sleep(0)
+        low = asyncio.create_task(scheduler(handler, update(2, low=True), chat(2)))
+        await asyncio.sleep(0)
+        high = asyncio.create_task(scheduler(handler, update(3), chat(3)))
+        await asyncio.sleep(0)
+        release.set()
+        await asyncio.gather(busy, low, high)
+
+        self.assertEqual(started, [1, 3, 2])
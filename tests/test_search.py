@@ -0,0 +1,46 @@
+import unittest
+
+from models import Medicine
+from search import SearchIndex, normalize
+
+
+class NormalizeTest(unittest.TestCase):
+    def test_spellings_normalize_alike(self):
+        for text in ("Бўғимлар", "Bo'g'imlar", "Boʻgʻimlar", "BOG`IMLAR"):
+            self.assertEqual(normalize(text), 'bogimlar')
+
+    def test_punctuation_splits_words(self):
+        self.assertEqual(normalize('Omega-3, 1000mg!'), 'omega 3 1000mg')
+        self.assertEqual(normalize(None), '')
+
+
+class SearchIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.index = SearchIndex()
+        self.index.rebuild([
+            ('joint', Medicine(id='joint', name="Bo'g'im kremi", benefits='Og\'riqni qoldiradi')),
+            ('vitamin', Medicine(id='vitamin', name='Vitamin C', benefits="Bo'g'imlar uchun foydali")),
+            ('tea', Medicine(id='tea', name='Choy', description="Bo'g'im va bosh og'rig'i uchun")),
+            ('heart', Medicine(id='heart', name='Kardio', benefits='Yurak uchun')),
+        ])
+
+    def test_cyrillic_query_matches_latin_name(self):
+        self.assertEqual(self.index.search('кардио'), ['heart'])
+        self.assertEqual(self.index.search('Бўғим')[0], 'joint')
+
+    def test_results_ranked_by_field_tier(self):
+        self.assertEqual(self.index.search("bog'im"), ['joint', 'vitamin', 'tea'])
+
+    def test_every_word_must_match(self):
+        self.assertEqual(self.index.search('vitamin foydali'), ['vitamin'])
+        self.assertEqual(self.index.search('vitamin yurak'), [])
+
+    def test_substring_and_short_prefix(self):
+        self.assertEqual(self.index.search('ardi'), ['heart'])
+        self.assertEqual(self.index.search('ch'), ['tea'])
+
+    def test_catalog_changes_update_index(self):
+        self.index.on_catalog_change('heart', None)
+        self.assertEqual(self.index.search('kardio'), [])
+        self.index.on_catalog_change('heart', Medicine(id='heart', name='Kardiomagnil'))
+        self.assertEqual(self.index.search('кардиомагнил'), ['heart'])
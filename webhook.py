@@ -0,0 +1,95 @@
+import asyncio
+import logging
+import os
+import signal
+import time
+from typing import Any, Callable, Dict, Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+from scheduler import UpdateScheduler
+
+logger = logging.getLogger(__name__)
+
+# Public HTTPS base URL Telegram should call, e.g. https://example.com
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/webhook')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET') or None
+WEBAPP_HOST = os.getenv('WEBAPP_HOST', '0.0.0.0')
+WEBAPP_PORT = int(os.getenv('PORT', os.getenv('WEBAPP_PORT', '8080')))
+# Parallel HTTPS connections Telegram may open to the webhook (1-100)
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv('WEBHOOK_MAX_CONNECTIONS', '40'))
+
+
+def build_app(dp: Dispatcher, bot: Bot, limiter: Optional[UpdateScheduler] = None,
+              register_webhook: bool = True,
+              metrics: Optional[Dict[str, Callable[[], Any]]] = None) -> web.Application:
+    """aiohttp application serving the webhook and a /healthz endpoint"""
+    app = web.Application()
+    started = time.monotonic()
+
+    async def health(request: web.Request) -> web.Response:
+        body = {
+            'status': 'ok',
+            'uptime': round(time.monotonic() - started, 1),
+            'in_flight': limiter.in_flight if limiter else None,
+            'waiting': limiter.waiting if limiter else None,
+        }
+        for name, collect in (metrics or {}).items():
+            body[name] = collect()
+        return web.json_response(body)
+
+    app.router.add_get('/healthz', health)
+    SimpleRequestHandler(
+        dispatcher=dp, bot=bot, secret_token=WEBHOOK_SECRET, handle_in_background=True
+    ).register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+
+    if register_webhook:
+        async def set_webhook(app: web.Application) -> None:
+            # Pending updates are kept: anything sent while the bot was down is delivered now
+            await bot.set_webhook(
+                url=WEBHOOK_URL.rstrip('/') + WEBHOOK_PATH,
+                secret_token=WEBHOOK_SECRET,
+                max_connections=WEBHOOK_MAX_CONNECTIONS,
+                allowed_updates=dp.resolve_used_update_types(),
+                drop_pending_updates=False,
+            )
+            logger.info("Webhook set to %s%s", WEBHOOK_URL.rstrip('/'), WEBHOOK_PATH)
+
+        app.on_startup.append(set_webhook)
+    return app
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot, scheduler: Optional[UpdateScheduler] = None,
+                      metrics: Optional[Dict[str, Callable[[], Any]]] = None) -> None:
+    """Serve updates over HTTP until SIGINT/SIGTERM; ``metrics`` are added to /healthz.
+
+    ``scheduler`` is the UpdateScheduler already registered on ``dp``; one is
+    created and registered when it is not given.
+    """
+    if not WEBHOOK_URL:
+        raise RuntimeError("WEBHOOK_URL must be set for webhook mode")
+
+    if scheduler is None:
+        scheduler = UpdateScheduler()
+        dp.update.outer_middleware(scheduler)
+    runner = web.AppRunner(build_app(dp, bot, scheduler, metrics=metrics))
+    await runner.setup()
+    site = web.TCPSite(runner, WEBAPP_HOST, WEBAPP_PORT)
+    await site.start()
+    logger.info("Webhook server listening on %s:%s", WEBAPP_HOST, WEBAPP_PORT)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:  # Windows
+            pass
+    try:
+        await stop.wait()
+    finally:
+        await runner.cleanup()